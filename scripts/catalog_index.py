@@ -0,0 +1,108 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# binary index of a local catalog, $defname.files[.$fileset].idx , to find files by (run, subrun)
+# without reading the text catalog. Written by dataset_catalog.write together with the catalog
+#
+# layout (little endian):
+#
+# header : magic 'GRIMIDX1', number of records N                    (8s Q)
+# records: N x (run, subrun, path offset, path length), sorted by (run, subrun)  (I I Q I)
+# paths  : path strings, utf-8, not separated
+#
+# the file is memory-mapped, a lookup is a binary search over the fixed-size records,
+# only the pages touched by the search are read
+#------------------------------------------------------------------------------
+
+import os, mmap, struct
+
+Magic  = b'GRIMIDX1'
+Header = struct.Struct('<8sQ')
+Record = struct.Struct('<IIQI')
+
+def index_name(files_fn):
+    return files_fn+'.idx';
+
+#------------------------------------------------------------------------------
+# entries: dataset_catalog.Entry's, files with unknown run or subrun are not indexed
+#------------------------------------------------------------------------------
+def write_index(files_fn,entries):
+    items = sorted([(e.first_run,e.first_subrun,e.path.encode()) for e in entries
+                    if ((e.first_run != None) and (e.first_subrun != None))])
+
+    records = bytearray()
+    paths   = bytearray()
+    offset  = Header.size+Record.size*len(items)
+    for run, subrun, path in items:
+        records += Record.pack(run,subrun,offset+len(paths),len(path))
+        paths   += path
+
+    fn     = index_name(files_fn)
+    fn_new = fn+'.tmp'
+    f      = open(fn_new,'wb')
+    f.write(Header.pack(Magic,len(items)))
+    f.write(records)
+    f.write(paths)
+    f.close()
+    os.replace(fn_new,fn)
+
+#------------------------------------------------------------------------------
+class CatalogIndex:
+    def __init__(self, files_fn):
+        self.fFn   = index_name(files_fn)
+        self.fFile = open(self.fFn,'rb')
+        self.fMap  = mmap.mmap(self.fFile.fileno(),0,access=mmap.ACCESS_READ)
+
+        magic, self.fN = Header.unpack_from(self.fMap,0)
+        if (magic != Magic):
+            self.close()
+            raise ValueError('CatalogIndex: '+self.fFn+' is not a catalog index')
+
+    def close(self):
+        self.fMap.close()
+        self.fFile.close()
+
+    def __len__(self):
+        return self.fN;
+
+    def key(self,i):
+        run, subrun, offset, length = Record.unpack_from(self.fMap,Header.size+Record.size*i)
+        return (run,subrun);
+
+    def path(self,i):
+        run, subrun, offset, length = Record.unpack_from(self.fMap,Header.size+Record.size*i)
+        return self.fMap[offset:offset+length].decode();
+
+#------------------------------------------------------------------------------
+# index of the first record with key >= (run, subrun)
+#------------------------------------------------------------------------------
+    def lower_bound(self,run,subrun):
+        lo, hi = 0, self.fN
+        while (lo < hi):
+            mid = (lo+hi)//2
+            if (self.key(mid) < (run,subrun)): lo = mid+1
+            else                             : hi = mid
+        return lo;
+
+#------------------------------------------------------------------------------
+# paths of the files with run=run and first_subrun <= subrun <= last_subrun
+#------------------------------------------------------------------------------
+    def paths(self,run,first_subrun,last_subrun=None):
+        if (last_subrun == None): last_subrun = first_subrun
+        res = []
+        i   = self.lower_bound(run,first_subrun)
+        while ((i < self.fN) and (self.key(i) <= (run,last_subrun))):
+            res.append(self.path(i))
+            i += 1
+        return res;
+
+#------------------------------------------------------------------------------
+# same for all runs: jump from one run to the next
+#------------------------------------------------------------------------------
+    def subrun_range(self,first_subrun,last_subrun):
+        res = []
+        i   = 0
+        while (i < self.fN):
+            run, subrun = self.key(i)
+            res.extend(self.paths(run,first_subrun,last_subrun))
+            i = self.lower_bound(run+1,0)
+        return res;
@@ -1,13 +1,48 @@
 #!/usr/bin/env python
 # interface to Andrei's generate_fcl
-# call: grim/scripts/check_completed_job.py --project=su2020 --grid_id=11122234
+# call: grim/scripts/check_completed_job.py --project=su2020 --grid_id=11122234[,11122235,...] [--force]
+#
+# --force        : re-examine all segments, by default only the segments which were missing or failed
+#                  during the previous check, or which log files have changed since, are re-examined
+# --deep-check=1 : in addition, check that the output files are not empty, that their .art.json metadata
+#                  exist and can be parsed, and that the number of events is what is expected.
+#                  per-segment file sizes and event counts are recorded in tmp/$project/segment_status
+# --nthreads=N   : number of segments checked in parallel, default: 8
+# --njobs=N      : number of grid jobs checked concurrently, default: 4. The output is printed grouped
+#                  by grid ID, followed by a summary table
+# --recovery-tarball=1 : write FCLs of the segments to be resubmitted directly into the recovery FCL tarball,
+#                  tmp/$project/fcl/cnf.$user.$dsid.$stage_$job.$project.$grid_id.fcl.tbz , and copy it 
+#                  to the PNFS fcl area. No need to run 'gen_fcl.py --recover' after that
+# --harvest=1    : extract per-segment resource usage (wall/CPU time, memory, N(events), host) from the logs,
+#                  store it in tmp/$project/resources/$grid_id.cols, see log_harvester.py
 #-------------------------------------------------------------------------------------------------
 
 import configparser, subprocess, shutil, json
 import sys, string, getopt, glob, os, time, re, array, copy
+import concurrent.futures, threading, traceback
 
-import grid_job
+import grid_job, segment_status, failure_classifier, retry_policy, fcl_tarball, log_harvester
+import outstage_manifest
 
+#------------------------------------------------------------------------------
+# stdout replacement: a thread with a buffer assigned writes into the buffer, 
+# the rest - to the original stdout
+#------------------------------------------------------------------------------
+_output = threading.local()
+
+class ThreadOutput:
+    def __init__(self, stdout):
+        self.fStdout = stdout
+
+    def write(self,s):
+        buf = getattr(_output,'buffer',None)
+        if (buf == None): self.fStdout.write(s)
+        else            : buf.append(s)
+
+    def flush(self):
+        self.fStdout.flush()
+
+#------------------------------------------------------------------------------
 class JobStatus:
     def __init__(self):
         self.fNSegments = None; 
@@ -41,6 +76,25 @@ class Tool:
 
         self.fUseRunningDir = 1
         self.fOutputCheck   = 1
+        self.fForce         = None       # if set, ignore cached segment verdicts
+        self.fDeepCheck     = 0
+        self.fNThreads      = 8
+        self.fNJobs         = 4          # number of grid jobs checked concurrently
+        self.fSummary       = None
+        self.fRecoveryTarball = 0
+        self.fHarvest       = 0
+        self.fFclData       = {}         # FCL name -> content, if FCLs come from a tarball
+        self.fFclTarball    = None       # tarball to read the FCLs from, when needed
+        self.fSegmentOutputs = []        # per segment, output file names from the FCL tarball manifest
+        self.fFclTarballDir = '/pnfs/mu2e/scratch/users/'+os.getenv('USER')+'/fcl';
+
+        self.fOwner         = os.getenv('USER');
+        if (self.fOwner == 'mu2epro'): self.fOwner = 'mu2e';
+        self.fSegmentStatus = None
+        self.fClassifier    = None
+        self.fRetryPolicy   = None
+        self.fPrevAttempts  = {}         # FCL name -> number of attempts in the previous jobs
+        self.fManifest      = None       # listing of the grid job output directory
 
 #------------------------------------------------------------------------------
 # assume that the script runs in an area with .grid_config in it
@@ -50,6 +104,36 @@ class Tool:
         fcl_dir = os.getcwd()+'/tmp/'+self.fProject+'/fcl/'+job.input_dsid()+'.'+self.fGridJob.stage()+'_'+job.name();
         return fcl_dir
 
+#------------------------------------------------------------------------------
+# local copy of the FCL tarball of the recovery job, the same name gen_fcl.py --recover uses
+#------------------------------------------------------------------------------
+    def recovery_tarball(self,job,grid_id):
+        fcltop = os.getcwd()+'/tmp/'+self.fProject+'/fcl'
+        return fcltop+'/cnf.'+self.fOwner+'.'+job.input_dsid()+'.'+self.fGridJob.stage()+'_'+job.name()+'.'+self.fProject+'.'+grid_id+'.fcl.tbz'
+
+#------------------------------------------------------------------------------
+# local copy of the FCL tarball of the grid job, named the same way as in gen_fcl.py and submit_job.py
+#------------------------------------------------------------------------------
+    def fcl_tarball(self,job):
+        if (self.fGridJob.recover()): return self.recovery_tarball(job,self.fGridJob.recover())
+
+        fcltop = os.getcwd()+'/tmp/'+self.fProject+'/fcl'
+        bn     = 'cnf.'+self.fOwner+'.'+job.input_dsid()+'.'+self.fGridJob.stage()+'_'+job.name()+'.'+self.fProject
+        if (self.fFileset): bn = bn+'.'+self.fFileset
+        return fcltop+'/'+bn+'.fcl.tbz'
+
+#------------------------------------------------------------------------------
+# the tarball is read only when the content of one of its FCLs is needed for the first time
+#------------------------------------------------------------------------------
+    def fcl_content(self,segment_fcl):
+        bn = os.path.basename(segment_fcl)
+        if ((bn not in self.fFclData) and self.fFclTarball):
+            for fcl_name, data in fcl_tarball.read_tarball(self.fFclTarball):
+                self.fFclData[os.path.basename(fcl_name)] = data
+            self.fFclTarball = None
+        if (bn in self.fFclData): return self.fFclData[bn]
+        return open(segment_fcl,'rb').read()
+
 # ---------------------------------------------------------------------
     def Print(self,Name,level,Message):
         if(level>self.fVerbose): return 0;
@@ -80,7 +164,13 @@ class Tool:
                                            'grid_id='        , 
                                            'rename='          ,
                                            'output-check='   ,
-                                           'use-running-dir='
+                                           'use-running-dir=',
+                                           'deep-check='     ,
+                                           'nthreads='       ,
+                                           'njobs='          ,
+                                           'recovery-tarball=',
+                                           'harvest='        ,
+                                           'force'
                                        ] )
  
         except getopt.GetoptError:
@@ -102,6 +192,18 @@ class Tool:
                 self.fRename = val
             elif key == '--output-check':
                 self.fOutputCheck = int(val)
+            elif key == '--force':
+                self.fForce = 1
+            elif key == '--deep-check':
+                self.fDeepCheck = int(val)
+            elif key == '--nthreads':
+                self.fNThreads = int(val)
+            elif key == '--njobs':
+                self.fNJobs = int(val)
+            elif key == '--recovery-tarball':
+                self.fRecoveryTarball = int(val)
+            elif key == '--harvest':
+                self.fHarvest = int(val)
             elif key == '--verbose':
                 self.fVerbose = int(val)
 
@@ -150,23 +252,31 @@ class Tool:
 
         self.fProjectDir = self.fProject+'/datasets/'+self.fFamilyID;
 
-        sys.path.append(self.fProject+'/datasets/mixing') ; 
-        sys.path.append(self.fProjectDir) ; 
-
         self.Print(name,1,'ProjectDir   = %s' % self.fProjectDir  )
 
-        import init_project
         #------------------------------------------------------------------------------
-        # read project config file
+        # read project config file, shared by all jobs of the same family.
+        # only fGridID and fNSegments of the job are redefined, a shallow copy is enough
         #------------------------------------------------------------------------------
-        self.fConfig         = init_project.Project(); 
+        self.fConfig         = grid_job.project_config(self.fProject,self.fProjectDir); 
 
         self.fStage          = self.fConfig.fStage[self.fStageName];
-        self.fJob            = copy.deepcopy(self.fStage.job(self.fDsid,self.fJType));
+        self.fJob            = copy.copy(self.fStage.job(self.fDsid,self.fJType));
         self.fJob.fGridID    = gridID;
 
         self.fJob.fNSegments = self.fGridJob.n_segments()  # could be a recovery job
 
+        self.fSegmentStatus  = segment_status.SegmentStatus('tmp/'+self.fProject+'/segment_status/'+gridID);
+        self.fClassifier     = failure_classifier.FailureClassifier(self.fProject+'/failure_signatures');
+        self.fRetryPolicy    = retry_policy.RetryPolicy(self.fJob.fRetryPolicy);
+        #------------------------------------------------------------------------------
+        # for a recovery job, the number of attempts is counted starting from the job being recovered
+        #------------------------------------------------------------------------------
+        self.fPrevAttempts   = {}
+        if (self.fGridJob.recover()):
+            prev = segment_status.SegmentStatus('tmp/'+self.fProject+'/segment_status/'+self.fGridJob.recover());
+            self.fPrevAttempts = prev.attempts();
+
         projectName          = self.fProject;
         dsid                 = self.fDsid;
         
@@ -181,13 +291,14 @@ class Tool:
 #------------------------------------------------------------------------------
 # segment_dir : output directory of the failed segment
 # job         :
-# next_fcl_dir: destination for the failed segment FCL files
+# next_fcl_dir: destination for the failed segment FCL files, either the input directory 
+#               of the recovery job or the quarantine directory
 # fcl_file    : file to be copied
 #------------------------------------------------------------------------------
     def handle_failed_segment(self,segment_dir,job,next_fcl_dir,segment_fcl):
 
         # name sure the directory exists
-        if (not os.path.exists(next_fcl_dir)): 
+        if (next_fcl_dir and (not os.path.exists(next_fcl_dir))): 
             os.makedirs(next_fcl_dir,exist_ok=True);
 
         if (self.fRename != 'yes') :
@@ -195,23 +306,288 @@ class Tool:
             ns = len(job.fOutputStream)
             for i in range(0,ns):
                 for ext in job.fOutputFormat[i].split(':'):
-                    list = glob.glob(segment_dir+'/*.'+ext)
+                    key  = os.path.relpath(segment_dir,self.fManifest.fTopDir)
+                    list = self.fManifest.files(key,'*.'+ext)
                     for fn in list:
                         shutil.move(fn,fn+'.save')
 
         # copy fcl file of the failed segment to the destination to be tarred up for the recovery job
         if (next_fcl_dir):
-            dst = next_fcl_dir+'/'+os.path.basename(segment_fcl);
-            shutil.copyfile(segment_fcl, dst)
+            bn  = os.path.basename(segment_fcl)
+            dst = next_fcl_dir+'/'+bn;
+            if ((bn in self.fFclData) or self.fFclTarball):
+                f = open(dst,'wb')
+                f.write(self.fcl_content(segment_fcl))
+                f.close()
+            else:
+                shutil.copyfile(segment_fcl, dst)
+
+#------------------------------------------------------------------------------
+# a repeated check may find a segment OK or change the decision on it
+# remove copies of its FCL left by the previous checks
+#------------------------------------------------------------------------------
+    def remove_stale_fcl(self,fcl_bn,dirs):
+        for d in dirs:
+            fn = d+'/'+fcl_bn
+            if (os.path.exists(fn)): os.remove(fn)
+
+#------------------------------------------------------------------------------
+# number of events expected in the output of one segment, None if not known in advance
+# (jobs reading input datasets may filter events)
+#------------------------------------------------------------------------------
+    def expected_nevents(self,job):
+        if (job.input_dataset().defname() == 'generator') or (job.fResample != 'no'):
+            return job.fNEventsPerSegment
+        return None
+
+#------------------------------------------------------------------------------
+# dataset IDs of the output streams which should have exactly the expected number of events,
+# by default, only the first (unfiltered) one. The other streams may be filtered
+#------------------------------------------------------------------------------
+    def exact_nevents_dsids(self,job):
+        streams = job.fExactEventCount if (job.fExactEventCount != None) else [0]
+        return [job.fOutputDsID[s] for s in streams if (s < len(job.fOutputDsID))];
+
+#------------------------------------------------------------------------------
+# check output files of a segment:
+# - files should not be empty
+# - .art files should have .art.json metadata files which could be parsed
+# - event_count in the metadata should be equal to the expected number of events for the streams
+#   listed in job.fExactEventCount, and not exceed it for the other ones
+# returns per-file sizes and event counts, the failure cause and the list of errors
+#------------------------------------------------------------------------------
+    def deep_check(self,files,job):
+        outputs  = {}
+        errors   = []
+        cause    = None
+        expected = self.expected_nevents(job)
+        exact    = self.exact_nevents_dsids(job)
+
+        for fn in files:
+            bn = os.path.basename(fn)
+            r  = {'size':None, 'nevents':None}
+            outputs[bn] = r
+
+            try:
+                r['size'] = os.stat(fn).st_size
+            except OSError as e:
+                errors.append('%s : %s'%(bn,e.strerror))
+                cause = failure_classifier.kBadOutputFile
+                continue
+
+            if (r['size'] == 0):
+                errors.append('%s : empty file'%bn)
+                cause = failure_classifier.kBadOutputFile
+                continue
+
+            if (not fn.endswith('.art')): continue
+
+            try:
+                metadata = json.loads(open(fn+'.json').read())
+            except (OSError,ValueError):
+                errors.append('%s : missing or corrupted .art.json metadata'%bn)
+                cause = failure_classifier.kBadOutputFile
+                continue
+
+            r['nevents'] = metadata.get('event_count')
+
+            if (expected == None): continue
+
+            nevents = r['nevents']
+            if (len([d for d in exact if (d in bn)]) > 0):
+                if (nevents != expected):
+                    errors.append('%s : event_count=%s, expected %i'%(bn,nevents,expected))
+                    if (cause == None): cause = failure_classifier.kEventCount
+            elif ((nevents == None) or (nevents > expected)):
+                errors.append('%s : event_count=%s, expected <= %i'%(bn,nevents,expected))
+                if (cause == None): cause = failure_classifier.kEventCount
+
+        return outputs, cause, errors;
+
+#------------------------------------------------------------------------------
+# check one segment, record and return its verdict
+# i  : segment number
+# dd : segment output directory
+# the directory listing comes from the manifest, the log file is the only file read
+#------------------------------------------------------------------------------
+    def check_segment(self,i,dd,job):
+        name = 'check_segment'
+
+        ss  = self.fSegmentStatus;
+        key = '00/%05i'%i
+
+        if (not self.fManifest.has_segment(key)):
+            return ss.set_verdict(i,segment_status.kSegmentMissing,None,'GRID output directory doesn\'t exist',
+                                  failure_classifier.kNoOutputDir)
+
+        #------------------------------------------------------------------------------
+        # directory exists, look at the log file
+        logs = self.fManifest.files(key,'*.log')
+        if (len(logs) != 1):
+            return ss.set_verdict(i,segment_status.kSegmentFailed,None,'ERROR: no log file',
+                                  failure_classifier.kNoLogFile)
+
+        #------------------------------------------------------------------------------
+        # this is what one expects - one log file per segment subdirectory.
+        # read it once, the same text is used to classify the failure, if any
+        # 1. check ART return code
+
+        logfile = logs[0]
+        self.Print(name,1,'reading %s'%logfile)
+        text    = open(logfile,errors='replace').read()
+
+        v = self.check_log(i,key,logfile,text,job)
+        if (self.fHarvest): v['resources'] = log_harvester.parse_log(text)
+        return v
+
+#------------------------------------------------------------------------------
+# check return codes in the log text and the segment output files
+#------------------------------------------------------------------------------
+    def check_log(self,i,key,logfile,text,job):
+        name = 'check_log'
+
+        ss = self.fSegmentStatus;
+        fc = self.fClassifier;
+
+        m = re.search(r'Art has completed.*',text)
+        if (m == None):
+            return ss.set_verdict(i,segment_status.kSegmentFailed,logfile,'ERROR: no art return code',
+                                  fc.classify(text))
+        #------------------------------------------------------------------------------
+        # art return code present , analyze it
+        self.Print(name,1,'output:%s'%m.group(0))
+        split_out=m.group(0).split();
+        rc  = split_out[8].strip('.');
+        if (rc != '0'):
+            return ss.set_verdict(i,segment_status.kSegmentFailed,logfile,'art ERROR rc = '+rc,
+                                  fc.classify(text))
+
+        #------------------------------------------------------------------------------
+        # 2. check MU2EGRID return code
+
+        m = re.search(r'mu2egrid exit status.*',text)
+        if (m == None):
+            return ss.set_verdict(i,segment_status.kSegmentFailed,logfile,'ERROR: no mu2eprodsys return code',
+                                  fc.classify(text))
+
+        self.Print(name,1,'grep mu2egrid output:%s'%m.group(0))
+        rc = m.group(0).split()[3]
+        if (rc != '0'):
+            return ss.set_verdict(i,segment_status.kSegmentFailed,logfile,'ERROR: mu2eprodsys return code not 0',
+                                  fc.classify(text))
+        #------------------------------------------------------------------------------
+        # mu2egrid return code = 0
+        # seemingly, success. need to check for presence of all output files though
+        #------------------------------------------------------------------------------
+        errors = []
+        files  = []
+
+        if (self.fOutputCheck != 0):
+            nos = len(job.fOutputStream)        # number of output streams
+            for stream in range(0,nos):
+                odsid    = job.fOutputDsID[stream]
+                oformats = job.fOutputFormat[stream].split(':')
+                for ext in oformats:
+                    flist = self.fManifest.files(key,'*'+odsid+'*.'+ext)
+                    nf = len(flist)
+                    if (nf != 1):
+                        msg      = 'wrong number of files for stream %s : %i'%(odsid,nf)
+                        # name of the expected file, from the FCL tarball manifest
+                        expected = self.fSegmentOutputs[i] if (i < len(self.fSegmentOutputs)) else []
+                        expected = [x for x in expected if ((odsid in x) and x.endswith('.'+ext))]
+                        if (expected): msg = msg+', expected: '+' '.join(expected)
+                        errors.append(msg)
+                    files.extend(flist)
+
+        if (len(errors) > 0):
+            return ss.set_verdict(i,segment_status.kSegmentFailed,logfile,'ERROR: '+'; '.join(errors),
+                                  failure_classifier.kOutputFiles)
+
+        outputs = None
+        if (self.fDeepCheck):
+            outputs, cause, errors = self.deep_check(files,job)
+            if (len(errors) > 0):
+                v = ss.set_verdict(i,segment_status.kSegmentFailed,logfile,'ERROR: '+'; '.join(errors),cause)
+                v['outputs'] = outputs
+                return v
+
+        v = ss.set_verdict(i,segment_status.kSegmentOk,logfile)
+        v['output_check'] = self.fOutputCheck
+        if (self.fOutputCheck != 0):
+            # sizes of the output files, a cached verdict is not reused once any of them has changed
+            names      = set([os.path.basename(fn) for fn in files])
+            v['files'] = {os.path.basename(fn):size for fn, size, mtime, k in self.fManifest.segment_files(key)
+                          if os.path.basename(fn) in names}
+        if (self.fDeepCheck):
+            v['deep'   ] = 1
+            v['outputs'] = outputs
+        return v
+
+#------------------------------------------------------------------------------
+# write FCLs of the segments to be resubmitted into the recovery tarball, and copy it to PNFS
+# the tarball is built in memory and written once to each location, together with its manifest
+#------------------------------------------------------------------------------
+    def write_recovery_tarball(self,job,recovery_fcls):
+        name = 'write_recovery_tarball'
+
+        tarball     = self.recovery_tarball(job,job.grid_id())
+        tar_on_pnfs = self.fFclTarballDir+'/'+self.fProject+'/'+os.path.basename(tarball)
+
+        if (len(recovery_fcls) == 0):
+            # a recovery tarball left by one of the previous checks is no longer valid
+            for fn in [tarball, tar_on_pnfs]:
+                if (os.path.exists(fn)):
+                    print('WARNING: no segments to resubmit, removing '+fn)
+                    fcl_tarball.remove_tarball(fn)
+            return 0
+
+        if (not os.path.exists(os.path.dirname(tarball))):
+            os.makedirs(os.path.dirname(tarball),exist_ok=True)
+
+        if (os.path.exists(tar_on_pnfs)):
+            print('WARNING: '+tar_on_pnfs+' already exists, OVERWRITING !')
+
+        manifest = fcl_tarball.write_tarball([tarball,tar_on_pnfs],recovery_fcls)
+
+        self.Print(name,0,'recovery tarball: %s , nsegments: %i'%(tar_on_pnfs,manifest['nsegments']))
+        return 0
+
+#------------------------------------------------------------------------------
+# resource usage of all segments with the logs harvested, written as one table per grid job.
+# the job settings are stored in the table header, the usage could be compared to them later
+#------------------------------------------------------------------------------
+    def write_resources(self,job,nseg):
+        name = 'write_resources'
+
+        rows = []
+        for i in range(0,nseg):
+            v = self.fSegmentStatus.verdict(i)
+            if ((v == None) or (v.get('resources') == None)): continue
+
+            r            = dict(v['resources'])
+            r['segment'] = i
+            r['ok'     ] = 1 if (v['status'] == segment_status.kSegmentOk) else 0
+            rows.append(r)
+
+        header = log_harvester.make_header(self.fGridJob,job)
+
+        fn = log_harvester.table_name(self.fProject,job.grid_id())
+        log_harvester.write_table(fn,rows,header)
+        self.Print(name,0,'resource usage of %i segments written to %s'%(len(rows),fn))
 
 #------------------------------------------------------------------------------
 # check status, job = JOB
+# verdicts of segments found OK by the previous check are reused unless --force is specified
 #------------------------------------------------------------------------------
     def check_completed_job(self,job):
         name = 'check_completed_job'
 
         grid_output_dir = job.grid_output_dir();
         print('grid_output_dir:',grid_output_dir)
+
+        self.fManifest  = outstage_manifest.OutstageManifest(self.fProject,job.grid_id(),grid_output_dir,self.fForce)
+        self.Print(name,1,'outstage manifest: %i segment directories, %i directories listed'%
+                   (len(self.fManifest.segments()),self.fManifest.fNListed))
         # assume that the directory with FCL files still exist
 
         base_dir = self.base_fcl_dir(job);
@@ -225,6 +601,35 @@ class Tool:
 
         fcl_list = glob.glob(fcl_dir+'/'+'*.fcl')
         fcl_list.sort();
+        #------------------------------------------------------------------------------
+        # the FCL tarball manifest written by gen_fcl.py (or by check_completed_job.py --recovery-tarball=1)
+        # lists the FCLs and the expected output files of each segment. The recovery tarball could've been 
+        # written by --recovery-tarball=1, in which case there is no local FCL directory. The tarball itself
+        # is read only if there is no manifest, or if the content of the FCLs is needed
+        #------------------------------------------------------------------------------
+        tarball  = self.fcl_tarball(job)
+        manifest = None
+        for fn in [tarball, self.fFclTarballDir+'/'+self.fProject+'/'+os.path.basename(tarball)]:
+            manifest = fcl_tarball.read_manifest(fn)
+            if (manifest):
+                tarball = fn
+                break
+
+        self.fFclData    = {}
+        self.fFclTarball = None
+        if (len(fcl_list) == 0):
+            if (manifest):
+                self.Print(name,1,'FCL list from %s'%fcl_tarball.manifest_name(tarball))
+                fcl_list         = [fcl_dir+'/'+bn for bn in manifest['fcl']]
+                self.fFclTarball = tarball
+            elif (os.path.exists(tarball)):
+                self.Print(name,0,'reading FCLs from %s'%tarball)
+                for fcl_name, data in fcl_tarball.read_tarball(tarball):
+                    self.fFclData[os.path.basename(fcl_name)] = data
+                fcl_list = [fcl_dir+'/'+bn for bn in sorted(self.fFclData.keys())]
+
+        outputs = manifest.get('outputs',{}) if manifest else {}
+        self.fSegmentOutputs = [outputs.get(os.path.basename(fn),[]) for fn in fcl_list]
         n1       = len(fcl_list)
         nseg     = self.fGridJob.n_segments();
 
@@ -232,99 +637,98 @@ class Tool:
             self.Print(name,0,'ERROR: n1(%i) != nseg(%i)'%(n1,nseg))
 
         # in case next recovery step is needed
-        next_fcl_dir = base_dir+'.'+job.grid_id();
+        next_fcl_dir   = base_dir+'.'+job.grid_id();
+        # FCLs of the segments which shouldn't be resubmitted
+        quarantine_dir = next_fcl_dir+'.quarantine';
 
         nsuccess = 0;
+        nreused  = 0;
+        causes   = [];
+        nretry      = 0;
+        nquarantine = 0;
+        recovery_fcls = [];
+        #------------------------------------------------------------------------------
+        # a segment found OK by one of the previous checks doesn't need to be re-examined,
+        # unless its log file has changed since
+        #------------------------------------------------------------------------------
+        to_check = []
         for i in range(0,nseg):
+            if (not self.fForce):
+                sizes = None
+                if (self.fOutputCheck != 0):
+                    sizes = {os.path.basename(fn):size for fn, size, mtime, k in self.fManifest.segment_files('00/%05i'%i)}
+                v = self.fSegmentStatus.good_verdict(i,self.fDeepCheck,self.fOutputCheck,sizes);
+                # with --harvest=1, a segment checked without harvesting its log is re-examined
+                if (v and ((not self.fHarvest) or ('resources' in v))):
+                    nsuccess = nsuccess+1;
+                    nreused  = nreused+1;
+                    if (self.fVerbose > 1):
+                        print('>> segment %5i: OK (cached)'%i)
+                    continue
+            to_check.append(i)
+        #------------------------------------------------------------------------------
+        # segments are checked in parallel, reading logs and stat'ing files on /pnfs is slow
+        #------------------------------------------------------------------------------
+        def check(i):
             dd = grid_output_dir+'/00/'+'%05i'%i
             self.Print(name,1,'dd   = %s' % dd)  # print('dd = ',dd)
-            if (not os.path.exists(dd)):
-                print('>> segment %5i: ERROR'%i,' GRID output directory doesn\'t exist, fcl: ',fcl_list[i])
-                if (next_fcl_dir):
+            return self.check_segment(i,dd,job);
 
-                    if (not os.path.exists(next_fcl_dir)): 
-                        os.makedirs(next_fcl_dir,exist_ok=True);
+        # worker threads write their output into the buffer of this job, if any
+        buf = getattr(_output,'buffer',None)
+        def init_thread():
+            _output.buffer = buf
 
-                    dst = next_fcl_dir+'/'+os.path.basename(fcl_list[i]);
-                    shutil.copyfile(fcl_list[i], dst)
-                continue
-            #------------------------------------------------------------------------------
-            # directory exists, look at the log file
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,self.fNThreads),initializer=init_thread) as pool:
+            verdicts = list(pool.map(check,to_check))
 
-            logs = glob.glob(dd+'/'+'*.log')
-            if (len(logs) != 1):
-                print('>> segment %5i: ERROR'%i,' no log file, fcl: ',fcl_list[i])
+        for i, v in zip(to_check,verdicts):
+            dd = grid_output_dir+'/00/'+'%05i'%i
 
-                self.handle_failed_segment(dd,job,next_fcl_dir,fcl_list[i])
-                continue;
+            fcl_bn       = os.path.basename(fcl_list[i]);
+            v['fcl'    ] = fcl_bn
+            v['attempt'] = self.fPrevAttempts.get(fcl_bn,0)+1
 
+            if (v['status'] == segment_status.kSegmentOk):
+                nsuccess = nsuccess+1;
+                if (self.fVerbose > 1):
+                    print('>> segment %5i: OK'%i)
+                self.remove_stale_fcl(fcl_bn,[next_fcl_dir,quarantine_dir])
+                continue
             #------------------------------------------------------------------------------
-            # this is what one expects - one log file per segment subdirectory. 
-            # 1. check ART return code
-
-            logfile = logs[0]
-            cmd = 'cat '+logfile+' | grep "Art has completed"'
-            self.Print(name,1,'executing cmd:%s'%cmd)
-            out=os.popen(cmd).readlines()
-            self.Print(name,1,'output:%s'%out)
-            if (len(out) == 0):
-                print('>> segment %5i: ERROR: no art return code'%i)
-                self.handle_failed_segment(dd,job,next_fcl_dir,fcl_list[i]);
-                continue;
+            # failed segment: the retry policy decides whether it goes to the recovery job
             #------------------------------------------------------------------------------
-            # art return code present , analyze it
-            split_out=out[0].split();
-            rc  = split_out[8].strip('.');
-            if (rc != '0'):
-                print('>> segment %5i: art ERROR'%i,' rc = ',rc,' fcl:',fcl_list[i])
-                self.handle_failed_segment(dd,job,next_fcl_dir,fcl_list[i]);
-                continue;
+            cause_class = self.fClassifier.failure_class(v['cause'])
+            v['action'] = self.fRetryPolicy.action(v['cause'],cause_class,v['attempt'])
 
-            #------------------------------------------------------------------------------
-            # 2. check MU2EGRID return code
-
-            cmd = 'cat '+logfile+' | grep "mu2egrid exit status" | awk \'{print $4}\''
-            self.Print(name,1,'executing cmd:%s'%cmd)
-            out=os.popen(cmd).readlines()
-            self.Print(name,1,'grep mu2egrid output:%s'%out)
-            if (len(out) == 0):
-                print('>> segment %5i: ERROR: no mu2eprodsys return code'%i)
-                self.handle_failed_segment(dd,job,next_fcl_dir,fcl_list[i]);
-                continue;
-            else:
-                rc = out[0].strip()
-                if (rc != '0'):
-                    print('>> segment %5i: ERROR: mu2eprodsys return code not 0'%i)
-                    self.handle_failed_segment(dd,job,next_fcl_dir,fcl_list[i]);
-                    continue;
-            #------------------------------------------------------------------------------
-            # mu2egrid return code = 0
+            if (v['action'] == retry_policy.kRetry): dst_dir = next_fcl_dir
+            else                                   : dst_dir = quarantine_dir
 
-            #------------------------------------------------------------------------------
-            # seemingly, success. need to check for presence of all output files though
-            #                        print('>> segment %5i:      '%i,' rc = ',rc)
-
-            error = 0
-
-            if (self.fOutputCheck != 0):
-                nos = len(job.fOutputStream)        # number of output streams
-                for stream in range(0,nos):
-                    odsid    = job.fOutputDsID[stream]
-                    oformats = job.fOutputFormat[stream].split(':')
-                    for ext in oformats:
-                        files = glob.glob(dd+'/*'+odsid+'*.'+ext)
-                        nf = len(files)
-                        if (nf != 1):
-                            print('>> segment %5i: ERROR'%i,' wrong number of files for stream ',odsid, ' : ',nf)
-                            error = error+1
-
-            if (error == 0):
-                nsuccess = nsuccess+1;
-                if (self.fVerbose > 1):
-                    print('>> segment %5i: OK'%i)
-            else:
-                self.handle_failed_segment(dd,job,next_fcl_dir,fcl_list[i]);
+            if ((dst_dir == next_fcl_dir) and self.fRecoveryTarball):
+                # no local copy, the FCL goes straight into the recovery tarball
+                recovery_fcls.append((fcl_bn,self.fcl_content(fcl_list[i])))
+                dst_dir = None
+
+            print('>> segment %5i: %s [%s] attempt %i %s, fcl: %s'%(i,v['error'],v['cause'],v['attempt'],
+                                                                   v['action'].upper(),fcl_list[i]))
+
+            self.handle_failed_segment(dd,job,dst_dir,fcl_list[i]);
+            # the decision of a previous check could have been different
+            if (v['action'] == retry_policy.kRetry): self.remove_stale_fcl(fcl_bn,[quarantine_dir])
+            else                                   : self.remove_stale_fcl(fcl_bn,[next_fcl_dir])
+
+            causes.append(v['cause'])
+            if (v['action'] == retry_policy.kRetry): nretry = nretry+1
+            else                                   : nquarantine = nquarantine+1
+
+        self.fSegmentStatus.write();
+        self.Print(name,1,'verdicts reused from the previous check: %i'%nreused)
 
+        if (self.fRecoveryTarball):
+            self.write_recovery_tarball(job,recovery_fcls)
+
+        if (self.fHarvest):
+            self.write_resources(job,nseg)
         #------------------------------------------------------------------------------
         # check completed, move status file to tmp/$project/completed
         #------------------------------------------------------------------------------
@@ -348,20 +752,121 @@ class Tool:
         # print('--------------------------------------');
         print('N(total  ): ',nseg);
         print('N(success): ',nsuccess);
+
+        if (len(causes) > 0):
+            self.fClassifier.print_histogram(causes)
+            print('N(retry     ): ',nretry);
+            print('N(quarantine): ',nquarantine,' FCLs in ',quarantine_dir);
+
+        self.fSummary = [self.fGridJob.id(), self.fDsid+'.'+self.fStageName+'_'+self.fJType,
+                         nseg, nsuccess, nretry, nquarantine]
+
+#------------------------------------------------------------------------------
+# check one chain of jobs, each next job recovers the previous one, so they go in order
+# output of each job is collected into its own buffer
+#------------------------------------------------------------------------------
+    def check_chain(self,chain,output,summary):
+
+        for grid_id in chain:
+            _output.buffer  = output[grid_id]
+            try:
+                t = copy.copy(self)
+                t.init(grid_id)
+                t.check_completed_job(t.fJob)
+                summary[grid_id] = t.fSummary
+            except Exception:
+                print(traceback.format_exc())
+                summary[grid_id] = [grid_id,'FAILED TO CHECK',0,0,0,0]
+            finally:
+                _output.buffer = None
+
+#------------------------------------------------------------------------------
+# check several grid jobs concurrently. A job recovering another job from the list is checked
+# after it, as it needs the verdicts and the FCLs of the job being recovered.
+# Each job has its own SegmentStatus, its segments are checked by several threads
+#------------------------------------------------------------------------------
+    def check_jobs(self,grid_ids):
+        name = 'check_jobs'
+
+        if (len(grid_ids) == 1):
+            self.init(grid_ids[0])
+            self.check_completed_job(self.fJob)
+            return 0
+
+        status_dir = 'tmp/'+self.fProject+'/grid_job_status';
+        if (self.fUseRunningDir == 0): status_dir = 'tmp/'+self.fProject+'/completed_jobs'
+
+        #------------------------------------------------------------------------------
+        # chains are built from the recover -> parent relation, independent of the order of the list:
+        # a job goes after the job it recovers, a job recovering none of the listed ones starts a chain
+        #------------------------------------------------------------------------------
+        parent   = {}
+        children = {}
+        for grid_id in grid_ids:
+            recover = json.loads(open(status_dir+'/'+grid_id).read()).get('recover')
+            parent[grid_id] = str(recover) if (recover != None) else None
+        for grid_id in grid_ids:
+            if (parent[grid_id] in parent): children.setdefault(parent[grid_id],[]).append(grid_id)
+
+        chains = []
+        done   = set()
+        for grid_id in grid_ids:
+            if ((parent[grid_id] in parent) or (grid_id in done)): continue
+            chain = []
+            todo  = [grid_id]
+            while (len(todo) > 0):
+                x = todo.pop(0)
+                if (x in done): continue
+                done.add(x)
+                chain.append(x)
+                todo.extend(children.get(x,[]))
+            chains.append(chain)
+        #------------------------------------------------------------------------------
+        # jobs recovering each other in a loop (shouldn't happen) are checked in the order of the list
+        #------------------------------------------------------------------------------
+        rest = [grid_id for grid_id in grid_ids if (grid_id not in done)]
+        if (len(rest) > 0): chains.append(rest)
+
+        self.Print(name,1,'chains: %s'%chains)
+
+        output  = {grid_id:[] for grid_id in grid_ids}
+        summary = {}
+
+        sys.stdout = ThreadOutput(sys.stdout)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,self.fNJobs)) as pool:
+                futures = [pool.submit(self.check_chain,chain,output,summary) for chain in chains]
+                concurrent.futures.wait(futures)
+        finally:
+            sys.stdout = sys.stdout.fStdout
+
+        for grid_id in grid_ids:
+            print('================================================================== grid_id: '+grid_id)
+            print(''.join(output[grid_id]),end='')
+
+        print('--------------------------------------------------------------------------------')
+        print('%-10s %-36s %6s %8s %6s %10s'%('grid_id','job','N(seg)','N(succ)','retry','quarantine'))
+        print('--------------------------------------------------------------------------------')
+        for grid_id in grid_ids:
+            print('%-10s %-36s %6i %8i %6i %10i'%tuple(summary[grid_id]))
+        print('--------------------------------------------------------------------------------')
+
+        return 0
+
 #------------------------------------------------------------------------------
 # main program, just make a GridSubmit instance and call its methods
-# assume that the initial job is listed first
+# jobs from the list are checked concurrently. If a job recovers another job from the list, 
+# it is checked after that job
 #------------------------------------------------------------------------------
 if (__name__ == '__main__'):
 
     x = Tool()
     x.ParseParameters()
 
-    for item in x.fGridJobID:
-        # allow full names 
-        grid_id = item.split('@')[0]
-        x.Print('main',1,'gridID::%s'%grid_id);
-        x.init(grid_id)
-        x.check_completed_job(x.fJob)
+    # allow full names 
+    grid_ids = [item.split('@')[0] for item in x.fGridJobID]
+    x.Print('main',1,'gridIDs::%s'%grid_ids);
+
+    x.check_jobs(grid_ids)
 
     sys.exit(0);
@@ -2,12 +2,18 @@
 #------------------------------------------------------------------------------
 # call: grim/scripts/copy_log_files.py --project=su2020 --grid_id=35469055[,xxxxxx,[yyy]]
 #       can specify a list of comma-separated grid ID's (need to go in the right order)
+#       [--nthreads=8] : number of files copied in parallel
+#       [--force=1]    : copy log files of the jobs marked as already copied
+#       [--archive=1]  : pack the log files into one archive per grid job, see log_archive.py
+#       [--dedup=1]    : store the log files deduplicated, see log_store.py
+#
+# files which have already been copied (same size and mtime) are skipped
 #------------------------------------------------------------------------------
 
-import subprocess, shutil, json, copy
+import subprocess, shutil, json, copy, concurrent.futures
 import sys, string, getopt, glob, os, time, re, array
 
-import grid_job
+import grid_job, outstage_manifest, segment_verdict, log_archive, log_store
 #------------------------------------------------------------------------------
 class CopyLogFiles:
 
@@ -19,6 +25,10 @@ class CopyLogFiles:
 
         self.fUser          = os.getenv('USER')
         self.fGridIDList    = None;
+        self.fNThreads      = 8
+        self.fForce         = None
+        self.fArchive       = None
+        self.fDedup         = None
 
         self.fOutputPath    = {}
         self.fOutputStreams = None
@@ -30,6 +40,7 @@ class CopyLogFiles:
         self.fGridJob       = None;
 
         self.fUseRunningDir = 1
+        self.fVerdicts      = None
 # ---------------------------------------------------------------------
     def Print(self,Name,level,Message):
         if(level>self.fVerbose): return 0;
@@ -54,7 +65,8 @@ class CopyLogFiles:
 
         try:
             optlist, args = getopt.getopt(sys.argv[1:], '',
-                                          ['project=', 'verbose=', 'grid_id=', 'use-running-dir='] )
+                                          ['project=', 'verbose=', 'grid_id=', 'use-running-dir=', 
+                                           'nthreads=', 'force=', 'archive=', 'dedup='] )
  
         except getopt.GetoptError:
             self.Print(name,0,'%s' % sys.argv)
@@ -71,6 +83,14 @@ class CopyLogFiles:
                 self.fGridIDList = val.split(',')
             elif key == '--use-running-dir':
                 self.fUseRunningDir = int(val)
+            elif key == '--nthreads':
+                self.fNThreads = int(val)
+            elif key == '--force':
+                self.fForce = int(val)
+            elif key == '--archive':
+                self.fArchive = int(val)
+            elif key == '--dedup':
+                self.fDedup = int(val)
             elif key == '--verbose':
                 self.fVerbose = int(val)
 
@@ -82,10 +102,27 @@ class CopyLogFiles:
 
 #------------------------------------------------------------------------------
 # check if segment completed successfuly, return: 0 if OK, non-zero if not OK
-# so far, a placeholder
+# key: segment directory in the manifest, '00/00012' . The verdict is shared
+# with check_completed_job.py, see segment_verdict.py
 #------------------------------------------------------------------------------
-    def check_segment(self,subdirectory):
-        return 0;
+    def check_segment(self,key):
+        return self.fVerdicts.check(key);
+
+#------------------------------------------------------------------------------
+# copy one file unless the destination has the same size and mtime, the mtime is preserved.
+# returns (number of files, number of bytes) copied
+#------------------------------------------------------------------------------
+    def copy_file(self,fn,size,mtime,dst):
+        try:
+            st = os.stat(dst)
+            if ((st.st_size == size) and (int(st.st_mtime) == int(mtime))): return 0, 0
+        except OSError:
+            pass
+
+        self.Print('copy_file',1,'fn, dst : %s %s'%(fn,dst))
+        shutil.copyfile(fn, dst)
+        os.utime(dst,(mtime,mtime))
+        return 1, size;
 
 #------------------------------------------------------------------------------
 # 'job': of grid_job.GridJob type 
@@ -107,40 +144,80 @@ class CopyLogFiles:
         # fcl file are no longer copied - they are source into the log files
         #------------------------------------------------------------------------------
         file_types = self.fFileTypes.split(',');
-        for ext in file_types:
-
-            # oodir = odir+'/'+ext;
-            oodir = odir;
-            if (not os.path.exists(oodir)): os.makedirs(oodir,exist_ok=True)
-
-            list_of_dirs = glob.glob(topdir+'/*')
-            list_of_dirs.sort()
-
-            self.Print(name,1,'list_of_dirs:%s'%format(list_of_dirs));
-
-            for sd1 in list_of_dirs:
-                print('sd1:',sd1)
-                ld1 = glob.glob(sd1+'/*')
-                ld1.sort()
-                for sd2 in ld1 :
-                    self.Print(name,1,'sd2=%s'%sd2);
-                    #------------------------------------------------------------------------------
-                    # skip subdirectories like 00148.915da673
-                    dbn = os.path.basename(sd2);
-                    if (len(dbn.split('.')) == 1) :
-                        # at this point, need to check whether the segment has completed successfully
-                        # do not copy files for failed segments
-                        # 'rc' is the return code, 0 if evethything is fine 
-                        rc = self.check_segment(sd2);
-                        if (rc == 0):
-                            for fn in glob.glob(sd2+'/*.'+ext) : 
-                                dst = oodir+'/'+os.path.basename(fn);
-                                self.Print(name,1,'fn, dst : %s %s'%(fn,dst))
-                                shutil.copyfile(fn, dst)
-                        else:
-                            print('skip failed segment , subdirectory:',sd2)
-                    else:
-                        print('in trouble: %s'%fn)
+
+        oodir = odir;
+        if (not os.path.exists(oodir)): os.makedirs(oodir,exist_ok=True)
+        #------------------------------------------------------------------------------
+        # the output directory is listed once, subdirectories like 00148.915da673 
+        # are not in the manifest
+        #------------------------------------------------------------------------------
+        manifest = outstage_manifest.OutstageManifest(self.fProject,job.id(),topdir)
+
+        self.Print(name,1,'segment directories:%s'%format(manifest.segments()));
+        #------------------------------------------------------------------------------
+        # at this point, need to check whether the segments have completed successfully
+        # do not copy files for failed segments. Verdicts cached by check_completed_job.py
+        # are reused, the rest are checked in parallel
+        #------------------------------------------------------------------------------
+        self.fVerdicts = segment_verdict.SegmentVerdicts(self.fProject,job.id(),manifest,self.fUseRunningDir)
+        verdicts       = self.fVerdicts.check_segments(manifest.segments(),self.fNThreads)
+        self.fVerdicts.write()
+
+        print('grid_id: %s N(segments): %i N(failed): %i verdicts N(cached): %i N(checked): %i'%
+              (job.id(),len(verdicts),len([rc for rc in verdicts.values() if rc != 0]),
+               self.fVerdicts.fNCached,self.fVerdicts.fNComputed))
+
+        files = []
+        for key in manifest.segments():
+            sd2 = manifest.segment_dir(key)
+            self.Print(name,1,'sd2=%s'%sd2);
+            # 'rc' is the return code, 0 if evethything is fine 
+            rc = verdicts[key]
+            if (rc != 0):
+                print('skip failed segment , subdirectory:',sd2)
+                continue
+
+            for ext in file_types:
+                files.extend([(fn,size,mtime,k) for fn, size, mtime, k in manifest.segment_files(key,'*.'+ext)])
+        #------------------------------------------------------------------------------
+        # copy in parallel, report the throughput
+        #------------------------------------------------------------------------------
+        # only the .log files go to the archive or to the dedup store,
+        # other files (fFileTypes='log,fcl') are copied as they are
+        #------------------------------------------------------------------------------
+        if (self.fArchive or self.fDedup):
+            logs  = [(k,fn,size,mtime) for fn, size, mtime, k in files if fn.endswith('.log')]
+            plain = [f for f in files if (not f[0].endswith('.log'))]
+        else:
+            logs  = []
+            plain = files
+
+        t0      = time.time()
+        ncopied = 0
+        nbytes  = 0
+        if (self.fArchive):
+            archive = log_archive.archive_name(oodir,job.id())
+            ncopied, nbytes = log_archive.add_files(archive,logs,self.fNThreads)
+            print('archive:',archive)
+        elif (self.fDedup):
+            store   = log_store.ChunkStore(log_store.store_dir(job))
+            recipe  = log_store.recipe_name(oodir,job.id())
+            ncopied, nbytes, nnew = log_store.add_files(store,recipe,logs,self.fNThreads)
+            print('dedup store: %s new unique bytes: %.3f MB dedup ratio: %.1f'%(store.fDir,nnew/1.e6,nbytes/max(nnew,1)))
+
+        if (len(plain) > 0):
+            if (self.fArchive or self.fDedup):
+                print('N(files other than .log, copied as they are): %i'%len(plain))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,self.fNThreads)) as pool:
+                res = list(pool.map(lambda f: self.copy_file(f[0],f[1],f[2],oodir+'/'+os.path.basename(f[0])),plain))
+
+            ncopied += sum([n for n, nb in res])
+            nbytes  += sum([nb for n, nb in res])
+        mb = nbytes/1.e6
+        dt = max(time.time()-t0,1.e-6)
+
+        print('grid_id: %s N(copied): %i N(skipped, unchanged): %i %.1f MB in %.1f s : %.1f files/s %.1f MB/s'%
+              (job.id(),ncopied,len(files)-ncopied,mb,dt,ncopied/dt,mb/dt))
         #------------------------------------------------------------------------------
         # done, update the job status
         #------------------------------------------------------------------------------
@@ -166,12 +243,9 @@ if (__name__ == '__main__'):
         job   = grid_job.GridJob(fn);
 
         doit = True;
-        if (job.fStatus & grid_job.kLogsCopiedBit):
-            # check if still want to proceed
-            print('>>> log files of job grid_id=',grid_id,' have already been copied, do you want to proceed ? [y/n]')
-            s = str(input())
-            if (s[0] != 'y'): 
-                doit = False;
+        if ((job.fStatus & grid_job.kLogsCopiedBit) and (not x.fForce)):
+            print('>>> log files of job grid_id=',grid_id,' have already been copied, skip it. Use --force=1 to copy again')
+            doit = False;
             
         if (doit): 
             x.copy_log_files(job)
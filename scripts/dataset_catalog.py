@@ -0,0 +1,261 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# local dataset catalogs with per-file metadata
+#
+# next to each $project/datasets/$family/catalog/$defname.files[.$fileset] list of files
+# there is a companion file, $defname.files[.$fileset].meta , one line per file:
+#
+# path  size  nevents  first_run  first_subrun  last_run  last_subrun  checksum
+#
+# unknown values are written as '-'. The .files list is generated from the .meta file
+# and is kept for generate_fcl, which reads plain lists of files.
+# The binary index, $defname.files[.$fileset].idx , is written at the same time, see catalog_index.py
+#
+# per-file metadata comes from the art.json files written by the grid jobs, if they are
+# missing, run and subrun are taken from the sequencer field of the file name
+# (like 001000_00000123). The checksum is the dCache adler32 checksum
+#------------------------------------------------------------------------------
+
+import os, re, json, zlib, heapq, collections
+
+import catalog_index
+
+Columns = ['path', 'size', 'nevents', 'first_run', 'first_subrun', 'last_run', 'last_subrun', 'checksum']
+
+Entry   = collections.namedtuple('Entry',Columns)
+
+def meta_name(files_fn):
+    return files_fn+'.meta';
+
+#------------------------------------------------------------------------------
+# (run, subrun) from a file name like sim.murat.bpip0b0s11r0000.su2020.001210_00000123.art
+#------------------------------------------------------------------------------
+def run_subrun(fn):
+    fields = os.path.basename(fn).split('.')
+    if (len(fields) < 5): return None, None
+    seq    = fields[4].split('_')
+    if ((len(seq) != 2) or (not seq[0].isdigit()) or (not seq[1].isdigit())): return None, None
+    return int(seq[0]), int(seq[1]);
+
+#------------------------------------------------------------------------------
+# dCache reports the checksum through a 'magic' file, .(get)(name)(checksum) , which
+# contains a line like 'ADLER32:0a1b2c3d'. If it can't be read, the checksum is not known:
+# reading a whole file from /pnfs is much too slow. Outside /pnfs, the checksum is computed
+# only if 'compute' is set
+#------------------------------------------------------------------------------
+def checksum(fn,compute=False):
+    dirname, basename = os.path.split(fn)
+    try:
+        s = open(os.path.join(dirname,'.(get)('+basename+')(checksum)')).read().strip()
+        for word in s.split():
+            if (word.lower().startswith('adler32:')): return word.split(':')[1].lower();
+    except OSError:
+        pass
+
+    if ((not compute) or os.path.abspath(fn).startswith('/pnfs/')): return None
+
+    try:
+        value = 1
+        with open(fn,'rb') as f:
+            while (True):
+                block = f.read(1<<20)
+                if (not block): break
+                value = zlib.adler32(block,value)
+        return '%08x'%value;
+    except OSError:
+        return None
+
+#------------------------------------------------------------------------------
+# metadata of one file. 'json_fn': art.json file with its metadata, if any
+# with_checksum: 0: no checksum, 1: checksum from dCache, 2: also compute it for the files not on /pnfs
+#------------------------------------------------------------------------------
+def make_entry(fn,size=None,json_fn=None,with_checksum=1):
+    nevents = None
+    r1, s1  = run_subrun(fn)
+    r2, s2  = r1, s1
+
+    if (json_fn):
+        try:
+            d       = json.loads(open(json_fn).read())
+            nevents = d.get('event_count')
+            r1      = d.get('rs.first_run'   ,r1)
+            s1      = d.get('rs.first_subrun',s1)
+            r2      = d.get('rs.last_run'    ,r2)
+            s2      = d.get('rs.last_subrun' ,s2)
+            if (size == None): size = d.get('file_size')
+        except (OSError,ValueError):
+            print('WARNING in dataset_catalog::make_entry : can\'t read '+json_fn)
+
+    if (size == None):
+        try:
+            size = os.stat(fn).st_size
+        except OSError:
+            pass
+
+    cs = checksum(fn,with_checksum > 1) if with_checksum else None
+
+    return Entry(fn,size,nevents,r1,s1,r2,s2,cs);
+
+#------------------------------------------------------------------------------
+# plain list of files, comment lines are skipped
+#------------------------------------------------------------------------------
+def read_files(files_fn):
+    res = []
+    for line in open(files_fn).read().splitlines():
+        line = line.strip()
+        if (line and (line[0] != '#')): res.append(line)
+    return res;
+
+def format_value(x):
+    if (x == None): return '-'
+    return str(x);
+
+#------------------------------------------------------------------------------
+# write the .meta file, the .files view and the index of the same catalog
+#------------------------------------------------------------------------------
+def write(files_fn,entries):
+    # the view goes first, so the .meta file is never older than it
+    write_files(files_fn,entries)
+
+    fn     = meta_name(files_fn)
+    fn_new = fn+'.tmp'
+    f      = open(fn_new,'w')
+    f.write('# '+' '.join(Columns)+'\n')
+    for e in entries:
+        f.write(' '.join([format_value(x) for x in e])+'\n')
+    f.close()
+    os.replace(fn_new,fn)
+
+    catalog_index.write_index(files_fn,entries)
+
+def write_files(files_fn,entries):
+    fn_new = files_fn+'.tmp'
+    f      = open(fn_new,'w')
+    for e in entries:
+        f.write(e.path+'\n');
+    f.close()
+    os.replace(fn_new,files_fn)
+
+#------------------------------------------------------------------------------
+# returns list of Entry's. If the .meta file doesn't exist, or is older than the .files list
+# (edited by hand), the entries are made from the .files list and have only run and subrun defined
+#------------------------------------------------------------------------------
+def load(files_fn):
+    fn = meta_name(files_fn)
+
+    if (os.path.exists(fn) and ((not os.path.exists(files_fn)) or
+                                (os.stat(fn).st_mtime >= os.stat(files_fn).st_mtime))):
+        res = []
+        for line in open(fn).read().splitlines():
+            if ((not line) or (line[0] == '#')): continue
+            w = line.split()
+            res.append(Entry(w[0],*[None if x == '-' else int(x) for x in w[1:7]],None if w[7] == '-' else w[7]))
+        return res;
+
+    res = []
+    for path in read_files(files_fn):
+        r, s = run_subrun(path)
+        res.append(Entry(path,None,None,r,s,r,s,None))
+    return res;
+
+#------------------------------------------------------------------------------
+# the index of a catalog, (re)built if it is missing or older than the catalog,
+# for example, if the .files list has been edited by hand
+#------------------------------------------------------------------------------
+def open_index(files_fn):
+    fn     = catalog_index.index_name(files_fn)
+    source = [x for x in [files_fn,meta_name(files_fn)] if os.path.exists(x)]
+    if ((not os.path.exists(fn)) or any([os.stat(x).st_mtime > os.stat(fn).st_mtime for x in source])):
+        catalog_index.write_index(files_fn,load(files_fn))
+
+    return catalog_index.CatalogIndex(files_fn);
+
+#------------------------------------------------------------------------------
+# totals, files with unknown values are not counted
+#------------------------------------------------------------------------------
+def total_size(entries):
+    return sum([e.size for e in entries if e.size != None]);
+
+def total_events(entries):
+    return sum([e.nevents for e in entries if e.nevents != None]);
+
+#------------------------------------------------------------------------------
+# grid ID of the job which produced a file, from a path like .../outstage/35469055/00/00012/...
+#------------------------------------------------------------------------------
+def grid_id(path):
+    parts = path.split('/')
+    for i in range(len(parts)-1):
+        if ((parts[i] == 'outstage') and parts[i+1].isdigit()): return int(parts[i+1])
+    return None
+
+#------------------------------------------------------------------------------
+# entries with the same (run, subrun) are duplicates, files with unknown subrun are identified by their paths
+#------------------------------------------------------------------------------
+def subrun_key(e):
+    if (e.first_subrun == None): return (1,e.path)
+    return (0,e.first_run or 0,e.first_subrun);
+
+def sort_entries(entries):
+    return sorted(entries,key=subrun_key);
+
+#------------------------------------------------------------------------------
+# merge 'new' entries into 'old' ones, for each subrun keep the file of the most recent grid job.
+# If grid IDs can't be compared, the new file wins
+# returns (entries sorted by subrun, report), report: 'added', 'replaced', 'skipped' -> lists of entries,
+# 'replaced' is a list of (old, new) pairs
+#------------------------------------------------------------------------------
+def merge(old,new):
+    report = {'added':[], 'replaced':[], 'skipped':[]}
+    res    = {}
+
+    def newer(e,f):
+        ge, gf = grid_id(e.path), grid_id(f.path)
+        if ((ge == None) or (gf == None)): return True
+        return (ge >= gf)
+
+    for e in old:
+        k = subrun_key(e)
+        if ((k not in res) or newer(e,res[k])): res[k] = e
+
+    paths = set([e.path for e in res.values()])
+    for e in new:
+        k = subrun_key(e)
+        if (e.path in paths):
+            res[k] = e                      # same file, keep the updated metadata
+            report['skipped'].append(e)
+        elif (k not in res):
+            res[k] = e
+            report['added'].append(e)
+        elif (newer(e,res[k])):
+            report['replaced'].append((res[k],e))
+            res[k] = e
+        else:
+            report['skipped'].append(e)
+        paths.add(e.path)
+
+    return sort_entries(res.values()), report;
+
+#------------------------------------------------------------------------------
+# '500GB', '2TB', '800MB', '1000000' (bytes) -> bytes
+#------------------------------------------------------------------------------
+def size_bytes(s):
+    m = re.match(r'^\s*([\d.]+)\s*(KB|MB|GB|TB|K|M|G|T)?\s*$',str(s))
+    if (m == None): return None
+    scale = {None:1, 'K':1.e3, 'M':1.e6, 'G':1.e9, 'T':1.e12}
+    return float(m.group(1))*scale[m.group(2)[0] if m.group(2) else None];
+
+#------------------------------------------------------------------------------
+# split entries into 'n' shards with (nearly) equal total weight: greedy bin packing,
+# the heaviest remaining file goes to the lightest shard.
+# returns list of shards, the entries of each shard are sorted by subrun
+#------------------------------------------------------------------------------
+def shard(entries,weight,n):
+    shards = [[] for i in range(n)]
+    heap   = [(0,i) for i in range(n)]
+
+    for e in sorted(entries,key=lambda e: (-weight(e),subrun_key(e))):
+        load, i = heapq.heappop(heap)
+        shards[i].append(e)
+        heapq.heappush(heap,(load+weight(e),i))
+
+    return [sort_entries(s) for s in shards];
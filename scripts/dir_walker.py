@@ -0,0 +1,138 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# concurrent directory listing for /pnfs trees
+#
+# readdir on dCache NFS mounts is latency-bound, so directories are listed by a pool of threads.
+# os.scandir is used, the file type comes from d_type without an extra stat call.
+# Both walk() and scan() are generators, the results are yielded as soon as a directory is listed,
+# in the order of completion
+#
+# 'rate' limits the number of directories visited per second by all threads together,
+# so the dCache doors are not overloaded
+#
+# defaults can be redefined per project in .grid_config :
+#
+# su2020.walk_threads   16
+# su2020.walk_rate      200
+#------------------------------------------------------------------------------
+
+import os, time, threading, concurrent.futures
+
+DefaultThreads = 8
+
+#------------------------------------------------------------------------------
+class RateLimiter:
+    def __init__(self, rate = None):
+        self.fRate = rate
+        self.fNext = 0
+        self.fLock = threading.Lock()
+
+    def wait(self):
+        if (not self.fRate): return
+        with self.fLock:
+            now        = time.time()
+            t          = max(now,self.fNext)
+            self.fNext = t+1./self.fRate
+        if (t > now): time.sleep(t-now)
+
+#------------------------------------------------------------------------------
+# returns (nthreads, rate) for a project from .grid_config
+#------------------------------------------------------------------------------
+def project_settings(project):
+    nthreads = DefaultThreads
+    rate     = None
+    if (os.path.exists('.grid_config')):
+        for line in open('.grid_config').readlines():
+            words = line.split()
+            if (len(words) < 2): continue
+            if   (words[0] == project+'.walk_threads'): nthreads = int(words[1])
+            elif (words[0] == project+'.walk_rate'   ): rate     = float(words[1])
+    return nthreads, rate;
+
+#------------------------------------------------------------------------------
+class DirWalker:
+    def __init__(self, nthreads = DefaultThreads, rate = None):
+        self.fNThreads = max(1,nthreads)
+        self.fLimiter  = RateLimiter(rate)
+        self.fNListed  = 0
+        self.fLock     = threading.Lock()
+
+    def scandir(self,path):
+        with self.fLock:
+            self.fNListed += 1
+        try:
+            with os.scandir(path) as it:
+                return list(it)
+        except OSError:
+            return []
+
+#------------------------------------------------------------------------------
+# runs 'func' on every item in parallel, yields (item, result) in the order of completion
+# 'func' may return more items to process as the second element of its result
+#------------------------------------------------------------------------------
+    def run(self,func,items):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.fNThreads) as pool:
+            pending = {pool.submit(func,item): item for item in items}
+            try:
+                while (len(pending) > 0):
+                    done, not_done = concurrent.futures.wait(pending,return_when=concurrent.futures.FIRST_COMPLETED)
+                    for f in done:
+                        item           = pending.pop(f)
+                        result, more   = f.result()
+                        for x in more:
+                            pending[pool.submit(func,x)] = x
+                        yield item, result
+            finally:
+                # the consumer stopped early
+                for f in pending: f.cancel()
+
+#------------------------------------------------------------------------------
+# walk the tree starting from 'top', yields (dirpath, depth, entries), entries are os.DirEntry's
+# max_depth: don't list directories deeper than that, the depth of 'top' is 0
+# descend  : function of os.DirEntry, if defined, a subdirectory is listed only if it returns True
+#------------------------------------------------------------------------------
+    def walk(self,top,max_depth=None,descend=None):
+
+        def list_dir(item):
+            path, depth = item
+            self.fLimiter.wait()
+            entries     = self.scandir(path)
+            more        = []
+            if ((max_depth == None) or (depth < max_depth)):
+                for e in entries:
+                    if (e.is_dir(follow_symlinks=False) and ((descend == None) or descend(e))):
+                        more.append((e.path,depth+1))
+            return entries, more
+
+        for (path, depth), entries in self.run(list_dir,[(top,0)]):
+            yield path, depth, entries
+
+#------------------------------------------------------------------------------
+# list directories with known paths, yields (path, mtime, files), files is a list of [name, size, mtime]
+# mtimes: path -> mtime the directory had when it was listed last time. If the mtime didn't change,
+#         the directory is not listed and 'files' is None
+# a directory which doesn't exist is yielded with mtime=None
+#------------------------------------------------------------------------------
+    def scan(self,paths,mtimes={}):
+
+        def scan_dir(path):
+            self.fLimiter.wait()
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                return (None,None), []
+
+            if (mtimes.get(path) == mtime): return (mtime,None), []
+
+            files = []
+            for e in self.scandir(path):
+                if (not e.is_file()): continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                files.append([e.name,st.st_size,st.st_mtime])
+            return (mtime,files), []
+
+        for path, (mtime, files) in self.run(scan_dir,paths):
+            yield path, mtime, files
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# classify failed grid segments by signatures found in their log files
+#
+# a signature is (name, class, regex), class is either 'transient' (resubmitting
+# the segment is likely to help) or 'deterministic' (it is not).
+# All signatures are compiled into one regular expression, so a log file is scanned once.
+# if a log matches several signatures, the one listed first wins
+#
+# every log also contains the expanded FCL of the job and the environment, the patterns should match
+# only the error output itself: art exception headers, G4Exception errors (not the 'WWWW' warnings) etc
+#
+# the default table can be extended/overridden by $project/failure_signatures ,
+# one signature per line, the regex is the rest of the line:
+#
+# # name              class          regex
+# dcache_door_down    transient      Connection refused.*fndca
+# bad_seed            deterministic  SeedService.*already used
+#
+# signatures defined by the user take precedence over the default ones with the same name
+#------------------------------------------------------------------------------
+
+import os, re
+
+kTransient     = 'transient'
+kDeterministic = 'deterministic'
+kUnknown       = 'unknown'
+
+#------------------------------------------------------------------------------
+# failures which do not require looking into the log file
+#------------------------------------------------------------------------------
+kNoOutputDir   = 'no_output_dir'
+kNoLogFile     = 'no_log_file'
+kOutputFiles   = 'output_files'
+kBadOutputFile = 'bad_output_file'     # empty output file, missing or corrupted metadata
+kEventCount    = 'event_count'         # number of events different from expected
+
+DefaultSignatures = [
+    ['xrootd_error'   , kTransient    , r'\[ERROR\]\s*\[?(Operation expired|Socket timeout|Socket error|Server responded with an error)'],
+    ['ifdh_error'     , kTransient    , r'ifdh (cp|copy)\b.*\bfailed|Error in ifdh cp'                                             ],
+    ['stage_in_error' , kTransient    , r'(stage-in|Stage-in|copy of input).*(failed|timed out)'                                   ],
+    ['memory_exceeded', kDeterministic, r'std::bad_alloc|MemoryAllocation|[Mm]emory (limit|usage) exceeded|exceeded.*memory'       ],
+    ['walltime'       , kDeterministic, r'[Ww]all ?time (limit )?exceeded|job exceeded.*lifetime'                                  ],
+    ['missing_input'  , kDeterministic, r'FileOpenError|FileReadError'                                                             ],
+    ['file_not_found' , kTransient    , r'No such file or directory'                                                               ],
+    ['geometry_error' , kDeterministic, r'^---- GeometryService BEGIN|EEEE -+ G4Exception-START'                                   ],
+    ['fhicl_error'    , kDeterministic, r'fhicl::exception|ParseError|---- Configuration BEGIN'                                     ],
+    ['segfault'       , kDeterministic, r'Segmentation fault|segmentation violation|SIGSEGV'                                       ],
+    ['art_exception'  , kDeterministic, r'^---- \w+ BEGIN'                                                                         ],
+]
+
+#------------------------------------------------------------------------------
+class FailureClassifier:
+    def __init__(self, fn = None):
+
+        self.fSignature = []
+        self.fClass     = {}
+
+        user = []
+        if (fn and os.path.exists(fn)):
+            user = self.read_signatures(fn)
+
+        names = [s[0] for s in user]
+
+        self.fSignature = user+[s for s in DefaultSignatures if (s[0] not in names)]
+
+        for s in self.fSignature:
+            self.fClass[s[0]] = s[1]
+
+        self.fClass[kNoOutputDir] = kTransient
+        self.fClass[kNoLogFile  ] = kTransient
+        self.fClass[kOutputFiles] = kTransient
+        self.fClass[kBadOutputFile] = kTransient
+        self.fClass[kEventCount ] = kUnknown
+        self.fClass[kUnknown    ] = kUnknown
+
+        #------------------------------------------------------------------------------
+        # one pattern, each signature is a named group 's%i', where %i is its priority.
+        # lookahead doesn't consume the text, so overlapping matches are not lost
+        #------------------------------------------------------------------------------
+        alternatives = []
+        for i in range(0,len(self.fSignature)):
+            alternatives.append('(?=(?P<s%i>%s))'%(i,self.fSignature[i][2]))
+
+        self.fRegex = re.compile('|'.join(alternatives),re.MULTILINE)
+
+#------------------------------------------------------------------------------
+# file format: 'name class regex', lines starting from '#' are comments
+#------------------------------------------------------------------------------
+    def read_signatures(self,fn):
+        signatures = []
+        for line in open(fn).readlines():
+            line = line.strip()
+            if ((line == '') or (line[0] == '#')): continue
+
+            words = line.split(None,2)
+            if ((len(words) != 3) or (words[1] not in [kTransient,kDeterministic])):
+                print('WARNING in FailureClassifier::read_signatures : skip line:',line)
+                continue
+
+            try:
+                re.compile(words[2])
+            except re.error as e:
+                print('WARNING in FailureClassifier::read_signatures : bad regex:',words[2],':',e)
+                continue
+
+            signatures.append(words)
+
+        return signatures;
+
+#------------------------------------------------------------------------------
+# returns name of the highest priority signature found in 'text', kUnknown if none
+#------------------------------------------------------------------------------
+    def classify(self,text):
+        best = None
+        for m in self.fRegex.finditer(text):
+            index = int(m.lastgroup[1:])
+            if ((best == None) or (index < best)):
+                best = index
+                if (best == 0): break
+
+        if (best == None): return kUnknown
+
+        return self.fSignature[best][0];
+
+    def failure_class(self,cause):
+        return self.fClass.get(cause,kUnknown);
+
+#------------------------------------------------------------------------------
+# print histogram of failure causes, 'causes' : list of the failure cause names
+#------------------------------------------------------------------------------
+    def print_histogram(self,causes):
+        hist = {}
+        for c in causes:
+            hist[c] = hist.get(c,0)+1
+
+        print('---------------------------------------------')
+        print('%-20s %-14s %6s'%('failure cause','class','N'))
+        print('---------------------------------------------')
+        for c in sorted(hist.keys(),key=lambda x: -hist[x]):
+            print('%-20s %-14s %6i'%(c,self.failure_class(c),hist[c]))
+        print('---------------------------------------------')
@@ -0,0 +1,236 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# FCL tarballs built in memory
+#
+# a tarball is written together with a small JSON manifest, $tarball.manifest ,
+# so the tarball doesn't need to be decompressed just to find out what is inside:
+#
+# 'tarball'   : tarball name
+# 'nsegments' : number of segments (FCL files)
+# 'fcl'       : FCL file names, in the tarball order
+# 'fcl_size'  : FCL file name -> size
+# 'outputs'   : FCL file name -> names of the output files of the segment (outputs.*.fileName, histFileName)
+# 'size'      : tarball size
+# 'sha256'    : tarball checksum
+#
+# large tarballs are compressed in parallel: the tar stream is cut into kStreamSize pieces,
+# each piece is compressed into a separate bzip2 stream on a process pool, and the streams
+# are concatenated. bzip2, 'tar -xjf' and Python's bz2 read concatenated streams as one file
+#------------------------------------------------------------------------------
+
+import os, io, re, json, tarfile, hashlib, time, bz2, collections
+
+kStreamSize = 4*1024*1024
+
+def compress_stream(data):
+    return bz2.compress(data,9);
+
+#------------------------------------------------------------------------------
+# file-like object for tarfile.open(fileobj=...,mode='w'), writes bzip2 streams to 'f'
+# pool    : concurrent.futures.ProcessPoolExecutor, if None, the data are compressed in this process
+# nworkers: number of workers of the pool, at most 2*nworkers pieces are held in memory
+#------------------------------------------------------------------------------
+class Bz2StreamWriter:
+    def __init__(self, f, pool=None, nworkers=1, stream_size=kStreamSize):
+        self.fFile       = f
+        self.fPool       = pool
+        self.fMaxPending = 2*max(1,nworkers)
+        self.fStreamSize = stream_size
+        self.fBuffer     = bytearray()
+        self.fPending    = collections.deque()
+        self.fPos        = 0
+        self.fSize       = 0                  # compressed size and checksum of the output
+        self.fSha256     = hashlib.sha256()
+
+    def tell(self):
+        return self.fPos;
+
+    def write(self,data):
+        self.fBuffer += data
+        self.fPos    += len(data)
+        while (len(self.fBuffer) >= self.fStreamSize):
+            self.submit(bytes(self.fBuffer[:self.fStreamSize]))
+            del self.fBuffer[:self.fStreamSize]
+        return len(data);
+
+    def output(self,data):
+        self.fFile.write(data)
+        self.fSha256.update(data)
+        self.fSize += len(data)
+
+    def submit(self,data):
+        if (self.fPool == None):
+            self.output(compress_stream(data))
+            return
+
+        self.fPending.append(self.fPool.submit(compress_stream,data))
+        while (len(self.fPending) > self.fMaxPending):
+            self.output(self.fPending.popleft().result())
+
+#------------------------------------------------------------------------------
+# doesn't close 'f'
+#------------------------------------------------------------------------------
+    def close(self):
+        if (len(self.fBuffer) > 0): self.submit(bytes(self.fBuffer))
+        self.fBuffer = bytearray()
+        while (len(self.fPending) > 0):
+            self.output(self.fPending.popleft().result())
+
+#------------------------------------------------------------------------------
+# members: list of (name, bytes), stored in the order given
+#------------------------------------------------------------------------------
+def add_member(tar,name,data,mtime):
+    ti       = tarfile.TarInfo(name)
+    ti.size  = len(data)
+    ti.mtime = mtime
+    ti.mode  = 0o644
+    tar.addfile(ti,io.BytesIO(data))
+
+def make_tarball_bytes(members):
+    buf = io.BytesIO()
+    tar = tarfile.open(fileobj=buf,mode='w:bz2')
+    now = time.time()
+    for name, data in members:
+        add_member(tar,name,data,now)
+    tar.close()
+    return buf.getvalue();
+
+def manifest_name(tarball):
+    return tarball+'.manifest';
+
+#------------------------------------------------------------------------------
+# names of the output files defined in the FCL text
+#------------------------------------------------------------------------------
+OutputLine = re.compile(r'^\s*(?:outputs\.\w+\.fileName|physics\.analyzers\.InitStntuple\.histFileName)\s*:\s*"?([^"\s]+)"?',re.MULTILINE)
+
+def fcl_outputs(text):
+    return OutputLine.findall(text);
+
+#------------------------------------------------------------------------------
+# fcls: list of (name, size, outputs) in the tarball order
+#------------------------------------------------------------------------------
+def make_manifest(tarball,fcls,size,sha256):
+    m              = {}
+    m['tarball'  ] = os.path.basename(tarball)
+    m['nsegments'] = len(fcls)
+    m['fcl'      ] = [name for name, n, outputs in fcls]
+    m['fcl_size' ] = dict([(name,n) for name, n, outputs in fcls])
+    m['outputs'  ] = dict([(name,outputs) for name, n, outputs in fcls])
+    m['size'     ] = size
+    m['sha256'   ] = sha256
+    return m;
+
+#------------------------------------------------------------------------------
+# write to a temp file first, so a reader never sees a partially written file
+# dCache files can't be overwritten, remove the old file before renaming
+#------------------------------------------------------------------------------
+def write_file(fn,data):
+    fn_new = fn+'.tmp'
+    f      = open(fn_new,'wb')
+    f.write(data)
+    f.close()
+    if (os.path.exists(fn)): os.remove(fn)
+    os.rename(fn_new,fn)
+
+#------------------------------------------------------------------------------
+# write tarball and its manifest to each of the 'tarballs' locations
+# returns the manifest
+#------------------------------------------------------------------------------
+def write_tarball(tarballs,members):
+    data     = make_tarball_bytes(members)
+    fcls     = [(name,len(d),fcl_outputs(d.decode(errors='replace'))) for name, d in members]
+    manifest = make_manifest(tarballs[0],fcls,len(data),hashlib.sha256(data).hexdigest())
+    mdata    = json.dumps(manifest).encode()
+
+    for fn in tarballs:
+        write_file(fn,data)
+        write_file(manifest_name(fn),mdata)
+
+    return manifest;
+
+def write_manifest(tarball,manifest):
+    write_file(manifest_name(tarball),json.dumps(manifest).encode())
+
+#------------------------------------------------------------------------------
+# returns None if there is no manifest, or if it doesn't describe the tarball next to it:
+# only the size is compared, so a stale manifest is detected without reading the tarball
+#------------------------------------------------------------------------------
+def read_manifest(tarball):
+    fn = manifest_name(tarball)
+    if (not os.path.exists(fn)): return None
+    try:
+        m = json.loads(open(fn).read())
+    except ValueError:
+        return None
+
+    try:
+        if (os.path.getsize(tarball) != m['size']): return None
+    except OSError:
+        return None
+
+    return m;
+
+#------------------------------------------------------------------------------
+# returns list of (name, bytes) for all FCL files in the tarball
+#------------------------------------------------------------------------------
+def read_tarball(tarball):
+    members = []
+    tar     = tarfile.open(tarball,mode='r:*')
+    for ti in tar:
+        if (not ti.isfile()): continue
+        members.append((ti.name,tar.extractfile(ti).read()))
+    tar.close()
+    return members;
+
+def remove_tarball(tarball):
+    for fn in [tarball, manifest_name(tarball)]:
+        if (os.path.exists(fn)): os.remove(fn)
+
+#------------------------------------------------------------------------------
+# benchmark: grim/scripts/fcl_tarball.py --benchmark=tmp/su2020/fcl/bpip0b0s11r0000.s1_sim [--nworkers=1,2,4,8]
+# compares 'tar -cjf' with the parallel compression of the same FCL files,
+# the parallel tarballs are checked to have the same content with 'tar -tjf'
+#------------------------------------------------------------------------------
+def benchmark(fcldir,nworkers_list):
+    import subprocess, tempfile, concurrent.futures
+
+    files   = sorted([os.path.basename(fn) for fn in os.listdir(fcldir) if fn.endswith('.fcl')])
+    tmpdir  = tempfile.mkdtemp()
+    ref     = tmpdir+'/ref.fcl.tbz'
+
+    t0      = time.time()
+    subprocess.run('cd '+fcldir+'; tar -cjf '+ref+' *.fcl',shell=True,check=True)
+    dt      = time.time()-t0
+    print('N(fcl): %i, size: %.1f MB'%(len(files),sum([os.path.getsize(fcldir+'/'+fn) for fn in files])/1.e6))
+    print('%-12s %8.2f s %10.3f MB'%('tar -cjf',dt,os.path.getsize(ref)/1.e6))
+
+    for nworkers in nworkers_list:
+        fn   = tmpdir+'/par.%i.fcl.tbz'%nworkers
+        t0   = time.time()
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=nworkers) if (nworkers > 1) else None
+        with open(fn,'wb') as f:
+            out = Bz2StreamWriter(f,pool,nworkers)
+            tar = tarfile.open(fileobj=out,mode='w')
+            now = time.time()
+            for name in files:
+                with open(fcldir+'/'+name,'rb') as fcl: add_member(tar,name,fcl.read(),now)
+            tar.close()
+            out.close()
+        if (pool): pool.shutdown()
+        dt   = time.time()-t0
+
+        p    = subprocess.run(['tar','-tjf',fn],capture_output=True,universal_newlines=True)
+        ok   = (p.returncode == 0) and (p.stdout.split() == files)
+        print('%-12s %8.2f s %10.3f MB  tar -tjf: %s'%('nworkers=%i'%nworkers,dt,os.path.getsize(fn)/1.e6,'OK' if ok else 'FAILED'))
+        os.remove(fn)
+
+    os.remove(ref)
+    os.rmdir(tmpdir)
+
+if (__name__ == '__main__'):
+    import sys, getopt
+
+    optlist, args = getopt.getopt(sys.argv[1:],'',['benchmark=','nworkers='])
+    opts          = dict(optlist)
+    nworkers      = [int(x) for x in opts.get('--nworkers','1,2,4,8').split(',')]
+    benchmark(opts['--benchmark'],nworkers)
@@ -15,11 +15,20 @@
 #              resubmitted. job_submit.py has to be called with --recover=grid_id parameter as well
 #              it is appended to the FCL tarball and the directory containing the FCL files for recovery jobs 
 #              that directory is supposed to contain only FCL files for segments to be resubmitted
+#   target-walltime: target wall time per segment, for example, '6h'. The number of events per segment
+#              (generators, resampling) or of input files per segment is chosen based on the processing 
+#              speed measured in the previous grid jobs of the same job, see harvest_logs.py
+#   percentile : with --target-walltime, percentile of the processing time the segments are sized for, default: 95
+#   compress-workers : number of processes compressing the FCL tarball, default: min(8, number of CPUs)
+#   dir-workers : with more than 1000 segments, number of FCL directories processed concurrently, default: 4
+#   max-uploads : number of FCL tarballs copied to PNFS simultaneously, default: 2
 #-------------------------------------------------------------------------------------------------
 
-import subprocess, shutil, glob, random, json
+import subprocess, shutil, glob, random, json, tarfile, concurrent.futures, threading
 import sys, string, getopt, glob, os, time, re, array
 
+import resource_stats, dataset_catalog, fcl_tarball
+
 #------------------------------------------------------------------------------
 class Tool:
 
@@ -45,6 +54,14 @@ class Tool:
         #        self.fFclTarballDir = '/mu2e/data/users/'+os.getenv('USER')+'/grid';
         self.fFclTarballDir = '/pnfs/mu2e/scratch/users/'+os.getenv('USER')+'/fcl';
         self.fNotar         = None;
+        self.fTargetWalltime = None;     # in seconds
+        self.fPercentile    = 95
+        self.fCompressWorkers = min(8,os.cpu_count() or 1)  # processes compressing FCL tarballs
+        self.fCompressPool  = None
+        self.fDirWorkers    = 4          # FCL directories (>1000 segments) processed concurrently
+        self.fMaxUploads    = 2          # tarballs copied to PNFS simultaneously
+        self.fLock          = threading.Lock()
+        self.fUploadSlots   = None
 
         self.fOwner         = os.getenv('USER');
         if (self.fOwner == 'mu2epro'): self.fOwner = 'mu2e';
@@ -77,7 +94,9 @@ class Tool:
         
         try:
             optlist, args = getopt.getopt(sys.argv[1:], '',
-                     ['project=', 'verbose=', 'job=', 'notar', 'dsid=', 'fid=', 'fileset=', 'first-subrun=', 'stage=', 'pileup=', 'recover=' ] )
+                     ['project=', 'verbose=', 'job=', 'notar', 'dsid=', 'fid=', 'fileset=', 'first-subrun=', 'stage=', 'pileup=', 'recover=',
+                      'subruns=', 'target-walltime=', 'percentile=', 'compress-workers=', 'dir-workers=',
+                      'max-uploads=' ] )
  
         except getopt.GetoptError:
             self.Print(name,0,'%s' % sys.argv)
@@ -110,6 +129,16 @@ class Tool:
                 self.fMaxSubrun = val.split(':')[1]
             elif key == '--stage':
                 self.fStageName = val
+            elif key == '--target-walltime':
+                self.fTargetWalltime = resource_stats.time_sec(val)
+            elif key == '--percentile':
+                self.fPercentile = float(val)
+            elif key == '--compress-workers':
+                self.fCompressWorkers = int(val)
+            elif key == '--dir-workers':
+                self.fDirWorkers = int(val)
+            elif key == '--max-uploads':
+                self.fMaxUploads = int(val)
             elif key == '--verbose':
                 self.fVerbose = int(val)
 
@@ -188,34 +217,159 @@ class Tool:
 
         # print('>>> [make_fcl_tarball] fcldir:',fcldir,' tarball: ',tarball);
 
-        # cmd     = ['su2020/scripts/make_fcl_tarball',fcldir,tarball]
-
-        cmd     = 'cd '+fcldir+'; tar -cjf '+tarball+' *.fcl';
-
-        process = subprocess.run(cmd,shell=True,capture_output=True,universal_newlines=True);
+        tar, out = self.open_fcl_tarball(tarball)
+        now      = time.time()
+        fcls     = []
+        try:
+            for fn in sorted(glob.glob(fcldir+'/*.fcl')):
+                with open(fn,'rb') as f: data = f.read()
+                fcl_tarball.add_member(tar,os.path.basename(fn),data,now)
+                fcls.append((os.path.basename(fn),len(data),fcl_tarball.fcl_outputs(data.decode(errors='replace'))))
+            self.close_fcl_tarball(tar,out,tarball,fcls)
+        except BaseException:
+            self.abort_fcl_tarball(out,tarball)
+            raise
         
         self.Print(name,1,"tarball created");
 
-        if (process.returncode != 0):
-            print(" ------------ gen_fcl.py in trouble 003! ")
-            print(process.stderr.split('\n'));
+        self.copy_fcl_tarball(tarball)
+
+#------------------------------------------------------------------------------
+# FCL tarballs are compressed in parallel, on a pool of fCompressWorkers processes,
+# see fcl_tarball.Bz2StreamWriter. Returns the tarfile and the underlying writer
+# closing the tarball writes its manifest, fcls: list of (name, size, output file names).
+# If anything goes wrong in between, abort_fcl_tarball closes the file and removes the partial tarball.
+# The pool is shut down by shutdown(), at the end of the run
+#------------------------------------------------------------------------------
+    def open_fcl_tarball(self,tarball):
+        with self.fLock:
+            if ((self.fCompressPool == None) and (self.fCompressWorkers > 1)):
+                self.fCompressPool = concurrent.futures.ProcessPoolExecutor(max_workers=self.fCompressWorkers)
+
+        f   = open(tarball,'wb')
+        out = fcl_tarball.Bz2StreamWriter(f,self.fCompressPool,self.fCompressWorkers)
+        return tarfile.open(fileobj=out,mode='w'), out;
+
+    def close_fcl_tarball(self,tar,out,tarball,fcls):
+        tar.close()
+        out.close()
+        out.fFile.close()
+
+        manifest = fcl_tarball.make_manifest(tarball,fcls,out.fSize,out.fSha256.hexdigest())
+        fcl_tarball.write_manifest(tarball,manifest)
+
+    def abort_fcl_tarball(self,out,tarball):
+        out.fFile.close()
+        fcl_tarball.remove_tarball(tarball)
+        self.Print('abort_fcl_tarball',0,'ERROR: removed incomplete %s'%tarball)
+
+    def shutdown(self):
+        if (self.fCompressPool):
+            self.fCompressPool.shutdown()
+            self.fCompressPool = None
+
 #------------------------------------------------------------------------------
 # move tarball with the fcl files for the simulation jobs to PNFS
+# at most fMaxUploads tarballs are copied at the same time
 #------------------------------------------------------------------------------
+    def copy_fcl_tarball(self,tarball):
+
+        with self.fLock:
+            if (self.fUploadSlots == None): self.fUploadSlots = threading.BoundedSemaphore(max(1,self.fMaxUploads))
+
+        with self.fUploadSlots:
+            self.upload_fcl_tarball(tarball)
+
+    def upload_fcl_tarball(self,tarball):
+        name = 'copy_fcl_tarball';
+
         tar_on_pnfs = self.fFclTarballDir+'/'+self.fProject+'/'+os.path.basename(tarball)
 
         if (os.path.exists(tar_on_pnfs)):
             print('WARNING: '+tar_on_pnfs+' already exists, OVERWRITING !')
-            os.remove(tar_on_pnfs);
+            fcl_tarball.remove_tarball(tar_on_pnfs);
 
         self.Print(name,1,'copy %s  to %s'%(tarball,tar_on_pnfs));
         shutil.copyfile(tarball,tar_on_pnfs);
+        #------------------------------------------------------------------------------
+        # the manifest goes after the tarball, so submit_job.py never sees a manifest without the tarball
+        #------------------------------------------------------------------------------
+        manifest = fcl_tarball.manifest_name(tarball)
+        if (os.path.exists(manifest)): shutil.copyfile(manifest,fcl_tarball.manifest_name(tar_on_pnfs))
 
         self.Print(name,1,'DONE copying tarball')
 
+#------------------------------------------------------------------------------
+# name the tarball according to Mu2e naming . self.fFileset
+# index >= 0 : one of the directories of a job with more than 1000 segments
+#------------------------------------------------------------------------------
+    def fcl_tarball_name(self,index):
+        fcltop    = os.getcwd()+'/tmp/'+self.fProject+'/fcl'
+
+        name_stub = fcltop+'/'+'cnf.'+self.fOwner +'.'+self.fIDsID+'.'+stage.name()+'_'+job.name()+'.'+self.fProject ;
+
+        if (self.fFileset):
+            tarball = name_stub+'.%s.fcl.tbz'%self.fFileset;
+        else:
+            tarball = name_stub+'.fcl.tbz';
+
+        if (index >= 0): 
+            tarball = name_stub+".%03i.fcl.tbz"%index
+
+        return tarball;
+
+#------------------------------------------------------------------------------
+# correct some things in the text of one FCL file
+# stn_fn: STNTUPLE file name of the segment
+#------------------------------------------------------------------------------
+    def postprocess_fcl(self,text,stn_fn):
+        name = 'postprocess_fcl'
+
+        res = []
+        for line in text.splitlines(keepends=True):
+            # process Andrei's templa
+            if ('MU2EGRIDDSOWNER' in line): line = line.replace('MU2EGRIDDSOWNER',self.fOwner)
+            if ('MU2EGRIDDSCONF'  in line): line = line.replace('MU2EGRIDDSCONF' ,self.fProject)
+
+            words = line.split(':')
+            key   = words[0].strip();
+            kfields = key.split('.')
+            # print(' kfields : ',kfields);
+            #------------------------------------------------------------------------------
+            # define STNTUPLE filename
+            #------------------------------------------------------------------------------
+            if (key == 'physics.analyzers.InitStntuple.histFileName'): 
+                line  = 'physics.analyzers.InitStntuple.histFileName : \"'+stn_fn+'"\n'
+
+            if ((len(kfields) == 3) and kfields[0] == 'outputs') and (kfields[2] == 'fileName'):
+                #------------------------------------------------------------------------------
+                # make sure that the output DS name is defiend by init_project.py
+                #------------------------------------------------------------------------------
+                dsn        = words[1]
+                nstreams   = self.fJob.n_output_streams();
+                dsn_fields = []
+                self.Print(name,1,'nstreams:%i kfields[1]:%s line        :%s'%(nstreams,kfields[1],line.strip()))
+                for i in range(0,nstreams):
+                    if (self.fJob.output_stream(i) == kfields[1]):
+                        # redefine the dataset ID
+                        dsn_fields    = dsn.split('.');
+                        dsn_fields[2] = self.fJob.output_dsid(i)
+                        # print('1: dsn_fields:',dsn_fields)
+                        break
+
+                # print('2: dsn_fields:',dsn_fields)
+                line          = words[0]+":"+".".join(dsn_fields)
+                self.Print(name,1,'updated line:%s'%line)
+
+            res.append(line)     # substitute
+
+        return ''.join(res);
+
 #------------------------------------------------------------------------------
 # post-process directory with FCL files 
-# 
+# each FCL file is read once and corrected in memory. The corrected text is written
+# under the new name into the local directory (check_completed_job.py needs it)
+# and, from the same buffer, into the tarball
 #------------------------------------------------------------------------------
     def postprocess_fcl_directory(self,fcldir,index):
         name = 'postprocess_fcl_directory'
@@ -224,88 +378,58 @@ class Tool:
 #------------------------------------------------------------------------------
 # remove all .json files - don't need them for fcl's
 #------------------------------------------------------------------------------
-        cmd = 'rm '+fcldir+'/*.json'
-        os.system(cmd);
+        for fn in glob.glob(fcldir+'/*.json'): os.remove(fn)
 
         list_of_fcls = glob.glob(fcldir+'/*.fcl');
         list_of_fcls.sort();
         nfiles       = len(list_of_fcls)
 
-        for i in range(0,nfiles):
-            fcl_fn     = list_of_fcls[i]
-            self.Print(name,1,"i : %i, fcl_fn:%s"%(i,fcl_fn))
+        tar          = None
+        if ( not self.fNotar ):
+            tarball  = self.fcl_tarball_name(index)
+            tar, out = self.open_fcl_tarball(tarball)
+            now      = time.time()
+            fcls     = []
 
-            #------------------------------------------------------------------------------
-            # form STNTUPLE filename
-            bn         = os.path.basename(fcl_fn);
+        try:
+            for i in range(0,nfiles):
+                fcl_fn     = list_of_fcls[i]
+                self.Print(name,1,"i : %i, fcl_fn:%s"%(i,fcl_fn))
 
-            fields     = bn.split('.');
-            sfields    = fields.copy()
+                #------------------------------------------------------------------------------
+                # form STNTUPLE filename
+                bn         = os.path.basename(fcl_fn);
 
-            sfields[0] = 'nts'
-            sfields[2] = job.output_dsid(0)
-            sfields[5] = 'stn'
-            stn_fn     = '.'.join(sfields)
+                fields     = bn.split('.');
+                sfields    = fields.copy()
 
-            fields[4]  = "%05i_"%i+fields[4]
-            new_bn     = '.'.join(fields)
+                sfields[0] = 'nts'
+                sfields[2] = job.output_dsid(0)
+                sfields[5] = 'stn'
+                stn_fn     = '.'.join(sfields)
 
-            self.Print(name,1,"bn:%s, new_bn:%s:"%(bn,new_bn))
+                fields[4]  = "%05i_"%i+fields[4]
+                new_bn     = '.'.join(fields)
 
-            new_fn     = new_bn
+                self.Print(name,1,"bn:%s, new_bn:%s:"%(bn,new_bn))
 
-            if (fcldir != ''): 
-                new_fn = fcldir+'/'+new_bn
+                new_fn     = new_bn
 
-            os.rename(fcl_fn,new_fn);
+                if (fcldir != ''): 
+                    new_fn = fcldir+'/'+new_bn
 #------------------------------------------------------------------------------
-# re-read the FCL file and correct some things
+# read the FCL file, correct some things, write it under the new name
 #------------------------------------------------------------------------------
-            f    = open(new_fn)
-            fn1  = new_fn+'.tmp'
-            f1   = open(fn1,'w')
+                with open(fcl_fn) as f: text = f.read()
 
-            for line in f.readlines():
-                # process Andrei's templa
-                if ('MU2EGRIDDSOWNER' in line): line = line.replace('MU2EGRIDDSOWNER',self.fOwner)
-                if ('MU2EGRIDDSCONF'  in line): line = line.replace('MU2EGRIDDSCONF' ,self.fProject)
-
-                words = line.split(':')
-                key   = words[0].strip();
-                kfields = key.split('.')
-                # print(' kfields : ',kfields);
-                #------------------------------------------------------------------------------
-                # define STNTUPLE filename
-                #------------------------------------------------------------------------------
-                if (key == 'physics.analyzers.InitStntuple.histFileName'): 
-                    line  = 'physics.analyzers.InitStntuple.histFileName : \"'+stn_fn+'"\n'
-
-                if ((len(kfields) == 3) and kfields[0] == 'outputs') and (kfields[2] == 'fileName'):
-                    #------------------------------------------------------------------------------
-                    # make sure that the output DS name is defiend by init_project.py
-                    #------------------------------------------------------------------------------
-                    dsn        = words[1]
-                    nstreams   = self.fJob.n_output_streams();
-                    dsn_fields = []
-                    self.Print(name,1,'nstreams:%i kfields[1]:%s line        :%s'%(nstreams,kfields[1],line.strip()))
-                    for i in range(0,nstreams):
-                        if (self.fJob.output_stream(i) == kfields[1]):
-                            # redefine the dataset ID
-                            dsn_fields    = dsn.split('.');
-                            dsn_fields[2] = self.fJob.output_dsid(i)
-                            # print('1: dsn_fields:',dsn_fields)
-                            break
-
-                    # print('2: dsn_fields:',dsn_fields)
-                    line          = words[0]+":"+".".join(dsn_fields)
-                    self.Print(name,1,'updated line:%s'%line)
-
-                f1.write(line)     # substitute
-
-            f.close()
-            f1.close()
-            # replace old file with the new one
-            shutil.move(fn1,new_fn)
+                data = self.postprocess_fcl(text,stn_fn).encode()
+
+                with open(new_fn,'wb') as f: f.write(data)
+                os.remove(fcl_fn)
+
+                if (tar):
+                    fcl_tarball.add_member(tar,new_bn,data,now)
+                    fcls.append((new_bn,len(data),fcl_tarball.fcl_outputs(data.decode())))
 #------------------------------------------------------------------------------
 # remake metadata (.json file)
 #------------------------------------------------------------------------------
@@ -323,26 +447,71 @@ class Tool:
 #            print (process.stderr)
 #            return -1;
 
-        if ( not self.fNotar ):
+            if (tar): self.close_fcl_tarball(tar,out,tarball,fcls)
+        except BaseException:
+            if (tar): self.abort_fcl_tarball(out,tarball)
+            raise
+
+        if (tar):
 #------------------------------------------------------------------------------
-# create tarball: name the tarball according to Mu2e naming . self.fFileset
+# tarball is complete, copy it to PNFS
 #------------------------------------------------------------------------------
-            fcltop  = os.getcwd()+'/tmp/'+self.fProject+'/fcl'
-
-            name_stub = fcltop+'/'+'cnf.'+self.fOwner +'.'+self.fIDsID+'.'+stage.name()+'_'+job.name()+'.'+self.fProject ;
+            self.Print(name,1,"tarball created");
+            self.copy_fcl_tarball(tarball);
 
-            if (self.fFileset):
-                tarfile = name_stub+'.%s.fcl.tbz'%self.fFileset;
-            else:
-                tarfile = name_stub+'.fcl.tbz';
+        self.Print(name,1,'END')
+        return 0;
 
-            if (index >= 0): 
-                tarfile = name_stub+".%03i.fcl.tbz"%index
+#------------------------------------------------------------------------------
+# redefine the segment size such that a segment runs for about self.fTargetWalltime
+# - generators and resampling jobs: number of events per segment. For generators, the total
+#   number of events, fNInputFiles*fNEventsPerSegment, stays the same
+# - jobs reading input datasets: number of input files per segment
+#------------------------------------------------------------------------------
+    def plan_segments(self,stage,job):
+        name = 'plan_segments'
+
+        tables = resource_stats.load_tables(self.fProject,self.fFamilyID,stage.name(),job.name())
+        if (len(tables) == 0):
+            self.Print(name,0,'WARNING: no resource usage history for %s:%s:%s, keep the segmentation defined by init_project.py'%
+                       (self.fFamilyID,stage.name(),job.name()))
+            return 0
+
+        generator = (job.input_dataset().defname() == 'generator')
+
+        if (generator or (job.fResample != 'no')):
+            nev = resource_stats.plan_nevents(tables,self.fTargetWalltime,self.fPercentile)
+            if (nev == None):
+                self.Print(name,0,'WARNING: event rate not known, keep fNEventsPerSegment=%i'%job.fNEventsPerSegment)
+                return 0
+
+            if (generator):
+                nevents  = job.fNInputFiles*job.fNEventsPerSegment
+                nsegs    = int((nevents-1)/nev)+1
+                #------------------------------------------------------------------------------
+                # the subruns of fileset N start from N*(number of segments in init_project.py),
+                # more segments per fileset would overlap with the subruns of the next fileset
+                #------------------------------------------------------------------------------
+                if (self.fFileset and (not self.fFirstSubrun) and (nsegs > job.fNInputFiles)):
+                    self.Print(name,0,'WARNING: fileset %s would need %i > %i segments, keep fNEventsPerSegment=%i'%
+                               (self.fFileset,nsegs,job.fNInputFiles,job.fNEventsPerSegment))
+                    return 0
+                job.fNInputFiles = nsegs
+            print('target wall time: %s, fNEventsPerSegment: %i -> %i'%
+                  (resource_stats.format_time(self.fTargetWalltime),job.fNEventsPerSegment,nev))
+            job.fNEventsPerSegment = nev
+        else:
+            nf = resource_stats.plan_input_files(tables,self.fTargetWalltime,self.fPercentile)
+            if (nf == None):
+                self.Print(name,0,'WARNING: time per input file not known, keep fMaxInputFilesPerSegment=%i'%
+                           job.fMaxInputFilesPerSegment)
+                return 0
 
-            self.make_fcl_tarball(fcldir,tarfile);
+            print('target wall time: %s, fMaxInputFilesPerSegment: %i -> %i'%
+                  (resource_stats.format_time(self.fTargetWalltime),job.fMaxInputFilesPerSegment,nf))
+            job.fMaxInputFilesPerSegment = nf
 
-        self.Print(name,1,'END')
-        return 0;
+        return 0
 
 #------------------------------------------------------------------------------
 # generate fcl 
@@ -358,9 +527,15 @@ class Tool:
             fcltop  = os.getcwd()+'/tmp/'+self.fProject+'/fcl'
             fcldir  = fcltop+'/'+self.fIDsID+'.'+stage.name()+'_'+job.name()+'.'+self.fRecover;
             tarfile = fcltop+'/cnf.'+self.fOwner+'.'+self.fIDsID+'.'+stage.name()+'_'+job.name()+'.'+self.fProject+'.'+self.fRecover+'.fcl.tbz'
+            if ((not os.path.exists(fcldir)) and os.path.exists(tarfile)):
+                # written by check_completed_job.py --recovery-tarball=1, already copied to PNFS
+                print('recovery tarball '+tarfile+' has been created by check_completed_job.py, nothing to do')
+                return
             self.make_fcl_tarball(fcldir,tarfile);
             return
 
+        nfiles_init = job.fNInputFiles          # plan_segments may change it, the fileset stride may not
+        if (self.fTargetWalltime): self.plan_segments(stage,job)
         #------------------------------------------------------------------------------
         # initial submission:
         # calculate the total number of segments and the number of jobs to be submitted 
@@ -404,6 +579,27 @@ class Tool:
                     input_file_list = self.fProjectDir+'/catalog/'+ids.defname()+'.files';
                 else:
                     input_file_list = self.fProjectDir+'/catalog/'+ids.defname()+'.files.'+self.fFileset;
+                #------------------------------------------------------------------------------
+                # the list of files is a view of the catalog metadata, regenerate it if missing
+                #------------------------------------------------------------------------------
+                entries = dataset_catalog.load(input_file_list)
+                if (not os.path.exists(input_file_list)): dataset_catalog.write_files(input_file_list,entries)
+
+                self.Print(name,1,'catalog: N(files): %i size: %.3f GB N(events): %i'%
+                           (len(entries),dataset_catalog.total_size(entries)/1.e9,dataset_catalog.total_events(entries)));
+                #------------------------------------------------------------------------------
+                # --subruns=min:max : files with min <= subrun < max, looked up in the catalog index
+                #------------------------------------------------------------------------------
+                if (self.fMinSubrun):
+                    index = dataset_catalog.open_index(input_file_list)
+                    paths = index.subrun_range(int(self.fMinSubrun),int(self.fMaxSubrun)-1)
+                    index.close()
+
+                    input_file_list = '/tmp/list_of_files.txt.'+'%i'%os.getpid()
+                    fout = open(input_file_list,'w')
+                    for path in paths: fout.write(path+'\n')
+                    fout.close()
+                    delete_input_file_list = 1
                     
             else:
                 if (self.fFileset == None):
@@ -447,7 +643,7 @@ class Tool:
                 if (not self.fFirstSubrun):
                     # fileset is defined, the first subrun - is not
                     # so far, an assumptions that the fileset number is an integer works.
-                    self.fFirstSubrun = job.fNInputFiles*int(self.fFileset)
+                    self.fFirstSubrun = nfiles_init*int(self.fFileset)
             
         #------------------------------------------------------------------------------
         # define generate_fcl call parameters
@@ -560,18 +756,45 @@ class Tool:
 
         else:
             # create more than one directory
-            for idir in range(0,ndir):
-                fcldir=os.getcwd()+'/tmp/'+self.fProject+'/fcl/'+self.fIDsID+'.'+stage.name()+'_'+job.name()+".%03i"%idir;
+            return self.postprocess_fcl_directories(stage,job,ndir)
+
+#------------------------------------------------------------------------------
+# more than 1000 segments: generate_fcl writes directories 000, 001, ... 
+# each directory is moved, post-processed, tarred up and copied to PNFS independently of the others,
+# fDirWorkers directories at a time. Returns 0 if all directories succeeded, otherwise 
+# the return code of the first directory which failed. All failures are reported
+#------------------------------------------------------------------------------
+    def postprocess_fcl_directories(self,stage,job,ndir):
+        name = 'postprocess_fcl_directories'
+
+        def process(idir):
+            fcldir=os.getcwd()+'/tmp/'+self.fProject+'/fcl/'+self.fIDsID+'.'+stage.name()+'_'+job.name()+".%03i"%idir;
+
+            if (os.path.exists(fcldir)):
+                print(' WARNING: directory '+fcldir+' already exists, REMOVING and RECREATING !');
+                shutil.rmtree(fcldir)
+
+            shutil.move("%03i"%idir,fcldir)
+
+            return self.postprocess_fcl_directory(fcldir,idir);
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,self.fDirWorkers)) as pool:
+            futures = [pool.submit(process,idir) for idir in range(0,ndir)]
 
-                if (os.path.exists(fcldir)):
-                    print(' WARNING: directory '+fcldir+' already exists, REMOVING and RECREATING !');
-                    shutil.rmtree(fcldir)
+        rc = 0
+        for idir, future in enumerate(futures):
+            try:
+                rc_dir = future.result()
+            except Exception as e:
+                self.Print(name,0,'ERROR: directory %03i : %s'%(idir,e))
+                rc_dir = -1
 
-                shutil.move("%03i"%idir,fcldir)
+            if (rc_dir != 0):
+                self.Print(name,0,'ERROR: directory %03i rc=%i'%(idir,rc_dir))
+                if (rc == 0): rc = rc_dir
 
-                rc = self.postprocess_fcl_directory(fcldir,idir);
-                if (rc != 0): 
-                    return rc
+        self.Print(name,1,'N(directories): %i rc=%i'%(ndir,rc))
+        return rc
 
 #------------------------------------------------------------------------------
 # main program, just make a GridSubmit instance and call its methods
@@ -584,6 +807,9 @@ if (__name__ == '__main__'):
 
     stage = x.fStage;
     job   = stage.job(x.fDsID,x.fJType);
-    rc    = x.gen_fcl(stage,job)
+    try:
+        rc = x.gen_fcl(stage,job)
+    finally:
+        x.shutdown()
 
     sys.exit(rc);
@@ -1,6 +1,6 @@
 #!/user/bin/python
 
-import os, json, datetime, subprocess
+import os, sys, json, datetime, subprocess, threading, importlib.util
 
 import local_classes
 
@@ -11,6 +11,28 @@ kListPnfsFilesBit  = 0x0008;
 kFilesUploadedBit  = 0x0010;
 kLocationsAddedBit = 0x0020;
 
+#------------------------------------------------------------------------------
+# project configurations, one per $project/datasets/$family directory, loaded once
+# 'import init_project' can't be used when several families are processed by the same
+# process - all of them have init_project.py
+#------------------------------------------------------------------------------
+_project_config      = {}
+_project_config_lock = threading.Lock()
+
+def project_config(project,project_dir):
+    with _project_config_lock:
+        if (project_dir not in _project_config):
+            for d in [project+'/datasets/mixing', project_dir]:
+                if (d not in sys.path): sys.path.append(d)
+
+            spec   = importlib.util.spec_from_file_location('init_project',project_dir+'/init_project.py')
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+            _project_config[project_dir] = module.Project()
+
+        return _project_config[project_dir];
+
 #------------------------------------------------------------------------------
 class GridJob:
     def __init__(self, fn):
@@ -49,6 +71,10 @@ class GridJob:
         self.fNSuccess = None;
         if ('nsuccess' in dict.keys()) : self.fNSuccess = dict['nsuccess'];
 
+        # max number of held segments seen by grid_monitor.py
+        self.fMaxHeld  = 0;
+        if ('max_held' in dict.keys()) : self.fMaxHeld  = dict['max_held'];
+
         self.fProjectConfig = None;
         self.fStageConfig   = None;
         self.fConfig        = None;
@@ -179,6 +205,7 @@ class GridJob:
         r['segments'  ] = self.fNSegments
 
         r['nsuccess'  ] = self.fNSuccess;
+        r['max_held'  ] = self.fMaxHeld;
 
         r['subm_time' ] = self.fSubmTime;
         r['compl_time'] = t.strftime("%Y-%m-%d %H:%M:%S CDT ")
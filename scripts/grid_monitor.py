@@ -171,6 +171,19 @@ class GridMonitor:
             job = jobs[id]
             # print('job id:',id,' nrunning = ',job.fNRunning);
             
+            #------------------------------------------------------------------------------
+            # remember the max number of held segments, held segments usually exceeded 
+            # the requested memory or time, see tune_job.py
+            #------------------------------------------------------------------------------
+            if (job.fNHeld > job.fMaxHeld):
+                job.fMaxHeld = job.fNHeld
+
+                fn     = self.fRunningDir+'/'+str(job.id());
+                fn_new = self.fRunningDir+'/'+str(job.id())+'.tmp';
+
+                rc     = job.write_status_file(fn_new);
+                if (rc == 0): os.replace(fn_new,fn);
+
             if ((job.fStatus == 0) and (job.n_alive_segments() == 0)):
                 #------------------------------------------------------------------------------
                 # job just finished, status , but don't move it
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# extract per-segment resource usage from the log files of completed grid jobs
+# call: grim/scripts/harvest_logs.py --project=su2020 --grid_id=35469055[,xxxxxx,[yyy]] [--nthreads=8]
+#
+# the same is done by 'check_completed_job.py --harvest=1', this script doesn't check the output files
+# results go to tmp/$project/resources/$grid_id.cols , see log_harvester.py
+#------------------------------------------------------------------------------
+
+import sys, getopt, glob, os, time
+import concurrent.futures
+
+import grid_job, log_harvester, outstage_manifest
+#------------------------------------------------------------------------------
+class HarvestLogs:
+
+    def __init__(self):
+        self.fProject       = None
+        self.fGridIDList    = None;
+        self.fNThreads      = 8
+        self.fVerbose       = 0
+
+        self.fRunningDir    = None;
+        self.fCompletedDir  = None;
+
+        self.fUseRunningDir = 1
+# ---------------------------------------------------------------------
+    def Print(self,Name,level,Message):
+        if(level>self.fVerbose): return 0;
+        now     = time.strftime('%Y/%m/%d %H:%M:%S',time.localtime(time.time()))
+        message = now+' [ HarvestLogs::'+Name+' ] '+Message
+        print(message)
+
+#----------------------------------------------------------------------
+# --verbose=0 only print necessary error messages etc.
+# --verbose=1 (default) print some summary of what was done
+#------------------------------------------------------------------------------
+    def ParseParameters(self):
+        name = 'ParseParameters'
+
+        self.Print(name,2,'Starting')
+        self.Print(name,2, '%s' % sys.argv)
+
+        try:
+            optlist, args = getopt.getopt(sys.argv[1:], '',
+                                          ['project=', 'verbose=', 'grid_id=', 'use-running-dir=', 'nthreads='] )
+
+        except getopt.GetoptError:
+            self.Print(name,0,'%s' % sys.argv)
+            self.Print(name,0,'Errors arguments did not parse')
+            return 110
+
+        for key, val in optlist:
+
+            if key == '--project':
+                self.fProject = val
+            elif key == '--grid_id':
+                self.fGridIDList = val.split(',')
+            elif key == '--use-running-dir':
+                self.fUseRunningDir = int(val)
+            elif key == '--nthreads':
+                self.fNThreads = int(val)
+            elif key == '--verbose':
+                self.fVerbose = int(val)
+
+        self.fRunningDir   = 'tmp/'+self.fProject+'/grid_job_status';
+        self.fCompletedDir = 'tmp/'+self.fProject+'/completed_jobs'
+
+        self.Print(name,1,'Done')
+        return 0
+
+#------------------------------------------------------------------------------
+# returns resource usage of one segment, None if there is no log file
+#------------------------------------------------------------------------------
+    def harvest_segment(self,manifest,key):
+        logs = manifest.files(key,'*.log')
+        if (len(logs) != 1): return None
+
+        text = open(logs[0],errors='replace').read()
+
+        r            = log_harvester.parse_log(text)
+        r['segment'] = int(os.path.basename(key))
+        r['ok'     ] = 1 if log_harvester.log_ok(text) else 0
+        return r;
+
+#------------------------------------------------------------------------------
+# 'job': of grid_job.GridJob type
+#------------------------------------------------------------------------------
+    def harvest_logs(self,job):
+        name = 'harvest_logs'
+
+        topdir = job.grid_output_dir();
+        #------------------------------------------------------------------------------
+        # subdirectories like 00148.915da673 are not in the manifest
+        #------------------------------------------------------------------------------
+        manifest = outstage_manifest.OutstageManifest(self.fProject,job.id(),topdir)
+        keys     = manifest.segments()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,self.fNThreads)) as pool:
+            rows = [r for r in pool.map(lambda key: self.harvest_segment(manifest,key),keys) if r]
+
+        #------------------------------------------------------------------------------
+        # job settings are added to the header if the project configuration could be loaded
+        #------------------------------------------------------------------------------
+        settings = None
+        try:
+            config   = grid_job.project_config(job.project(),job.project()+'/datasets/'+job.family_id())
+            settings = config.fStage[job.stage()].job(job.input_dsid(),job.name())
+        except Exception as e:
+            self.Print(name,0,'WARNING: job settings not available: %s'%e)
+
+        fn = log_harvester.table_name(self.fProject,job.id())
+        log_harvester.write_table(fn,rows,log_harvester.make_header(job,settings))
+
+        nok = sum([r['ok'] for r in rows])
+        print('grid_id: %s N(logs): %i N(ok): %i written to %s'%(job.id(),len(rows),nok,fn))
+
+#------------------------------------------------------------------------------
+# main program
+#------------------------------------------------------------------------------
+if (__name__ == '__main__'):
+
+    x = HarvestLogs()
+    x.ParseParameters()
+
+    for item in x.fGridIDList:
+
+        grid_id = item.split('@')[0]
+
+        if (x.fUseRunningDir == 1): fn = x.fRunningDir  +'/'+grid_id;
+        else                      : fn = x.fCompletedDir+'/'+grid_id;
+
+        x.harvest_logs(grid_job.GridJob(fn))
+
+    sys.exit(0);
@@ -2,13 +2,53 @@
 # creates local list of output files produced by the job , places it into su2020/$dsid/catalog area
 # call: grim/scripts/list_pnfs_files.py --project=su2020 --grid_id=35469055
 # it is assumed that the current directory has a ".grid_status" file in it
+# each catalog is written together with its metadata, see dataset_catalog.py
 # see 
 #-------------------------------------------------------------------------------------------------
 
-import configparser, subprocess, shutil, json
+import configparser, subprocess, shutil, json, concurrent.futures
 import sys, string, getopt, glob, os, time, re, array
 
-import grid_job
+import grid_job, outstage_manifest, dataset_catalog, dir_walker
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+# route the output files into per-(odsid, extension) buckets in a single pass,
+# the dataset ID is the third field of the file name
+# files   : list of (fn,size,mtime,segment), see OutstageManifest.all_files
+# streams : list of (odsid,ext), one per catalog
+# returns a list of buckets - lists of (fn,size) - in the order of 'streams'
+#------------------------------------------------------------------------------
+def bucket_files(files,streams):
+    buckets = [[] for x in streams]
+    route   = {}
+    for (odsid, ext), bucket in zip(streams,buckets):
+        route.setdefault(odsid,[]).append(('.'+ext,bucket))
+
+    for fn, size, mtime, segment in files:
+        base   = os.path.basename(fn);
+        fields = base.split('.',3)
+        if (len(fields) < 4): continue
+
+        for suffix, bucket in route.get(fields[2],[]):
+            if (base.endswith(suffix)): bucket.append((fn,size))
+
+    return buckets
+
+#------------------------------------------------------------------------------
+# the old way: walk the outstage tree once per (odsid, extension). Used by the benchmark and the tests
+# subdirectories like 00148.915da673 are skipped
+#------------------------------------------------------------------------------
+def scan_files(topdir,streams):
+    buckets = []
+    for odsid, ext in streams:
+        bucket = []
+        for sd2 in glob.glob(topdir+'/*/*'):
+            if (len(os.path.basename(sd2).split('.')) > 1): continue
+            for fn in glob.glob(sd2+'/*.'+ext):
+                if (os.path.basename(fn).split('.')[2] == odsid): bucket.append((fn,os.path.getsize(fn)))
+        buckets.append(bucket)
+    return buckets
+
 #------------------------------------------------------------------------------
 class ListPnfsFiles:
 
@@ -26,6 +66,7 @@ class ListPnfsFiles:
         self.fRecoveryStep  = None;
         self.fFileset       = None;    # output fileset
         self.fConfig        = None
+        self.fChecksum      = 1          # 0: no checksums, 1: from dCache only, 2: also compute those not on /pnfs
 
         self.fOutputPath    = {}
         self.fOutputStreams = None
@@ -60,7 +101,7 @@ class ListPnfsFiles:
         try:
             optlist, args = getopt.getopt(sys.argv[1:], '',
                                           ['append=', 'project=', 'verbose=', 
-                                           'grid_id=', 'use-running-dir=' ] )
+                                           'grid_id=', 'use-running-dir=', 'checksum=' ] )
  
         except getopt.GetoptError:
             self.Print(name,0,'%s' % sys.argv)
@@ -80,6 +121,8 @@ class ListPnfsFiles:
                 self.Print(name,1,'self.fGridID=%s'%self.fGridID)
             elif key == '--use-running-dir':
                 self.fUseRunningDir = int(val)
+            elif key == '--checksum':
+                self.fChecksum = int(val)
             elif key == '--verbose':
                 self.fVerbose = int(val)
 
@@ -105,6 +148,16 @@ class ListPnfsFiles:
         job.fStageConfig   = job.fProjectConfig.fStage[job.stage_name()];
         job.fConfig        = job.fStageConfig.job(job.input_dsid(),job.name());
 #------------------------------------------------------------------------------
+# N(added/replaced/skipped), with --verbose=1 also the files
+#------------------------------------------------------------------------------
+    def print_merge_report(self,report):
+        print('added: %i replaced: %i skipped: %i'%(len(report['added']),len(report['replaced']),len(report['skipped'])))
+        if (self.fVerbose > 0):
+            for e in report['added']       : print('  added   :',e.path)
+            for e, f in report['replaced'] : print('  replaced:',e.path,'->',f.path)
+            for e in report['skipped']     : print('  skipped :',e.path)
+
+#------------------------------------------------------------------------------
 # list pnfs files
 #------------------------------------------------------------------------------
     def list_pnfs_files(self,job):
@@ -123,15 +176,21 @@ class ListPnfsFiles:
 
         self.Print(name,1,'ns=%i'%ns)
         #------------------------------------------------------------------------------
-        # loop over output streams
+        # the output directory is listed once for all streams and extensions
+        # subdirectories like 00148.915da673 are not in the manifest
+        manifest = outstage_manifest.OutstageManifest(self.fProject,job.id(),topdir)
+
+        #------------------------------------------------------------------------------
+        # one catalog per (output dataset ID, extension)
+        #------------------------------------------------------------------------------
+        catalogs = []
+        streams  = []
         for i in range(0,ns):
             odsid       = job.fConfig.fOutputDsID[i];
             # for each stream determine list of file extensions to be written
             extensions = job.fConfig.fOutputFormat[i].split(':')
 
-            # loop over extensions
             for ext in extensions:
-
                 # maintain backward compatibility
                 # 'fileset' catalogs have '#{fileset_name}' appended (use Ruby notations :))
                 # catalog_fn  = catalog_dir+'/'+job.fConfig.fOutputFnPattern[i]+'.'+self.fProject+'.'+ext+'.files'
@@ -140,62 +199,112 @@ class ListPnfsFiles:
                 if (job.fileset()): catalog_fn  = catalog_fn+'.'+job.fileset();
     
                 print('i, odsid, catalog_fn=',i,odsid,catalog_fn)
+
+                catalogs.append(catalog_fn)
+                streams.append((odsid,ext))
+
+        all_files = manifest.all_files()
+        present   = set([fn for fn, size, mtime, segment in all_files])
+        buckets   = zip(catalogs,bucket_files(all_files,streams))
+        #------------------------------------------------------------------------------
+        # per-file metadata: the art.json file written by the job, if any, and the checksum.
+        # each file costs a couple of NFS reads, those are done in parallel
+        #------------------------------------------------------------------------------
+        def make_entry(item):
+            fn, size = item
+            json_fn  = fn+'.json' if (fn+'.json' in present) else None
+            return dataset_catalog.make_entry(fn,size,json_fn,self.fChecksum)
+
+        nthreads, rate = dir_walker.project_settings(self.fProject)
+        #------------------------------------------------------------------------------
+        # catalog files, one per stream and extension
+        #------------------------------------------------------------------------------
+        for catalog_fn, list_of_files in buckets:
     
-                list_of_files = []
-                list_of_dirs = glob.glob(topdir+'/*')
-    
-                self.Print(name,1,'list_of_dirs:%s'%format(list_of_dirs));
-    
-                for sd1 in list_of_dirs:
-    
-                    list_d1 = glob.glob(sd1+'/*')
-    
-                    for sd2 in list_d1 :
-                        self.Print(name,1,'sd2=%s'%sd2);
-                        #------------------------------------------------------------------------------
-                        # skip subdirectories like 00148.915da673
-                        dbn = os.path.basename(sd2);
-                        if (len(dbn.split('.')) == 1) :
-                            for fn in glob.glob(sd2+'/*.'+ext) : 
-                                base = os.path.basename(fn);
-                                od   = base.split('.')[2]
-                                self.Print(name,1,'base, od, odsid: %s %s %s'%(base,od,odsid))
-                                if (od == odsid) : 
-                                    list_of_files.append(fn)
-                #------------------------------------------------------------------------------
-                # catalog file for a given stream
-    
-                self.Print(name,1,'>>> list_of_files:%s'%format(list_of_files));
+            list_of_files.sort()
+            self.Print(name,1,'>>> list_of_files:%s'%format([fn for fn, size in list_of_files]));
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=nthreads) as pool:
+                entries = dataset_catalog.sort_entries(pool.map(make_entry,list_of_files))
     
-                if (os.path.exists(catalog_fn)): 
-                    if (self.fAppend == None):
-                        print('WARNING : catalog file %s exists, RECREATE!'%catalog_fn);
-                        os.remove(catalog_fn);
-                        f = open(catalog_fn,'w')
-                    else:
-                        print('WARNING : catalog file %s exists, APPEND!'%catalog_fn);
-                        f = open(catalog_fn,'a')
+            if (os.path.exists(catalog_fn)): 
+                if (self.fAppend == None):
+                    print('WARNING : catalog file %s exists, RECREATE!'%catalog_fn);
                 else:
-                    f = open(catalog_fn,'w')
+                    #------------------------------------------------------------------------------
+                    # merge, a subrun already in the catalog is replaced only by the output
+                    # of a more recent grid job, so rerunning or appending a recovery job is safe
+                    #------------------------------------------------------------------------------
+                    print('WARNING : catalog file %s exists, APPEND!'%catalog_fn);
+                    entries, report = dataset_catalog.merge(dataset_catalog.load(catalog_fn),entries)
+                    self.print_merge_report(report)
 
-                list_of_files.sort()
-                for fn in list_of_files:
-                    f.write(fn+'\n');
-                f.close();
-                #-------------------------------------------------------------------------------------
-                # print catalog, just for debugging
-                print('close catalog_fn:',catalog_fn)
+            dataset_catalog.write(catalog_fn,entries)
+            #-------------------------------------------------------------------------------------
+            # print catalog, just for debugging
+            print('close catalog_fn:',catalog_fn)
 
         #------------------------------------------------------------------------------
         # done, update the job status
         #------------------------------------------------------------------------------
         job.fStatus |= grid_job.kListPnfsFilesBit;
                 
+#------------------------------------------------------------------------------
+# benchmark: grim/scripts/list_pnfs_files.py --benchmark=10000 [--nthreads=1,8]
+# builds a synthetic outstage tree with N segments, 3 output streams x 2 formats and a log file per segment,
+# and compares the walk per stream and format with listing the tree once (the manifest, built from scratch)
+# and bucketing the files in one pass. Both should give the same buckets. Everything happens
+# in a temporary directory, which is removed at the end
+#------------------------------------------------------------------------------
+def benchmark(nsegments,nthreads_list):
+    import tempfile
+
+    cwd     = os.getcwd()
+    tmpdir  = tempfile.mkdtemp()
+    topdir  = tmpdir+'/outstage/1001'
+    streams = [(odsid,ext) for odsid in ['fam0s11b0','fam0s21b0','fam0s31b0'] for ext in ['art','root']]
+
+    t0      = time.time()
+    for i in range(0,nsegments):
+        d = topdir+'/%02i/%05i'%(i//100000,i)
+        os.makedirs(d)
+        open(d+'/user.%05i.log'%i,'w').write('x')
+        for odsid, ext in streams:
+            open(d+'/sim.user.%s.bench.001000_%08i.%s'%(odsid,i,ext),'w').write('x')
+    print('N(segments): %i, N(files): %i, created in %.2f s'%(nsegments,nsegments*(1+len(streams)),time.time()-t0))
+    try:
+        os.chdir(tmpdir)
+
+        t0  = time.time()
+        ref = scan_files(topdir,streams)
+        print('%-34s %8.2f s  N(files): %i'%('walk per stream/format',time.time()-t0,sum([len(b) for b in ref])))
+
+        for nthreads in nthreads_list:
+            open('.grid_config','w').write('bench.walk_threads %i\n'%nthreads)
+            if (os.path.exists('tmp')): shutil.rmtree('tmp')
+            t0      = time.time()
+            m       = outstage_manifest.OutstageManifest('bench','1001',topdir)
+            buckets = bucket_files(m.all_files(),streams)
+            dt      = time.time()-t0
+            same    = [sorted(b) for b in buckets] == [sorted(b) for b in ref]
+            print('%-34s %8.2f s  N(files): %i same buckets: %s'%('one pass, nthreads=%i'%nthreads,dt,
+                                                                  sum([len(b) for b in buckets]),same))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
 #------------------------------------------------------------------------------
 # main program, just make a GridSubmit instance and call its methods
 #------------------------------------------------------------------------------
 if (__name__ == '__main__'):
 
+    if ((len(sys.argv) > 1) and sys.argv[1].startswith('--benchmark=')):
+        optlist, args = getopt.getopt(sys.argv[1:],'',['benchmark=','nthreads='])
+        opts          = dict(optlist)
+        nthreads      = [int(x) for x in opts.get('--nthreads','1,8').split(',')]
+        benchmark(int(opts['--benchmark']),nthreads)
+        sys.exit(0)
+
     x = ListPnfsFiles()
     x.ParseParameters()
     
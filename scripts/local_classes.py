@@ -5,9 +5,12 @@ import os, subprocess;
 #------------------------------------------------------------------------------
 class Fileset:
 
-    def __init__(self, dsid, defname):
+    def __init__(self, dsid, defname, catalog = 'sam'):
         self.fID                      = dsid
-        self.fDefName                = defname     # SAM dataset definition
+        self.fDefName                = defname     # SAM dataset definition or, for local catalogs, the catalog file
+        self.fDimensions             = None
+
+        if (catalog == 'local'): return
 
         cmd = 'setup dhtools; samweb describe-definition '+self.fDefName+' | grep Dimensions:';
         p   = subprocess.run(cmd,shell=True,capture_output=True,universal_newlines=True);
@@ -35,7 +38,7 @@ class Dataset:
         self.fCatalog                 = catalog;    # 'sam' or 'local'
 
     def add_fileset(self,id,defname):
-        self.fFileset[id] = Fileset(id,defname)
+        self.fFileset[id] = Fileset(id,defname,self.fCatalog)
 
     def catalog(self):
         return self.fCatalog;
@@ -83,6 +86,7 @@ class Job:
         self.fMaxSegments             = 500
         self.fNEventsPerSegment       = 10
         self.fResample                = 'no'   # yes/no
+        self.fExactEventCount         = None   # output streams (indices) expected to have exactly fNEventsPerSegment events, None: [0]
         self.fMaxMemory               = '2000MB'
         self.fRequestedTime           = '12h'
         self.fIfdh                    = 'xrootd' # ifdh/xrootd
@@ -93,6 +97,7 @@ class Job:
         self.fGridID                  = None;
         self.fVerbose                 = None;
         self.fCompletedStatus         = None;
+        self.fRetryPolicy             = None;   # see retry_policy.py, None: default policy
 
         pattern = self.fStage.fProject.fProjectName+'.grid_output_dir';
 
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# packed log files of a grid job: one archive per job instead of thousands of small files
+#
+# $log_dir/$dsid.$stage_$job[/$fileset]/$grid_id.logs.gz     : log files, each compressed as a separate gzip member
+# $log_dir/$dsid.$stage_$job[/$fileset]/$grid_id.logs.gz.idx : JSON index,
+#                                          segment ('00/00012') -> [name, offset, length, size, mtime]
+#
+# one log is extracted by seeking to its member, 'zcat $grid_id.logs.gz' prints all of them.
+# The archive is append-only: a log which changed is appended again, and the index points to the new copy
+#
+# call: grim/scripts/log_archive.py --project=su2020 --grid_id=35469055 --segment=12   : print log of segment 12
+#       grim/scripts/log_archive.py --project=su2020 --grid_id=35469055 --list=1       : list archived logs
+#------------------------------------------------------------------------------
+
+import sys, getopt, os, time, json, zlib, fcntl, concurrent.futures
+
+import grid_job
+
+def archive_name(odir,grid_id):
+    return odir+'/'+str(grid_id)+'.logs.gz';
+
+def index_name(archive):
+    return archive+'.idx';
+
+def lock_name(archive):
+    return archive+'.lock';
+
+def read_index(archive):
+    fn = index_name(archive)
+    if (not os.path.exists(fn)): return {}
+    return json.loads(open(fn).read())['members'];
+
+def write_index(archive,members):
+    fn     = index_name(archive)
+    fn_new = fn+'.tmp'
+    f      = open(fn_new,'w')
+    f.write(json.dumps({'archive':os.path.basename(archive), 'members':members}))
+    f.close()
+    os.replace(fn_new,fn)
+
+def gzip_bytes(data):
+    c = zlib.compressobj(6,zlib.DEFLATED,31)
+    return c.compress(data)+c.flush();
+
+#------------------------------------------------------------------------------
+# files: list of (segment, path, size, mtime), files with unchanged size and mtime are skipped
+# returns (number of files, number of bytes) added
+# writers of the same archive serialize on $grid_id.logs.gz.lock, the index is read under the lock
+#------------------------------------------------------------------------------
+def add_files(archive,files,nthreads=8):
+    with open(lock_name(archive),'a') as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        return append_files(archive,files,nthreads);
+
+def append_files(archive,files,nthreads):
+    members = read_index(archive)
+    todo    = []
+    for segment, path, size, mtime in files:
+        m = members.get(segment)
+        if (m and (m[0] == os.path.basename(path)) and (m[3] == size) and (int(m[4]) == int(mtime))): continue
+        todo.append((segment,path,size,mtime))
+
+    if (len(todo) == 0): return 0, 0
+    #------------------------------------------------------------------------------
+    # read and compress in parallel, zlib releases the GIL. Write sequentially, in order
+    #------------------------------------------------------------------------------
+    def pack(item):
+        segment, path, size, mtime = item
+        data = open(path,'rb').read()
+        return gzip_bytes(data), len(data)
+
+    nbytes = 0
+    with open(archive,'ab') as f, concurrent.futures.ThreadPoolExecutor(max_workers=max(1,nthreads)) as pool:
+        offset = f.tell()
+        for (segment, path, size, mtime), (data, n) in zip(todo,pool.map(pack,todo)):
+            f.write(data)
+            members[segment] = [os.path.basename(path),offset,len(data),n,mtime]
+            offset          += len(data)
+            nbytes          += n
+
+    write_index(archive,members)
+    return len(todo), nbytes;
+
+#------------------------------------------------------------------------------
+# returns the log of one segment as bytes, None if it is not in the archive
+#------------------------------------------------------------------------------
+def read_member(archive,segment,members=None):
+    if (members == None): members = read_index(archive)
+    m = members.get(segment)
+    if (m == None): return None
+
+    name, offset, length, size, mtime = m
+    with open(archive,'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    return zlib.decompress(data,31);
+
+#------------------------------------------------------------------------------
+# segment: either '00/00012' or just the segment number, which should identify one key of 'members'.
+# returns the key, None (after printing an error) if the segment number is ambiguous or not a number
+#------------------------------------------------------------------------------
+def find_segment(segment,members):
+    if ('/' in segment): return segment
+
+    if (not segment.isdigit()):
+        print('ERROR: segment should be either a number or like 00/00012, got: '+segment)
+        return None
+
+    keys = sorted([k for k in members.keys() if k.split('/')[-1] == '%05i'%int(segment)])
+    if (len(keys) > 1):
+        print('ERROR: segment %s is ambiguous, use one of: %s'%(segment,' '.join(keys)))
+        return None
+
+    return keys[0] if keys else segment;
+
+#------------------------------------------------------------------------------
+class LogArchive:
+
+    def __init__(self):
+        self.fProject       = None
+        self.fGridID        = None
+        self.fSegment       = None
+        self.fList          = None
+        self.fVerbose       = 0
+
+        self.fRunningDir    = None;
+        self.fCompletedDir  = None;
+# ---------------------------------------------------------------------
+    def Print(self,Name,level,Message):
+        if(level>self.fVerbose): return 0;
+        now     = time.strftime('%Y/%m/%d %H:%M:%S',time.localtime(time.time()))
+        message = now+' [ LogArchive::'+Name+' ] '+Message
+        print(message)
+
+#------------------------------------------------------------------------------
+    def ParseParameters(self):
+        name = 'ParseParameters'
+
+        self.Print(name,2,'Starting')
+        self.Print(name,2, '%s' % sys.argv)
+
+        try:
+            optlist, args = getopt.getopt(sys.argv[1:], '',
+                                          ['project=', 'verbose=', 'grid_id=', 'segment=', 'list='] )
+
+        except getopt.GetoptError:
+            self.Print(name,0,'%s' % sys.argv)
+            self.Print(name,0,'Errors arguments did not parse')
+            return 110
+
+        for key, val in optlist:
+
+            if key == '--project':
+                self.fProject = val
+            elif key == '--grid_id':
+                self.fGridID = val.split('@')[0]
+            elif key == '--segment':
+                self.fSegment = val
+            elif key == '--list':
+                self.fList = int(val)
+            elif key == '--verbose':
+                self.fVerbose = int(val)
+
+        if ((self.fProject == None) or (self.fGridID == None) or ((self.fSegment == None) and (not self.fList))):
+            self.Print(name,0,'ERROR: --project, --grid_id and either --segment or --list=1 need to be defined')
+            self.Print(name,0,'usage: log_archive.py --project=su2020 --grid_id=35469055 [--segment=12 | --list=1]')
+            return 111
+
+        self.fRunningDir   = 'tmp/'+self.fProject+'/grid_job_status';
+        self.fCompletedDir = 'tmp/'+self.fProject+'/completed_jobs'
+
+        self.Print(name,1,'Done')
+        return 0
+
+#------------------------------------------------------------------------------
+# the job status file is either in the 'completed' or in the 'running' directory
+#------------------------------------------------------------------------------
+    def archive(self):
+        fn = self.fCompletedDir+'/'+self.fGridID
+        if (not os.path.exists(fn)): fn = self.fRunningDir+'/'+self.fGridID
+
+        job  = grid_job.GridJob(fn)
+        odir = job.log_dir()
+        if (job.fileset()): odir = odir+'/'+job.fileset()
+
+        return archive_name(odir,job.id());
+
+    def show(self):
+        archive = self.archive()
+        members = read_index(archive)
+
+        if (self.fList):
+            for segment in sorted(members.keys()):
+                name, offset, length, size, mtime = members[segment]
+                print('%-10s %-50s %10i %10i'%(segment,name,size,length))
+            return 0
+
+        segment = find_segment(self.fSegment,members)
+        if (segment == None): return 1
+
+        data    = read_member(archive,segment,members)
+        if (data == None):
+            self.Print('show',0,'ERROR: no log for segment %s in %s'%(segment,archive))
+            return 1
+
+        sys.stdout.write(data.decode(errors='replace'))
+        return 0
+
+#------------------------------------------------------------------------------
+# main program
+#------------------------------------------------------------------------------
+if (__name__ == '__main__'):
+
+    x  = LogArchive()
+    rc = x.ParseParameters()
+    if (rc == 0): rc = x.show()
+
+    sys.exit(rc);
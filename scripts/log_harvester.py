@@ -0,0 +1,142 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# extract per-segment resource usage from mu2egrid/art log files:
+#
+#   wall, cpu : 'TimeReport CPU = xxx Real = yyy'  [sec]
+#   vmpeak,rss: 'MemReport  VmPeak = xxx VmHWM = yyy' [MB]
+#   nevents   : 'TrigReport Events total = N ...'
+#   host      : node_name from 'poms_data', or 'Starting on host xxx'
+#   read_mb   : input read volume, if reported ('... bytes read = N'), [MB]. The counter is cumulative,
+#               the last reported value (the end-of-job summary) is taken
+#
+# numbers which are not found in a log are stored as NaN
+#
+# per grid job results are stored as a columnar table in tmp/$project/resources/$grid_id.cols :
+# a zip file with one member per column (float64 arrays or newline-separated strings)
+# and a 'header' member with the column names and the job metadata
+#------------------------------------------------------------------------------
+
+import os, re, json, math, array, zipfile
+
+kNaN = float('nan')
+
+FloatColumns  = ['segment','ok','wall','cpu','vmpeak','rss','nevents','read_mb']
+StringColumns = ['host']
+
+_rx_time   = re.compile(r'TimeReport CPU = ([\d.eE+-]+) Real = ([\d.eE+-]+)')
+_rx_mem    = re.compile(r'MemReport\s+VmPeak = ([\d.eE+-]+) VmHWM = ([\d.eE+-]+)')
+_rx_events = re.compile(r'TrigReport Events total = (\d+)')
+_rx_node   = re.compile(r'node_name"?\s*[:=]\s*"?([\w.-]+)')
+_rx_host   = re.compile(r'Starting on host (\S+)')
+_rx_read   = re.compile(r'[Bb]ytes read\s*[=:]\s*(\d+)')
+
+#------------------------------------------------------------------------------
+# returns dictionary with the resource usage found in 'text'
+#------------------------------------------------------------------------------
+def parse_log(text):
+    r = {'wall':kNaN, 'cpu':kNaN, 'vmpeak':kNaN, 'rss':kNaN, 'nevents':kNaN, 'read_mb':kNaN, 'host':''}
+
+    m = _rx_time.search(text)
+    if (m):
+        r['cpu' ] = float(m.group(1))
+        r['wall'] = float(m.group(2))
+
+    m = _rx_mem.search(text)
+    if (m):
+        r['vmpeak'] = float(m.group(1))
+        r['rss'   ] = float(m.group(2))
+
+    m = _rx_events.search(text)
+    if (m): r['nevents'] = float(m.group(1))
+
+    m = _rx_node.search(text)
+    if (m):
+        # node names look like 'murat-15514434-0-fnpc7008.fnal.gov'
+        r['host'] = m.group(1).split('-')[-1]
+    else:
+        m = _rx_host.search(text)
+        if (m): r['host'] = m.group(1)
+
+    nbytes = _rx_read.findall(text)
+    if (len(nbytes) > 0): r['read_mb'] = int(nbytes[-1])/1.e6
+
+    return r;
+
+#------------------------------------------------------------------------------
+# segment status from the log alone: both art and mu2egrid return codes should be 0
+#------------------------------------------------------------------------------
+_rx_art_rc  = re.compile(r'Art has completed and will exit with status (\d+)')
+_rx_grid_rc = re.compile(r'mu2egrid exit status (\d+)')
+
+def log_ok(text):
+    m1 = _rx_art_rc.search(text)
+    m2 = _rx_grid_rc.search(text)
+    return (m1 != None) and (m1.group(1) == '0') and (m2 != None) and (m2.group(1) == '0')
+
+#------------------------------------------------------------------------------
+# table header: the grid job and, if known, the job settings the segments ran with
+# gj : grid_job.GridJob, job: local_classes.Job
+#------------------------------------------------------------------------------
+def make_header(gj,job=None):
+    h = { 'grid_id'  : gj.id(),
+          'project'  : gj.project(),
+          'family_id': gj.family_id(),
+          'dsid'     : gj.input_dsid(),
+          'stage'    : gj.stage(),
+          'job'      : gj.name(),
+          'recover'  : gj.recover() }
+
+    if (job):
+        h['max_memory'         ] = job.fMaxMemory
+        h['requested_time'     ] = job.fRequestedTime
+        h['nevents_per_segment'] = job.fNEventsPerSegment
+        h['max_input_files'    ] = job.fMaxInputFilesPerSegment
+
+    return h;
+
+def table_name(project,grid_id):
+    return 'tmp/'+project+'/resources/'+grid_id+'.cols';
+
+#------------------------------------------------------------------------------
+# rows   : list of dictionaries, one per segment, with all FloatColumns and StringColumns keys
+# header : job metadata
+#------------------------------------------------------------------------------
+def write_table(fn,rows,header):
+    dirname = os.path.dirname(fn)
+    if (dirname and (not os.path.exists(dirname))): os.makedirs(dirname,exist_ok=True)
+
+    rows = sorted(rows,key=lambda r: r['segment'])
+
+    h            = dict(header)
+    h['columns'] = FloatColumns+StringColumns
+    h['nrows'  ] = len(rows)
+
+    fn_new = fn+'.tmp'
+    z      = zipfile.ZipFile(fn_new,'w',zipfile.ZIP_DEFLATED)
+    z.writestr('header',json.dumps(h))
+    for col in FloatColumns:
+        z.writestr(col+'.f8',array.array('d',[float(r[col]) for r in rows]).tobytes())
+    for col in StringColumns:
+        z.writestr(col+'.str','\n'.join([r[col] for r in rows]))
+    z.close()
+    os.replace(fn_new,fn)
+
+#------------------------------------------------------------------------------
+# returns (header, columns), columns[name] is an array('d') or a list of strings
+#------------------------------------------------------------------------------
+def read_table(fn):
+    z       = zipfile.ZipFile(fn,'r')
+    header  = json.loads(z.read('header'))
+    columns = {}
+    for col in FloatColumns:
+        a = array.array('d')
+        a.frombytes(z.read(col+'.f8'))
+        columns[col] = a
+    for col in StringColumns:
+        data = z.read(col+'.str').decode()
+        columns[col] = data.split('\n') if (header['nrows'] > 0) else []
+    z.close()
+    return header, columns;
+
+def is_nan(x):
+    return math.isnan(x)
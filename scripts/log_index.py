@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# searchable index of the archived log files of all grid jobs of a project
+#
+# call: grim/scripts/log_index.py --project=su2020 --update=1                  : index new and changed logs
+#       grim/scripts/log_index.py --project=su2020 --query="FileOpenError"    : find lines with all the terms
+#                                 [--grid_id=35469055[,xxxxxx]] [--max=50]
+#
+# only the "key" lines of a log are indexed: errors, warnings, exceptions, art exception headers
+# (---- ProductNotFound BEGIN), exit/return codes. A term is a word of such a line, lower case;
+# C++ qualified names are also split: 'art::Exception' gives 'art::exception', 'art' and 'exception'
+#
+# logs are read from the archives written by 'copy_log_files.py --archive=1', from the deduplicated
+# store written by 'copy_log_files.py --dedup=1' or, if copied as separate files, from the log directory,
+# of the jobs in tmp/$project/completed_jobs and tmp/$project/grid_job_status.
+# The index, tmp/$project/log_index.db , is an sqlite3 database.
+# Updates are incremental: a log is indexed again only if its archive index points to a new copy of it
+# (for the deduplicated logs: if its list of chunks has changed, for separate files: if its mtime has changed)
+#------------------------------------------------------------------------------
+
+import sys, getopt, glob, os, re, time, zlib, sqlite3
+
+import grid_job, log_archive, log_store, outstage_manifest
+
+KeyLine = re.compile(r'error|warning|exception|fatal|abort|segmentation|sigsegv|^---- \w+ BEGIN|'
+                     r'exit status|exit with status|return code|\brc\s*=',re.IGNORECASE)
+Token   = re.compile(r'[a-z_][\w]*(?:::[a-z_]\w*)*|\d+')
+
+Schema  = ['CREATE TABLE IF NOT EXISTS members     (grid_id INTEGER, segment TEXT, offset INTEGER, PRIMARY KEY (grid_id, segment))',
+           'CREATE TABLE IF NOT EXISTS texts       (id INTEGER PRIMARY KEY, text TEXT UNIQUE)',
+           'CREATE TABLE IF NOT EXISTS postings    (term TEXT, text_id INTEGER, PRIMARY KEY (term, text_id)) WITHOUT ROWID',
+           'CREATE TABLE IF NOT EXISTS occurrences (text_id INTEGER, grid_id INTEGER, segment TEXT, line INTEGER)',
+           'CREATE INDEX IF NOT EXISTS occurrences_text   ON occurrences (text_id)',
+           'CREATE INDEX IF NOT EXISTS occurrences_member ON occurrences (grid_id, segment)']
+
+def terms(line):
+    res = set()
+    for t in Token.findall(line.lower()):
+        if (len(t) < 2): continue
+        res.add(t)
+        if ('::' in t): res.update([x for x in t.split('::') if len(x) > 1])
+    return res;
+
+#------------------------------------------------------------------------------
+# logs copied one by one into the log directory 'odir': file name -> [path, mtime].
+# Recovery jobs share the log directory, a log belongs to the grid job which outstage manifest
+# has a file with the same name and mtime (copy_log_files.py keeps the mtime).
+# Without the manifest, all logs of the directory are taken
+#------------------------------------------------------------------------------
+def loose_logs(project,grid_id,odir):
+    res = {}
+    for fn in glob.glob(odir+'/*.log'):
+        res[os.path.basename(fn)] = [fn,int(os.stat(fn).st_mtime)]
+
+    segments = outstage_manifest.stored_segments(project,grid_id)
+    if (segments == None): return res
+
+    own = set([(name,int(mtime)) for files in segments.values() for name, size, mtime in files])
+    return {name : v for name, v in res.items() if ((name,v[1]) in own)};
+
+#------------------------------------------------------------------------------
+class LogIndex:
+
+    def __init__(self):
+        self.fProject       = None
+        self.fUpdate        = None
+        self.fQuery         = None
+        self.fGridIDList    = None
+        self.fMax           = 50
+        self.fVerbose       = 0
+
+        self.fRunningDir    = None;
+        self.fCompletedDir  = None;
+        self.fDb            = None
+# ---------------------------------------------------------------------
+    def Print(self,Name,level,Message):
+        if(level>self.fVerbose): return 0;
+        now     = time.strftime('%Y/%m/%d %H:%M:%S',time.localtime(time.time()))
+        message = now+' [ LogIndex::'+Name+' ] '+Message
+        print(message)
+
+#------------------------------------------------------------------------------
+    def ParseParameters(self):
+        name = 'ParseParameters'
+
+        self.Print(name,2,'Starting')
+        self.Print(name,2, '%s' % sys.argv)
+
+        try:
+            optlist, args = getopt.getopt(sys.argv[1:], '',
+                                          ['project=', 'verbose=', 'update=', 'query=', 'grid_id=', 'max='] )
+
+        except getopt.GetoptError:
+            self.Print(name,0,'%s' % sys.argv)
+            self.Print(name,0,'Errors arguments did not parse')
+            return 110
+
+        for key, val in optlist:
+
+            if key == '--project':
+                self.fProject = val
+            elif key == '--update':
+                self.fUpdate = int(val)
+            elif key == '--query':
+                self.fQuery = val
+            elif key == '--grid_id':
+                self.fGridIDList = [int(x.split('@')[0]) for x in val.split(',')]
+            elif key == '--max':
+                self.fMax = int(val)
+            elif key == '--verbose':
+                self.fVerbose = int(val)
+
+        self.fRunningDir   = 'tmp/'+self.fProject+'/grid_job_status';
+        self.fCompletedDir = 'tmp/'+self.fProject+'/completed_jobs'
+
+        self.Print(name,1,'Done')
+        return 0
+
+#------------------------------------------------------------------------------
+    def open_db(self):
+        fn = 'tmp/'+self.fProject+'/log_index.db'
+        if (not os.path.exists(os.path.dirname(fn))): os.makedirs(os.path.dirname(fn),exist_ok=True)
+
+        self.fDb = sqlite3.connect(fn)
+        for statement in Schema: self.fDb.execute(statement)
+
+#------------------------------------------------------------------------------
+# index key lines of one log, the previous version of it, if any, is dropped
+#------------------------------------------------------------------------------
+    def index_log(self,grid_id,segment,text):
+        db = self.fDb
+        db.execute('DELETE FROM occurrences WHERE grid_id=? AND segment=?',(grid_id,segment))
+
+        nlines = 0
+        for i, line in enumerate(text.splitlines()):
+            if (not KeyLine.search(line)): continue
+            line = line.strip()[:300]
+
+            row = db.execute('SELECT id FROM texts WHERE text=?',(line,)).fetchone()
+            if (row == None):
+                text_id = db.execute('INSERT INTO texts (text) VALUES (?)',(line,)).lastrowid
+                db.executemany('INSERT OR IGNORE INTO postings VALUES (?,?)',[(t,text_id) for t in terms(line)])
+            else:
+                text_id = row[0]
+
+            db.execute('INSERT INTO occurrences VALUES (?,?,?,?)',(text_id,grid_id,segment,i+1))
+            nlines += 1
+        return nlines;
+
+#------------------------------------------------------------------------------
+# logs of all known jobs, returns list of (grid_id, kind, fn, store)
+# kind 'archive': fn is the archive, 'dedup': fn is the recipe of the deduplicated logs and store
+# is their ChunkStore, 'files': jobs which logs have been copied, but neither archived nor deduplicated,
+# have their logs as separate files in the log directory fn
+#------------------------------------------------------------------------------
+    def archives(self):
+        res       = []
+        stores    = {}
+        for fn in sorted(glob.glob(self.fCompletedDir+'/*')+glob.glob(self.fRunningDir+'/*')):
+            grid_id = os.path.basename(fn)
+            if (not grid_id.isdigit()): continue
+
+            job  = grid_job.GridJob(fn)
+            odir = job.log_dir()
+            if (job.fileset()): odir = odir+'/'+job.fileset()
+
+            archive = log_archive.archive_name(odir,grid_id)
+            recipe  = log_store.recipe_name(odir,grid_id)
+            if (os.path.exists(archive)):
+                res.append((int(grid_id),'archive',archive,None))
+            elif (os.path.exists(recipe)):
+                sdir = log_store.store_dir(job)
+                if (sdir not in stores): stores[sdir] = log_store.ChunkStore(sdir)
+                res.append((int(grid_id),'dedup',recipe,stores[sdir]))
+            elif (job.fStatus & grid_job.kLogsCopiedBit):
+                res.append((int(grid_id),'files',odir,None))
+        return res;
+
+#------------------------------------------------------------------------------
+# 'offset' identifies the indexed copy of a log: its offset in the archive, for the deduplicated logs -
+# checksum of the list of its chunks, for separate files - the mtime. Separate files are indexed
+# with their file names in place of the segment names.
+# returns 1 if no logs were found for a job which logs have been copied
+#------------------------------------------------------------------------------
+    def update(self):
+        name = 'update'
+
+        t0      = time.time()
+        nlogs   = 0
+        nlines  = 0
+        missing = []
+        for grid_id, kind, fn, store in self.archives():
+            if   (kind == 'archive'): members = log_archive.read_index(fn)
+            elif (kind == 'dedup'  ): members = log_store.read_recipe(fn)
+            else                    : members = loose_logs(self.fProject,grid_id,fn)
+
+            if (len(members) == 0):
+                missing.append(str(grid_id))
+                continue
+            indexed = dict(self.fDb.execute('SELECT segment, offset FROM members WHERE grid_id=?',(grid_id,)).fetchall())
+
+            for segment in sorted(members.keys()):
+                if   (kind == 'archive'): offset = members[segment][1]
+                elif (kind == 'dedup'  ): offset = zlib.crc32(''.join(members[segment][3]).encode())
+                else                    : offset = members[segment][1]
+                if (indexed.get(segment) == offset): continue
+
+                if   (kind == 'archive'): data = log_archive.read_member(fn,segment,members)
+                elif (kind == 'dedup'  ): data = log_store.read_member(store,fn,segment,members)
+                else                    : data = open(members[segment][0],'rb').read()
+
+                nlines += self.index_log(grid_id,segment,data.decode(errors='replace'))
+                nlogs  += 1
+                self.fDb.execute('INSERT OR REPLACE INTO members VALUES (?,?,?)',(grid_id,segment,offset))
+
+            self.fDb.commit()
+            self.Print(name,1,'grid_id: %i done'%grid_id)
+
+        print('indexed N(logs): %i N(lines): %i in %.1f s'%(nlogs,nlines,time.time()-t0))
+
+        if (len(missing) > 0):
+            self.Print(name,0,'ERROR: logs of %i grid jobs have been copied, but are not found: %s'%
+                       (len(missing),','.join(missing)))
+            return 1
+        return 0
+
+#------------------------------------------------------------------------------
+# lines which have all the terms of the query
+#------------------------------------------------------------------------------
+    def query(self):
+        t0    = time.time()
+        words = set()
+        for w in self.fQuery.split(): words.update(terms(w) if ('::' not in w) else [w.lower()])
+        if (len(words) == 0): return 0
+
+        sql  = ('SELECT o.grid_id, o.segment, o.line, t.text FROM occurrences o JOIN texts t ON t.id = o.text_id '+
+                'WHERE o.text_id IN ('+' INTERSECT '.join(['SELECT text_id FROM postings WHERE term=?']*len(words))+')')
+        pars = sorted(words)
+        if (self.fGridIDList):
+            sql  += ' AND o.grid_id IN ('+','.join(['?']*len(self.fGridIDList))+')'
+            pars += self.fGridIDList
+        sql += ' ORDER BY o.grid_id, o.segment, o.line LIMIT ?'
+        pars.append(self.fMax)
+
+        rows = self.fDb.execute(sql,pars).fetchall()
+        for grid_id, segment, line, text in rows:
+            print('%10i %-9s %6i : %s'%(grid_id,segment,line,text))
+        print('N(lines): %i%s in %.3f s'%(len(rows),' (--max reached)' if len(rows) == self.fMax else '',time.time()-t0))
+        return 0
+
+#------------------------------------------------------------------------------
+# main program
+#------------------------------------------------------------------------------
+if (__name__ == '__main__'):
+
+    x  = LogIndex()
+    rc = x.ParseParameters()
+    if (rc == 0):
+        x.open_db()
+        if (x.fUpdate): rc = x.update()
+        if (x.fQuery ): rc = max(rc,x.query())
+
+    sys.exit(rc);
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# content-deduplicated storage of the log files of grid jobs
+#
+# a mu2egrid log embeds the expanded FCL and the environment of the job, which are the same for all segments.
+# A log is split into chunks at content-defined boundaries, each unique chunk is stored once,
+# the log is kept as a list of chunk hashes and reassembled on demand
+#
+# $log_dir/chunks/chunks.pack                          : unique chunks, each compressed separately, append-only
+# $log_dir/chunks/chunks.idx                           : binary index, N x (sha1, offset, length, size)  (20s Q I I)
+# $log_dir/$dsid.$stage_$job[/$fileset]/$grid_id.logs.dedup : JSON, segment ('00/00012') ->
+#                                                        [name, size, mtime, [sha1 of the chunks]]
+#
+# chunks end at line boundaries: after a line which crc32 has the lowest kBits bits equal to zero, so the
+# boundaries depend only on the local content and an inserted or modified line doesn't shift the rest.
+# The chunks are at least kMinSize and at most kMaxSize bytes long
+#
+# the store is shared by all jobs of the project. Writers take an exclusive lock on $log_dir/chunks/lock
+# and, under the lock, first read the index records added by the other writers.
+# The pack is written before the index, and the index before the job recipe, so an interrupted
+# copy leaves at most unreferenced chunks behind. A partially written last index record left by
+# an interrupted copy is truncated by the next writer
+#
+# call: grim/scripts/log_store.py --project=su2020 --grid_id=35469055 --segment=12   : print log of segment 12
+#       grim/scripts/log_store.py --project=su2020 --report=1 [--grid_id=35469055,...] : deduplication ratio per job
+#------------------------------------------------------------------------------
+
+import sys, getopt, glob, os, time, json, zlib, hashlib, struct, fcntl, concurrent.futures
+
+import grid_job, log_archive
+
+Record   = struct.Struct('<20sQII')
+kBits    = 5                 # on average, a chunk boundary every 32 lines
+kMask    = (1 << kBits)-1
+kMinSize = 256
+kMaxSize = 65536
+
+def store_dir(job):
+    return job.fLogDir+'/chunks';
+
+def recipe_name(odir,grid_id):
+    return odir+'/'+str(grid_id)+'.logs.dedup';
+
+def read_recipe(fn):
+    if (not os.path.exists(fn)): return {}
+    return json.loads(open(fn).read())['members'];
+
+def write_recipe(fn,members):
+    fn_new = fn+'.tmp'
+    f      = open(fn_new,'w')
+    f.write(json.dumps({'members':members}))
+    f.close()
+    os.replace(fn_new,fn)
+
+#------------------------------------------------------------------------------
+# split data (bytes) into content-defined chunks, returns a list of bytes
+#------------------------------------------------------------------------------
+def chunks(data):
+    res   = []
+    start = 0
+    pos   = 0
+    n     = len(data)
+    while (pos < n):
+        eol = data.find(b'\n',pos)
+        end = n if (eol < 0) else eol+1
+        if (end-start > kMaxSize): end = start+kMaxSize
+
+        line = data[pos:end]
+        pos  = end
+        if ((((zlib.crc32(line) & kMask) == 0) and (pos-start >= kMinSize)) or (pos-start >= kMaxSize) or (pos == n)):
+            res.append(data[start:pos])
+            start = pos
+    return res;
+
+#------------------------------------------------------------------------------
+class ChunkStore:
+    def __init__(self, topdir):
+        self.fDir    = topdir
+        self.fPack   = topdir+'/chunks.pack'
+        self.fIdx    = topdir+'/chunks.idx'
+        self.fLock   = topdir+'/lock'
+        self.fIndex  = {}            # sha1 (bytes) -> (offset, length, size)
+        self.fIdxLen = 0             # number of bytes of the index read so far
+        self.fFile   = None          # pack, open for reading
+
+        self.load()
+
+#------------------------------------------------------------------------------
+# read the index records added since the last call. A partially written last record is ignored,
+# unless 'truncate' is set - then, with the lock held, it is left by an interrupted writer and is removed
+#------------------------------------------------------------------------------
+    def load(self,truncate=False):
+        if (not os.path.exists(self.fIdx)): return
+
+        with open(self.fIdx,'rb') as f:
+            f.seek(self.fIdxLen)
+            data = f.read()
+
+        n = len(data)//Record.size
+        for i in range(n):
+            h, offset, length, size = Record.unpack_from(data,i*Record.size)
+            self.fIndex[h] = (offset,length,size)
+        self.fIdxLen += n*Record.size
+
+        if (truncate and (len(data) > n*Record.size)): os.truncate(self.fIdx,self.fIdxLen)
+
+    def has(self,h):
+        return (h in self.fIndex);
+
+    def size(self,h):
+        return self.fIndex[h][2];
+
+    def length(self,h):
+        return self.fIndex[h][1];
+
+#------------------------------------------------------------------------------
+# new: list of (sha1, compressed chunk, size) not yet in the store. Returns number of bytes added
+#------------------------------------------------------------------------------
+    def put(self,new):
+        if (len(new) == 0): return 0
+        if (not os.path.exists(self.fDir)): os.makedirs(self.fDir,exist_ok=True)
+
+        with open(self.fLock,'a') as lock:
+            fcntl.flock(lock,fcntl.LOCK_EX)
+            self.load(truncate=True)
+
+            records = bytearray()
+            nbytes  = 0
+            with open(self.fPack,'ab') as f:
+                offset = f.tell()
+                for h, zdata, size in new:
+                    if (h in self.fIndex): continue
+                    f.write(zdata)
+                    self.fIndex[h] = (offset,len(zdata),size)
+                    records       += Record.pack(h,offset,len(zdata),size)
+                    offset        += len(zdata)
+                    nbytes        += size
+
+            with open(self.fIdx,'ab') as f: f.write(records)
+            self.fIdxLen += len(records)
+        return nbytes;
+
+    def get(self,h):
+        if (self.fFile == None): self.fFile = open(self.fPack,'rb')
+
+        offset, length, size = self.fIndex[h]
+        self.fFile.seek(offset)
+        return zlib.decompress(self.fFile.read(length));
+
+    def close(self):
+        if (self.fFile): self.fFile.close()
+        self.fFile = None
+
+#------------------------------------------------------------------------------
+# files: list of (segment, path, size, mtime), files with unchanged size and mtime are skipped
+# returns (number of files, number of bytes, number of new unique bytes) added
+#------------------------------------------------------------------------------
+def add_files(store,recipe_fn,files,nthreads=8):
+    members = read_recipe(recipe_fn)
+    todo    = []
+    for segment, path, size, mtime in files:
+        m = members.get(segment)
+        if (m and (m[0] == os.path.basename(path)) and (m[1] == size) and (int(m[2]) == int(mtime))): continue
+        todo.append((segment,path,size,mtime))
+
+    if (len(todo) == 0): return 0, 0, 0
+    #------------------------------------------------------------------------------
+    # read, split and compress in parallel, only the chunks not in the store yet are compressed.
+    # The store is updated sequentially
+    #------------------------------------------------------------------------------
+    def split(item):
+        segment, path, size, mtime = item
+        data   = open(path,'rb').read()
+        hashes = []
+        new    = []
+        for c in chunks(data):
+            h = hashlib.sha1(c).digest()
+            hashes.append(h)
+            if (not store.has(h)): new.append((h,zlib.compress(c,6),len(c)))
+        return hashes, new, len(data)
+
+    nbytes = 0
+    nnew   = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,nthreads)) as pool:
+        for (segment, path, size, mtime), (hashes, new, n) in zip(todo,pool.map(split,todo)):
+            nnew            += store.put(new)
+            nbytes          += n
+            members[segment] = [os.path.basename(path),n,mtime,[h.hex() for h in hashes]]
+
+    write_recipe(recipe_fn,members)
+    return len(todo), nbytes, nnew;
+
+#------------------------------------------------------------------------------
+# returns the log of one segment as bytes, None if it is not in the store
+#------------------------------------------------------------------------------
+def read_member(store,recipe_fn,segment,members=None):
+    if (members == None): members = read_recipe(recipe_fn)
+    m = members.get(segment)
+    if (m == None): return None
+
+    return b''.join([store.get(bytes.fromhex(h)) for h in m[3]]);
+
+#------------------------------------------------------------------------------
+class LogStore:
+
+    def __init__(self):
+        self.fProject       = None
+        self.fGridIDList    = None
+        self.fSegment       = None
+        self.fReport        = None
+        self.fVerbose       = 0
+
+        self.fRunningDir    = None;
+        self.fCompletedDir  = None;
+# ---------------------------------------------------------------------
+    def Print(self,Name,level,Message):
+        if(level>self.fVerbose): return 0;
+        now     = time.strftime('%Y/%m/%d %H:%M:%S',time.localtime(time.time()))
+        message = now+' [ LogStore::'+Name+' ] '+Message
+        print(message)
+
+#------------------------------------------------------------------------------
+    def ParseParameters(self):
+        name = 'ParseParameters'
+
+        self.Print(name,2,'Starting')
+        self.Print(name,2, '%s' % sys.argv)
+
+        try:
+            optlist, args = getopt.getopt(sys.argv[1:], '',
+                                          ['project=', 'verbose=', 'grid_id=', 'segment=', 'report='] )
+
+        except getopt.GetoptError:
+            self.Print(name,0,'%s' % sys.argv)
+            self.Print(name,0,'Errors arguments did not parse')
+            return 110
+
+        for key, val in optlist:
+
+            if key == '--project':
+                self.fProject = val
+            elif key == '--grid_id':
+                self.fGridIDList = [x.split('@')[0] for x in val.split(',')]
+            elif key == '--segment':
+                self.fSegment = val
+            elif key == '--report':
+                self.fReport = int(val)
+            elif key == '--verbose':
+                self.fVerbose = int(val)
+
+        if ((self.fProject == None) or ((not self.fReport) and ((self.fGridIDList == None) or (self.fSegment == None)))):
+            self.Print(name,0,'ERROR: --project and either --grid_id with --segment or --report=1 need to be defined')
+            self.Print(name,0,'usage: log_store.py --project=su2020 [--grid_id=35469055 --segment=12 | --report=1]')
+            return 111
+
+        self.fRunningDir   = 'tmp/'+self.fProject+'/grid_job_status';
+        self.fCompletedDir = 'tmp/'+self.fProject+'/completed_jobs'
+
+        self.Print(name,1,'Done')
+        return 0
+
+#------------------------------------------------------------------------------
+# the job status file is either in the 'completed' or in the 'running' directory
+#------------------------------------------------------------------------------
+    def job(self,grid_id):
+        fn = self.fCompletedDir+'/'+grid_id
+        if (not os.path.exists(fn)): fn = self.fRunningDir+'/'+grid_id
+        return grid_job.GridJob(fn);
+
+    def recipe(self,job):
+        odir = job.log_dir()
+        if (job.fileset()): odir = odir+'/'+job.fileset()
+        return recipe_name(odir,job.id());
+
+    def show(self):
+        job     = self.job(self.fGridIDList[0])
+        store   = ChunkStore(store_dir(job))
+        fn      = self.recipe(job)
+        members = read_recipe(fn)
+        segment = log_archive.find_segment(self.fSegment,members)
+        if (segment == None): return 1
+
+        data    = read_member(store,fn,segment,members)
+        if (data == None):
+            self.Print('show',0,'ERROR: no log for segment %s in %s'%(segment,fn))
+            return 1
+
+        sys.stdout.write(data.decode(errors='replace'))
+        return 0
+
+#------------------------------------------------------------------------------
+# per job: size of the logs, size of the distinct chunks they are made of, uncompressed and as stored
+#------------------------------------------------------------------------------
+    def report(self):
+        grid_ids = self.fGridIDList
+        if (grid_ids == None):
+            grid_ids = sorted(set([os.path.basename(fn) for fn in
+                                   glob.glob(self.fCompletedDir+'/*')+glob.glob(self.fRunningDir+'/*')
+                                   if os.path.basename(fn).isdigit()]))
+
+        stores  = {}
+        print('-----------------------------------------------------------------------------')
+        print('    grid_id  N(logs)   logs(MB)  chunks(MB)  stored(MB)  ratio  ratio(stored)')
+        print('-----------------------------------------------------------------------------')
+        for grid_id in grid_ids:
+            job     = self.job(grid_id)
+            fn      = self.recipe(job)
+            if (not os.path.exists(fn)): continue
+
+            sdir    = store_dir(job)
+            if (sdir not in stores): stores[sdir] = ChunkStore(sdir)
+            store   = stores[sdir]
+
+            members = read_recipe(fn)
+            logical = sum([m[1] for m in members.values()])
+            hashes  = set()
+            for m in members.values(): hashes.update(m[3])
+            hashes  = [bytes.fromhex(h) for h in hashes]
+            unique  = sum([store.size  (h) for h in hashes])
+            stored  = sum([store.length(h) for h in hashes])
+
+            print('%11s %8i %10.3f %11.3f %11.3f %6.1f %14.1f'%(grid_id,len(members),logical/1.e6,unique/1.e6,stored/1.e6,
+                                                              logical/max(unique,1),logical/max(stored,1)))
+
+        for sdir, store in stores.items():
+            unique = sum([x[2] for x in store.fIndex.values()])
+            stored = sum([x[1] for x in store.fIndex.values()])
+            print('-----------------------------------------------------------------------------')
+            print('store: %s N(chunks): %i chunks: %.3f MB stored: %.3f MB'%(sdir,len(store.fIndex),unique/1.e6,stored/1.e6))
+        return 0
+
+#------------------------------------------------------------------------------
+# main program
+#------------------------------------------------------------------------------
+if (__name__ == '__main__'):
+
+    x  = LogStore()
+    rc = x.ParseParameters()
+    if (rc == 0):
+        if (x.fReport): rc = x.report()
+        else          : rc = x.show()
+
+    sys.exit(rc);
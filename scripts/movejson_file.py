@@ -8,7 +8,7 @@ import subprocess, shutil, json, copy
 import sys, string, getopt, glob, os, time, re, array
 import tempfile
 
-import grid_job
+import grid_job, outstage_manifest, segment_verdict
 #------------------------------------------------------------------------------
 class MovejsonFile:
 
@@ -31,6 +31,7 @@ class MovejsonFile:
         self.fGridJob       = None;
 
         self.fUseRunningDir = 1
+        self.fVerdicts      = None
 # ---------------------------------------------------------------------
     def Print(self,Name,level,Message):
         if(level>self.fVerbose): return 0;
@@ -83,10 +84,11 @@ class MovejsonFile:
 
 #------------------------------------------------------------------------------
 # check if segment completed successfuly, return: 0 if OK, non-zero if not OK
-# so far, a placeholder
+# key: segment directory in the manifest, '00/00012' . The verdict is shared
+# with check_completed_job.py, see segment_verdict.py
 #------------------------------------------------------------------------------
-    def check_segment(self,subdirectory):
-        return 0;
+    def check_segment(self,key):
+        return self.fVerdicts.check(key);
 
 #------------------------------------------------------------------------------
 # 'job': of grid_job.GridJob type 
@@ -114,44 +116,45 @@ class MovejsonFile:
                oodir = odir;
                if (not os.path.exists(oodir)): os.makedirs(oodir,exist_ok=True)
 
-               list_of_dirs = glob.glob(topdir+'/*')
-               list_of_dirs.sort()
+               #------------------------------------------------------------------------------
+               # the output directory is listed once, subdirectories like 00148.915da673
+               # are not in the manifest
+               #------------------------------------------------------------------------------
+               manifest = outstage_manifest.OutstageManifest(self.fProject,job.id(),topdir)
+               groups   = manifest.segment_groups()
 
-               self.Print(name,1,'list_of_dirs:%s'%format(list_of_dirs));
+               self.fVerdicts = segment_verdict.SegmentVerdicts(self.fProject,job.id(),manifest,self.fUseRunningDir)
 
-               for sd1 in list_of_dirs:
-                  print('sd1:',sd1)
-                  ld1 = glob.glob(sd1+'/*')
-                  ld1.sort()
-                  for sd2 in ld1: 
+               self.Print(name,1,'list_of_dirs:%s'%format(sorted(groups.keys())));
+
+               for sd1 in sorted(groups.keys()):
+                  print('sd1:',topdir+'/'+sd1)
+                  for key in groups[sd1]: 
+                     sd2 = manifest.segment_dir(key)
                      self.Print(name,1,'sd2=%s'%sd2);
-                     #------------------------------------------------------------------------------
-                     # skip subdirectories like 00148.915da673
-                     dbn = os.path.basename(sd2);
                      full_access_permission = 0o700
                      
-                     print(dbn)
-                     if (len(dbn.split('.')) == 1) :
-                        # at this point, need to check whether the segment has completed successfully
-                        # do not copy files for failed segments
-                        # 'rc' is the return code, 0 if evethything is fine 
-                        rc = self.check_segment(sd2);
-                        keyword_to_check = "modified"
-                        destination_file = '/mu2e/app/home/mu2epro/namithac/'
-                        if (rc == 0):
-                           for fn in glob.glob(sd2+'/*.'+ext) :
-                               input_file = os.path.basename(fn)
-                               
-                               output_file_path = os.path.join(destination_file, input_file)
-                               if keyword_to_check not in input_file:
-                                  shutil.move(fn, output_file_path)
-                              
-                                
-                        else:
-                            print('skip failed segment , subdirectory:',sd2)
+                     print(os.path.basename(sd2))
+                     # at this point, need to check whether the segment has completed successfully
+                     # do not copy files for failed segments
+                     # 'rc' is the return code, 0 if evethything is fine 
+                     rc = self.check_segment(key);
+                     keyword_to_check = "modified"
+                     destination_file = '/mu2e/app/home/mu2epro/namithac/'
+                     if (rc == 0):
+                        for fn in manifest.files(key,'*.'+ext) :
+                            input_file = os.path.basename(fn)
+                            
+                            output_file_path = os.path.join(destination_file, input_file)
+                            if keyword_to_check not in input_file:
+                               shutil.move(fn, output_file_path)
+                           
+                             
                      else:
-                        print('in trouble: %s'%fn)
+                         print('skip failed segment , subdirectory:',sd2)
         
+        # verdicts computed here are saved for check_completed_job.py and the other tools
+        if (self.fVerdicts): self.fVerdicts.write()
         #------------------------------------------------------------------------------
         # done, update the job status
         #------------------------------------------------------------------------------
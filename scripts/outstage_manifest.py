@@ -0,0 +1,179 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# manifest of the outstage directory of a grid job: for each segment subdirectory
+# (like $grid_output_dir/00/00012), names, sizes and mtimes of the files in it.
+#
+# on /pnfs, every glob is a slow NFS readdir. The tree is walked once with os.scandir,
+# and the manifest is stored in tmp/$project/outstage_manifest/$grid_id .
+# Next time, a directory is re-listed only if its mtime has changed - a file created,
+# renamed or removed changes the mtime of the directory it is in
+#
+# the segment directories are stat'ed and listed concurrently, see dir_walker.py
+#
+# subdirectories like 00148.915da673 are not segment directories and are skipped
+#------------------------------------------------------------------------------
+
+import os, json, fnmatch
+
+import dir_walker
+
+#------------------------------------------------------------------------------
+# stored manifest of a grid job, without re-listing anything: '00/00012' -> list of [name, size, mtime],
+# None if there is none
+#------------------------------------------------------------------------------
+def stored_segments(project,grid_id):
+    fn = 'tmp/'+project+'/outstage_manifest/'+str(grid_id)
+    if (not os.path.exists(fn)): return None
+    try:
+        return json.loads(open(fn).read())['segments'];
+    except (ValueError,KeyError):
+        return None
+
+#------------------------------------------------------------------------------
+class OutstageManifest:
+    def __init__(self, project, grid_id, topdir, force = None):
+
+        self.fFn      = 'tmp/'+project+'/outstage_manifest/'+grid_id;
+        self.fTopDir  = topdir
+        self.fDirs    = {}      # relative path ('00', '00/00012') -> mtime
+        self.fSegment = {}      # '00/00012' -> list of [name, size, mtime]
+        self.fNListed = 0       # number of directories listed during the last update
+
+        nthreads, rate = dir_walker.project_settings(project)
+        self.fWalker   = dir_walker.DirWalker(nthreads,rate)
+
+        if ((not force) and os.path.exists(self.fFn)):
+            try:
+                d = json.loads(open(self.fFn).read())
+                if (d['topdir'] == topdir):
+                    self.fDirs    = d['dirs']
+                    self.fSegment = d['segments']
+            except (ValueError,KeyError):
+                print('WARNING in OutstageManifest::init : corrupted file '+self.fFn+', ignore it')
+
+        self.update()
+        if (self.fNListed > 0): self.write()
+
+    def mtime(self,path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def scandir(self,path):
+        self.fNListed += 1
+        return self.fWalker.scandir(path);
+
+#------------------------------------------------------------------------------
+# re-list the directories which changed since the manifest has been written
+#------------------------------------------------------------------------------
+    def update(self):
+        dirs     = {}
+        segments = {}
+
+        mtime = self.mtime(self.fTopDir)
+        if (mtime == None):
+            self.fDirs    = {}
+            self.fSegment = {}
+            return
+
+        if (self.fDirs.get('.') == mtime): level1 = [d for d in self.fDirs.keys() if ((d != '.') and ('/' not in d))]
+        else                             : level1 = [e.name for e in self.scandir(self.fTopDir) if e.is_dir()]
+        dirs['.'] = mtime
+
+        keys = []
+        for sd1 in level1:
+            path1 = self.fTopDir+'/'+sd1
+            mtime = self.mtime(path1)
+            if (mtime == None): continue
+
+            if (self.fDirs.get(sd1) == mtime):
+                level2 = [d.split('/')[1] for d in self.fSegment.keys() if (d.split('/')[0] == sd1)]
+            else:
+                level2 = [e.name for e in self.scandir(path1) if (e.is_dir() and (len(e.name.split('.')) == 1))]
+            dirs[sd1] = mtime
+
+            keys.extend([sd1+'/'+sd2 for sd2 in level2])
+        #------------------------------------------------------------------------------
+        # segment directories: thousands of them, stat'ed and, if changed, listed in parallel
+        #------------------------------------------------------------------------------
+        paths  = {self.fTopDir+'/'+key : key for key in keys}
+        mtimes = {}
+        for path, key in paths.items():
+            if (key in self.fSegment): mtimes[path] = self.fDirs.get(key)
+
+        for path, mtime, files in self.fWalker.scan(paths.keys(),mtimes):
+            if (mtime == None): continue
+            key = paths[path]
+            if (files == None):
+                segments[key] = self.fSegment[key]
+            else:
+                self.fNListed += 1
+                segments[key] = sorted(files)
+            dirs[key] = mtime
+
+        self.fDirs    = dirs
+        self.fSegment = segments
+
+    def write(self):
+        dirname = os.path.dirname(self.fFn)
+        if (dirname and (not os.path.exists(dirname))): os.makedirs(dirname,exist_ok=True)
+
+        fn_new = self.fFn+'.tmp'
+        f      = open(fn_new,'w')
+        f.write(json.dumps({'topdir':self.fTopDir, 'dirs':self.fDirs, 'segments':self.fSegment}))
+        f.close()
+        os.replace(fn_new,self.fFn)
+
+#------------------------------------------------------------------------------
+# segment directories, sorted, as '00/00012'
+#------------------------------------------------------------------------------
+    def segments(self):
+        return sorted(self.fSegment.keys());
+
+    def has_segment(self,key):
+        return (key in self.fSegment);
+
+    def segment_dir(self,key):
+        return self.fTopDir+'/'+key;
+
+#------------------------------------------------------------------------------
+# files of one segment as listed: list of [name, size, mtime], empty if the segment is not known
+#------------------------------------------------------------------------------
+    def segment_entries(self,key):
+        return self.fSegment.get(key,[]);
+
+#------------------------------------------------------------------------------
+# full paths of the files of one segment matching a shell pattern, like '*.log'
+#------------------------------------------------------------------------------
+    def files(self,key,pattern='*'):
+        d = self.fTopDir+'/'+key
+        return [d+'/'+f[0] for f in self.fSegment.get(key,[]) if fnmatch.fnmatchcase(f[0],pattern)];
+
+#------------------------------------------------------------------------------
+# same, returns list of (path, size, mtime, segment)
+#------------------------------------------------------------------------------
+    def segment_files(self,key,pattern='*'):
+        d = self.fTopDir+'/'+key
+        return [(d+'/'+name,size,mtime,key) for name, size, mtime in self.fSegment.get(key,[]) 
+                if fnmatch.fnmatchcase(name,pattern)];
+
+#------------------------------------------------------------------------------
+# returns list of (path, size, mtime, segment) for all files matching 'pattern', ordered by segment
+#------------------------------------------------------------------------------
+    def all_files(self,pattern='*'):
+        res = []
+        for key in self.segments():
+            d = self.fTopDir+'/'+key
+            for name, size, mtime in self.fSegment[key]:
+                if ((pattern == '*') or fnmatch.fnmatchcase(name,pattern)): res.append((d+'/'+name,size,mtime,key))
+        return res;
+
+#------------------------------------------------------------------------------
+# segment directories grouped by the first level subdirectory: '00' -> ['00/00000', '00/00001', ...]
+#------------------------------------------------------------------------------
+    def segment_groups(self):
+        res = {}
+        for key in self.segments():
+            res.setdefault(key.split('/')[0],[]).append(key)
+        return res;
@@ -9,6 +9,8 @@
 #
 # output is stored in the xxx/timing_data subdirectory , at the same level as xxx/log
 #
+# log files packed by 'copy_log_files.py --archive=1' ($grid_id.logs.gz + index) are read as well
+#
 # comment: a bit kludgy, at this point, but works
 #------------------------------------------------------------------------------
 # puts "starting---"
@@ -16,6 +18,9 @@
 require 'find'
 require 'fileutils'
 require 'getoptlong'
+require 'json'
+require 'zlib'
+require 'stringio'
 
 # puts " emoe"
 #-----------------------------------------------------------------------
@@ -64,6 +69,77 @@ opts.each do |opt, arg|
   if ($verbose != 0) ; puts "Option: #{opt}, arg #{arg.inspect}" ; end
 end
 
+#------------------------------------------------------------------------------
+# parse one log file, 'f' : anything with each_line - a File or a StringIO
+#------------------------------------------------------------------------------
+def parse_log(f,of,dsid)
+  start_time    = ""  ;
+  wall_time     = -1  ;
+  cpu_time      = -1  ;
+  stage_in_time = -1  ;
+  full_evt_time = -1.0;
+  kffpar_time   = -1.0;
+  kffdar_time   = -1.0;
+  init_stn_time = -1.0;
+
+  job_id        = -1          ;
+  vendor_id     = "undefined" ;
+  bogomips      = -1          ;
+  node_name     = "undefined" ;
+
+  vmpeak        = -1.0;
+  vmhwm         = -1.0;
+
+  f.each_line { |line|
+    if (line.index("Starting on host ")) then
+      # puts line
+      words = line.strip.split(" ");
+      start_time = words[19]+" "+words[20]+" "+words[21]+" "+words[22]+" "+words[23];
+    elsif line.index("# Total stage-in time:") then
+      words         = line.strip.split(" ");
+      stage_in_time = words[10].to_i;
+    elsif line.index("TimeReport CPU =") then
+      words     = line.strip.split(" ");
+      cpu_time  = words[3].to_f;
+      wall_time = words[6].to_f;
+    elsif line.index("MemReport  VmPeak =") then
+      words   = line.strip.split(" ");
+      vmpeak  = words[3].to_f;
+      vmhwm   = words[6].to_f;
+    elsif line.index("Full event  ") then
+      full_evt_time = line.strip.split(" ")[3].to_f;
+    elsif line.index("p2:InitStntuple:InitStntuple") then
+      init_stn_time = line.strip.split(" ")[2].to_f;
+    elsif line.index("p2:KFFDeMHPar:KalFinalFit") then
+      kffpar_time = line.strip.split(" ")[2].to_f;
+    elsif line.index("p2:KFFDeMHDar:KalFinalFit") then
+      kffdar_time = line.strip.split(" ")[2].to_f;
+    elsif (line.index("poms_data") == 0) then
+#------------------------------------------------------------------------------
+# grid job information
+# ["campaign_id:", "task_definition_id:", "task_id:", "job_id:", "batch_id:15514434.0@jobsub02.fnal.gov", \
+#  "host_site:", "bogomips:4599.37", "node_name:murat-15514434-0-fnpc7008.fnal.gov", "vendor_id:AuthenticAMD"]
+#------------------------------------------------------------------------------
+      ww = line.split('=')[1].gsub('"','').gsub('{','').gsub('}','').split(',');
+      for w in ww do
+        w1 = w.split(':');
+        if    (w1[0] == "batch_id" ) then job_id    = w1[1].split('.')[0];
+        elsif (w1[0] == "bogomips" ) then bogomips  = w1[1];
+        elsif (w1[0] == "node_name") then node_name = w1[1].split('-')[3];
+        elsif (w1[0] == "vendor_id") then vendor_id = w1[1].strip;
+        end
+      end
+    end
+  }
+
+#    puts "stage_in_time: #{stage_in_time}", cpu_time, wall_time, full_evt_time, kffpar_time, kffdar_time, init_stn_time;
+
+  of.printf(" %11s %-19s %-12s %8s %9s %9.3f %9.3f %6i %8.0f %8.0f %8.4f %8.4f %8.4f %8.4f\n",
+            job_id, node_name, vendor_id, bogomips, dsid, 
+            vmpeak, vmhwm, 
+            stage_in_time, cpu_time, wall_time, full_evt_time, init_stn_time, kffpar_time, kffdar_time );
+end
+
 #------------------------------------------------------------------------------
 def run(dsid)
   user = $user ; if (user == $nil) then user = ENV["USER"] ; end
@@ -93,74 +169,22 @@ def run(dsid)
     #    puts "-----------------"+fn
 
     f = File.open(fn);
-
-    start_time    = ""  ;
-    wall_time     = -1  ;
-    cpu_time      = -1  ;
-    stage_in_time = -1  ;
-    full_evt_time = -1.0;
-    kffpar_time   = -1.0;
-    kffdar_time   = -1.0;
-    init_stn_time = -1.0;
-
-    job_id        = -1          ;
-    vendor_id     = "undefined" ;
-    bogomips      = -1          ;
-    node_name     = "undefined" ;
-
-    vmpeak        = -1.0;
-    vmhwm         = -1.0;
-
-    f.each_line { |line|
-      if (line.index("Starting on host ")) then
-        # puts line
-        words = line.strip.split(" ");
-        start_time = words[19]+" "+words[20]+" "+words[21]+" "+words[22]+" "+words[23];
-      elsif line.index("# Total stage-in time:") then
-        words         = line.strip.split(" ");
-        stage_in_time = words[10].to_i;
-      elsif line.index("TimeReport CPU =") then
-        words     = line.strip.split(" ");
-        cpu_time  = words[3].to_f;
-        wall_time = words[6].to_f;
-      elsif line.index("MemReport  VmPeak =") then
-        words   = line.strip.split(" ");
-        vmpeak  = words[3].to_f;
-        vmhwm   = words[6].to_f;
-      elsif line.index("Full event  ") then
-        full_evt_time = line.strip.split(" ")[3].to_f;
-      elsif line.index("p2:InitStntuple:InitStntuple") then
-        init_stn_time = line.strip.split(" ")[2].to_f;
-      elsif line.index("p2:KFFDeMHPar:KalFinalFit") then
-        kffpar_time = line.strip.split(" ")[2].to_f;
-      elsif line.index("p2:KFFDeMHDar:KalFinalFit") then
-        kffdar_time = line.strip.split(" ")[2].to_f;
-      elsif (line.index("poms_data") == 0) then
+    parse_log(f,of,dsid)
+    f.close
+  end
 #------------------------------------------------------------------------------
-# grid job information
-# ["campaign_id:", "task_definition_id:", "task_id:", "job_id:", "batch_id:15514434.0@jobsub02.fnal.gov", \
-#  "host_site:", "bogomips:4599.37", "node_name:murat-15514434-0-fnpc7008.fnal.gov", "vendor_id:AuthenticAMD"]
+# archives: one gzip member per log file, the index gives offset and length of each
 #------------------------------------------------------------------------------
-        ww = line.split('=')[1].gsub('"','').gsub('{','').gsub('}','').split(',');
-        for w in ww do
-          w1 = w.split(':');
-          if    (w1[0] == "batch_id" ) then job_id    = w1[1].split('.')[0];
-          elsif (w1[0] == "bogomips" ) then bogomips  = w1[1];
-          elsif (w1[0] == "node_name") then node_name = w1[1].split('-')[3];
-          elsif (w1[0] == "vendor_id") then vendor_id = w1[1].strip;
-          end
-        end
-      end
+  for fn in Dir.glob(["#{idir}/*.logs.gz","#{idir}/log/*.logs.gz"]) do
+    index = JSON.parse(File.read(fn+'.idx'))['members']
+    File.open(fn,'rb') { |archive|
+      index.keys.sort.each { |segment|
+        name, offset, length = index[segment]
+        archive.seek(offset)
+        text = Zlib.gunzip(archive.read(length))
+        parse_log(StringIO.new(text),of,dsid)
+      }
     }
-
-#    puts "stage_in_time: #{stage_in_time}", cpu_time, wall_time, full_evt_time, kffpar_time, kffdar_time, init_stn_time;
-
-    of.printf(" %11s %-19s %-12s %8s %9s %9.3f %9.3f %6i %8.0f %8.0f %8.4f %8.4f %8.4f %8.4f\n",
-              job_id, node_name, vendor_id, bogomips, dsid, 
-              vmpeak, vmhwm, 
-              stage_in_time, cpu_time, wall_time, full_evt_time, init_stn_time, kffpar_time, kffdar_time );
-
-    f.close
   end
 
   of.close();
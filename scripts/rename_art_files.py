@@ -7,7 +7,7 @@
 import subprocess, shutil, json, copy
 import sys, string, getopt, glob, os, time, re, array
 
-import grid_job
+import grid_job, outstage_manifest, segment_verdict
 #------------------------------------------------------------------------------
 class RenameArtFiles:
 
@@ -30,6 +30,7 @@ class RenameArtFiles:
         self.fGridJob       = None;
 
         self.fUseRunningDir = 1
+        self.fVerdicts      = None
 # ---------------------------------------------------------------------
     def Print(self,Name,level,Message):
         if(level>self.fVerbose): return 0;
@@ -82,10 +83,11 @@ class RenameArtFiles:
 
 #------------------------------------------------------------------------------
 # check if segment completed successfuly, return: 0 if OK, non-zero if not OK
-# so far, a placeholder
+# key: segment directory in the manifest, '00/00012' . The verdict is shared
+# with check_completed_job.py, see segment_verdict.py
 #------------------------------------------------------------------------------
-    def check_segment(self,subdirectory):
-        return 0;
+    def check_segment(self,key):
+        return self.fVerdicts.check(key);
 
 #------------------------------------------------------------------------------
 # 'job': of grid_job.GridJob type 
@@ -107,62 +109,60 @@ class RenameArtFiles:
         #------------------------------------------------------------------------------
         file_types = self.fFileTypes.split(',');
         extracted_parts = []
+        #------------------------------------------------------------------------------
+        # the output directory is listed once, subdirectories like 00148.915da673
+        # are not in the manifest
+        #------------------------------------------------------------------------------
+        manifest = outstage_manifest.OutstageManifest(self.fProject,job.id(),topdir)
+        groups   = manifest.segment_groups()
+
+        self.fVerdicts = segment_verdict.SegmentVerdicts(self.fProject,job.id(),manifest,self.fUseRunningDir)
         for ext in file_types:
             if (ext == 'art.json')  :
                # oodir = odir+'/'+ext;
                oodir = odir;
                if (not os.path.exists(oodir)): os.makedirs(oodir,exist_ok=True)
 
-               list_of_dirs = glob.glob(topdir+'/*')
-               list_of_dirs.sort()
+               self.Print(name,1,'list_of_dirs:%s'%format(sorted(groups.keys())));
 
-               self.Print(name,1,'list_of_dirs:%s'%format(list_of_dirs));
-
-               for sd1 in list_of_dirs:
-                  print('sd1:',sd1)
-                  ld1 = glob.glob(sd1+'/*')
-                  ld1.sort()
-                  for sd2 in ld1[:10]: 
+               for sd1 in sorted(groups.keys()):
+                  print('sd1:',topdir+'/'+sd1)
+                  for key in groups[sd1][:10]: 
+                     sd2 = manifest.segment_dir(key)
                      self.Print(name,1,'sd2=%s'%sd2);
-                     #------------------------------------------------------------------------------
-                     # skip subdirectories like 00148.915da673
-                     dbn = os.path.basename(sd2);
-                     if (len(dbn.split('.')) == 1) :
-                        # at this point, need to check whether the segment has completed successfully
-                        # do not copy files for failed segments
-                        # 'rc' is the return code, 0 if evethything is fine 
-                        rc = self.check_segment(sd2);
-                        if (rc == 0):
-                           for fn in glob.glob(sd2+'/*.'+ext) : 
-                               self.Print(name,1,'fn : %s'%(fn))
-                               key_to_extract = "dh.first_subrun_event"
-                               with open(fn, 'r') as file:
-                                 json_data = json.load(file)
-
-                               if key_to_extract in json_data:
-                                  value = json_data[key_to_extract]
-                                  print(f"Value of '{key_to_extract}': {value}")
-                                  new_value = "002701_00000000" + str(value) + ".art"
-                                  newart_value = "002701_00000000" + str(value) 
-                                  print(new_value)
-                                  extracted_parts.append(newart_value)
-                               oldname, file_extension = os.path.splitext(os.path.basename(fn))
-                               parts = oldname.split('.')
-                               if len(parts) > 4:
-                                  parts[4:] = [new_value]
-                                  #part_after = '.'.join(parts[4:])
-                                  #print(f"Part after the third dot: {part_after}")
-                                  #new_filename = '.'new value + file_extension
-                                  new_filename = '.'.join(parts) + file_extension
-                                  print("new file name : ",new_filename)
-                                  os.rename(fn, os.path.join(os.path.dirname(fn), new_filename))
-                               else:
-                                  print("File name does not have enough parts after the third dot.")
-
-                        else:
-                            print('skip failed segment , subdirectory:',sd2)
+                     # at this point, need to check whether the segment has completed successfully
+                     # do not copy files for failed segments
+                     # 'rc' is the return code, 0 if evethything is fine 
+                     rc = self.check_segment(key);
+                     if (rc == 0):
+                        for fn in manifest.files(key,'*.'+ext) : 
+                            self.Print(name,1,'fn : %s'%(fn))
+                            key_to_extract = "dh.first_subrun_event"
+                            with open(fn, 'r') as file:
+                              json_data = json.load(file)
+
+                            if key_to_extract in json_data:
+                               value = json_data[key_to_extract]
+                               print(f"Value of '{key_to_extract}': {value}")
+                               new_value = "002701_00000000" + str(value) + ".art"
+                               newart_value = "002701_00000000" + str(value) 
+                               print(new_value)
+                               extracted_parts.append(newart_value)
+                            oldname, file_extension = os.path.splitext(os.path.basename(fn))
+                            parts = oldname.split('.')
+                            if len(parts) > 4:
+                               parts[4:] = [new_value]
+                               #part_after = '.'.join(parts[4:])
+                               #print(f"Part after the third dot: {part_after}")
+                               #new_filename = '.'new value + file_extension
+                               new_filename = '.'.join(parts) + file_extension
+                               print("new file name : ",new_filename)
+                               os.rename(fn, os.path.join(os.path.dirname(fn), new_filename))
+                            else:
+                               print("File name does not have enough parts after the third dot.")
+
                      else:
-                        print('in trouble: %s'%fn)
+                         print('skip failed segment , subdirectory:',sd2)
         print(extracted_parts)
 
         for ext in file_types:
@@ -170,54 +170,47 @@ class RenameArtFiles:
                oodir = odir;
                if (not os.path.exists(oodir)): os.makedirs(oodir,exist_ok=True)
 
-               list_of_dirs = glob.glob(topdir+'/*')
-               list_of_dirs.sort()
-
-               self.Print(name,1,'list_of_dirs:%s'%format(list_of_dirs));
+               self.Print(name,1,'list_of_dirs:%s'%format(sorted(groups.keys())));
 
-               for sd1 in list_of_dirs:
-                  print('sd1:',sd1)
-                  ld1 = glob.glob(sd1+'/*')
-                  ld1.sort()
+               for sd1 in sorted(groups.keys()):
+                  print('sd1:',topdir+'/'+sd1)
                   counter = 0
-                  for sd2 in ld1[:10]:
+                  for key in groups[sd1][:10]:
+                     sd2 = manifest.segment_dir(key)
                      self.Print(name,1,'sd2=%s'%sd2);
-                     #------------------------------------------------------------------------------
-                     # skip subdirectories like 00148.915da673
-                     dbn = os.path.basename(sd2);
-                     if (len(dbn.split('.')) == 1) :
-                        # at this point, need to check whether the segment has completed successfully
-                        # do not copy files for failed segments
-                        # 'rc' is the return code, 0 if evethything is fine 
-                        rc = self.check_segment(sd2);
-                        if (rc == 0):
-                           for fn in glob.glob(sd2+'/*.' +ext) : 
-                               dst = fn;
-                               self.Print(name,1,'fn, dst : %s %s'%(fn,dst))
-                               oldname, file_extension = os.path.splitext(os.path.basename(fn))
-                               parts = oldname.split('.')
-                               if len(parts) > 4:
-                                  parts[4] = extracted_parts[counter]
-                                  #part_after = '.'.join(parts[4:])
-                                  #print(f"Part after the third dot: {part_after}")
-                                  #new_filename = '.'new value + file_extension
-                                  new_filename = '.'.join(parts) + file_extension
-                                  print("new file name : ",new_filename)
-                                  os.rename(fn, os.path.join(os.path.dirname(fn), new_filename))
+                     # at this point, need to check whether the segment has completed successfully
+                     # do not copy files for failed segments
+                     # 'rc' is the return code, 0 if evethything is fine 
+                     rc = self.check_segment(key);
+                     if (rc == 0):
+                        # .art files have not been renamed above, the manifest still lists them correctly
+                        for fn in manifest.files(key,'*.' +ext) : 
+                            dst = fn;
+                            self.Print(name,1,'fn, dst : %s %s'%(fn,dst))
+                            oldname, file_extension = os.path.splitext(os.path.basename(fn))
+                            parts = oldname.split('.')
+                            if len(parts) > 4:
+                               parts[4] = extracted_parts[counter]
+                               #part_after = '.'.join(parts[4:])
+                               #print(f"Part after the third dot: {part_after}")
+                               #new_filename = '.'new value + file_extension
+                               new_filename = '.'.join(parts) + file_extension
+                               print("new file name : ",new_filename)
+                               os.rename(fn, os.path.join(os.path.dirname(fn), new_filename))
             
-                                  counter +=1
-                                  print("new file name = ",new_filename)
-                               else:
-                                  print("File name does not have enough parts after the third dot.")
-                               print("file name", oldname)
-                              ## Generate the new file path with the desired filename and extension
+                               counter +=1
+                               print("new file name = ",new_filename)
+                            else:
+                               print("File name does not have enough parts after the third dot.")
+                            print("file name", oldname)
+                           ## Generate the new file path with the desired filename and extension
                               
 
-                        else:
-                            print('skip failed segment , subdirectory:',sd2)
                      else:
-                        print('in trouble: %s'%fn)
+                         print('skip failed segment , subdirectory:',sd2)
             
+        # verdicts computed here are saved for check_completed_job.py and the other tools
+        if (self.fVerdicts): self.fVerdicts.write()
         #------------------------------------------------------------------------------
         # done, update the job status
         #------------------------------------------------------------------------------
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# statistics of the per-segment resource usage harvested from the logs of past grid jobs,
+# see log_harvester.py . Used to choose fMaxMemory, fRequestedTime and the segment size
+#------------------------------------------------------------------------------
+
+import os, re, glob, math
+
+import log_harvester
+
+#------------------------------------------------------------------------------
+# mu2eprodsys memory and time formats: '2000MB', '2GB' ; '12h', '90m', '3600s'
+#------------------------------------------------------------------------------
+def memory_mb(s):
+    m = re.match(r'^\s*([\d.]+)\s*(MB|GB|M|G)?\s*$',str(s))
+    if (m == None): return None
+    x = float(m.group(1))
+    if (m.group(2) and m.group(2)[0] == 'G'): x = x*1000
+    return x;
+
+def format_memory(mb):
+    return '%iMB'%mb;
+
+def time_sec(s):
+    m = re.match(r'^\s*([\d.]+)\s*(h|m|s)?\s*$',str(s))
+    if (m == None): return None
+    x     = float(m.group(1))
+    scale = {'h':3600, 'm':60, 's':1, None:1}
+    return x*scale[m.group(2)];
+
+def format_time(sec):
+    if (sec >= 3600): return '%ih'%math.ceil(sec/3600.)
+    return '%im'%math.ceil(sec/60.);
+
+#------------------------------------------------------------------------------
+# p in percent, linear interpolation between the closest ranks
+#------------------------------------------------------------------------------
+def percentile(values,p):
+    if (len(values) == 0): return None
+    v = sorted(values)
+    x = (len(v)-1)*p/100.
+    i = int(math.floor(x))
+    if (i+1 >= len(v)): return v[-1]
+    return v[i]+(v[i+1]-v[i])*(x-i);
+
+def round_up(x,step):
+    return math.ceil(x/step)*step;
+
+#------------------------------------------------------------------------------
+# tables of all harvested grid jobs of a given family/stage/job, optionally - input dataset
+# returns list of (header, columns), ordered by grid ID
+#------------------------------------------------------------------------------
+def load_tables(project,family_id,stage,job,dsid=None):
+    tables = []
+    for fn in sorted(glob.glob(os.path.dirname(log_harvester.table_name(project,'x'))+'/*.cols')):
+        header, columns = log_harvester.read_table(fn)
+        if ((header['family_id'] != family_id) or (header['stage'] != stage) or (header['job'] != job)): continue
+        if (dsid and (header['dsid'] != dsid)): continue
+        tables.append((header,columns))
+    return tables;
+
+#------------------------------------------------------------------------------
+# values of column 'col' over all tables, NaN's skipped
+# ok_only: only the successful segments
+#------------------------------------------------------------------------------
+def values(tables,col,ok_only=True):
+    res = []
+    for header, columns in tables:
+        for i in range(0,header['nrows']):
+            if (ok_only and (columns['ok'][i] == 0)): continue
+            x = columns[col][i]
+            if (not math.isnan(x)): res.append(x)
+    return res;
+
+#------------------------------------------------------------------------------
+# processing rate of successful segments, events per second of wall time
+#------------------------------------------------------------------------------
+def event_rates(tables):
+    res = []
+    for header, columns in tables:
+        for i in range(0,header['nrows']):
+            if (columns['ok'][i] == 0): continue
+            nev  = columns['nevents'][i]
+            wall = columns['wall'][i]
+            if (math.isnan(nev) or math.isnan(wall) or (wall <= 0) or (nev <= 0)): continue
+            res.append(nev/wall)
+    return res;
+
+#------------------------------------------------------------------------------
+# wall time per input file of successful segments, for jobs reading input datasets.
+# segments are assumed to be full - have max_input_files files each
+#------------------------------------------------------------------------------
+def seconds_per_file(tables):
+    res = []
+    for header, columns in tables:
+        nf = header.get('max_input_files')
+        if (not nf): continue
+        for i in range(0,header['nrows']):
+            wall = columns['wall'][i]
+            if ((columns['ok'][i] == 0) or math.isnan(wall) or (wall <= 0)): continue
+            res.append(wall/nf)
+    return res;
+
+#------------------------------------------------------------------------------
+# segmentation for a target wall time per segment: the size is chosen such that a slow segment,
+# at percentile 'p' of the processing time distribution, still fits into 'target' seconds
+# returns None if there is not enough history
+#------------------------------------------------------------------------------
+def plan_nevents(tables,target,p=95):
+    rates = event_rates(tables)
+    if (len(rates) == 0): return None
+    return max(1,int(target*percentile(rates,100-p)));
+
+def plan_input_files(tables,target,p=95):
+    t = seconds_per_file(tables)
+    if (len(t) == 0): return None
+    return max(1,int(target/percentile(t,p)));
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# decide what to do with a failed segment: resubmit it in the recovery job ('retry')
+# or set it aside ('quarantine')
+#
+# the policy is defined per job in init_project.py, for example:
+#
+#   job.fRetryPolicy = { 'transient'      : 'retry',
+#                        'deterministic'  : 'quarantine',
+#                        'memory_exceeded': 'retry',       # cause names take precedence over classes
+#                        'max_attempts'   : 3 }
+#
+# keys not defined by the job are taken from DefaultPolicy. 'max_attempts' limits the number of times
+# a segment is submitted, counting the initial job and all chained recovery jobs
+#------------------------------------------------------------------------------
+
+kRetry      = 'retry'
+kQuarantine = 'quarantine'
+
+DefaultPolicy = { 'transient'     : kRetry,
+                  'deterministic' : kQuarantine,
+                  'unknown'       : kRetry,
+                  'max_attempts'  : 3 }
+
+#------------------------------------------------------------------------------
+class RetryPolicy:
+    def __init__(self, config = None):
+
+        self.fPolicy = dict(DefaultPolicy)
+        if (config): self.fPolicy.update(config)
+
+    def max_attempts(self):
+        return self.fPolicy['max_attempts'];
+
+#------------------------------------------------------------------------------
+# cause      : name of the failure signature, see failure_classifier.py
+# cause_class: 'transient', 'deterministic' or 'unknown'
+# attempt    : how many times the segment has been submitted, 1 for the initial job
+#------------------------------------------------------------------------------
+    def action(self,cause,cause_class,attempt):
+
+        if (attempt >= self.max_attempts()): return kQuarantine
+
+        if (cause in self.fPolicy.keys()): return self.fPolicy[cause]
+
+        return self.fPolicy.get(cause_class,kRetry);
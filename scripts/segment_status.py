@@ -0,0 +1,130 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# per-segment verdicts of a grid job, computed by check_completed_job.py
+# stored in tmp/$project/segment_status/$grid_id , one JSON dictionary per job
+#
+# a verdict is remembered together with the size and the mtime of the log file
+# it has been computed from, and with the sizes of the output files found. On the next check,
+# the verdict of a successful segment is reused as long as neither the log file nor the output
+# files changed. Missing and failed segments are always re-examined
+#------------------------------------------------------------------------------
+
+import os, json, threading
+
+kSegmentOk      = 'ok'
+kSegmentFailed  = 'failed'
+kSegmentMissing = 'missing'
+
+#------------------------------------------------------------------------------
+# true if the output files recorded with the verdict v are still there and have the same size
+# sizes: name -> size , as listed in the outstage manifest
+#------------------------------------------------------------------------------
+def same_outputs(v,sizes):
+    recorded = v.get('files')
+    if (recorded == None): return False
+
+    for name, size in recorded.items():
+        if (sizes.get(name) != size): return False
+    return True;
+
+#------------------------------------------------------------------------------
+class SegmentStatus:
+    def __init__(self, fn):
+
+        self.fFn      = fn;
+        self.fSegment = {}
+        self.fLock    = threading.Lock()     # segments are checked by several threads
+
+        if (os.path.exists(fn)):
+            try:
+                self.fSegment = json.loads(open(fn).read())
+            except ValueError:
+                print('WARNING in SegmentStatus::init : corrupted file '+fn+', ignore it')
+                self.fSegment = {}
+
+    def key(self,iseg):
+        return '%05i'%iseg;
+
+    def verdict(self,iseg):
+        return self.fSegment.get(self.key(iseg));
+
+#------------------------------------------------------------------------------
+# returns the cached verdict if the segment has been found OK and its log file
+# has not changed since then, None otherwise
+# deep         : if set, a verdict computed without the deep output check is not good enough
+# output_check : same for the check of the output files
+# sizes        : current output file sizes, name -> size, they should match the recorded ones
+#------------------------------------------------------------------------------
+    def good_verdict(self,iseg,deep=None,output_check=None,sizes=None):
+        v = self.verdict(iseg);
+
+        if ((v == None) or (v['status'] != kSegmentOk) or (v['log'] == None)): return None
+
+        if (deep         and (not v.get('deep'        ))): return None
+        if (output_check and (not v.get('output_check'))): return None
+
+        if ((sizes != None) and (not same_outputs(v,sizes))): return None
+
+        try:
+            st = os.stat(v['log'])
+        except OSError:
+            return None
+
+        if ((st.st_size != v['size']) or (st.st_mtime != v['mtime'])): return None
+
+        return v;
+
+#------------------------------------------------------------------------------
+# 'logfile' : log file the verdict has been computed from, None if there is no log file
+# 'cause'   : for failed segments, name of the failure signature (see failure_classifier.py)
+#------------------------------------------------------------------------------
+    def set_verdict(self,iseg,status,logfile=None,error=None,cause=None):
+        v           = {}
+        v['status'] = status
+        v['log'   ] = logfile
+        v['size'  ] = None
+        v['mtime' ] = None
+        v['error' ] = error
+        v['cause' ] = cause
+
+        if (logfile):
+            try:
+                st         = os.stat(logfile)
+                v['size' ] = st.st_size
+                v['mtime'] = st.st_mtime
+            except OSError:
+                v['log'  ] = None
+
+        with self.fLock:
+            self.fSegment[self.key(iseg)] = v;
+        return v;
+
+    def n_segments(self):
+        return len(self.fSegment);
+
+#------------------------------------------------------------------------------
+# number of attempts per segment FCL file, used to count attempts across chained recovery jobs
+#------------------------------------------------------------------------------
+    def attempts(self):
+        res = {}
+        for v in self.fSegment.values():
+            if (v.get('fcl')): res[v['fcl']] = v.get('attempt',1)
+        return res;
+
+#------------------------------------------------------------------------------
+# write to a temp file first, so an interrupted check doesn't corrupt the cache
+#------------------------------------------------------------------------------
+    def write(self):
+        dirname = os.path.dirname(self.fFn)
+        if (dirname and (not os.path.exists(dirname))): os.makedirs(dirname,exist_ok=True)
+
+        with self.fLock:
+            data = json.dumps(self.fSegment)
+
+        fn_new = self.fFn+'.tmp'
+        f      = open(fn_new,'w')
+        f.write(data)
+        f.close()
+        os.replace(fn_new,self.fFn);
+
+        return 0;
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+#------------------------------------------------------------------------------
+# segment verdicts for the tools processing the output of a grid job (copy_log_files.py,
+# rename_art_files.py, movejson_file.py)
+#
+# verdicts are read from the cache written by check_completed_job.py, tmp/$project/segment_status/$grid_id .
+# A cached verdict is used if the log file it has been computed from didn't change - the size and the mtime
+# of the log are taken from the outstage manifest, so checking a cached verdict costs nothing.
+# For a successful segment, the sizes of its output files should not have changed either.
+# Otherwise the segment is checked the same way check_completed_job.py does it, and the verdict is cached
+#------------------------------------------------------------------------------
+
+import os, threading, concurrent.futures
+
+import segment_status
+
+#------------------------------------------------------------------------------
+class SegmentVerdicts:
+    def __init__(self, project, grid_id, manifest, use_running_dir = 1):
+        self.fProject       = project
+        self.fGridID        = str(grid_id)
+        self.fManifest      = manifest
+        self.fUseRunningDir = use_running_dir
+        self.fStatus        = segment_status.SegmentStatus('tmp/'+project+'/segment_status/'+self.fGridID)
+        self.fChecker       = None            # created on the first cache miss
+        self.fLock          = threading.Lock()
+        self.fNCached       = 0
+        self.fNComputed     = 0
+
+#------------------------------------------------------------------------------
+# the cached verdict, if its log file is still the same
+#------------------------------------------------------------------------------
+    def cached_verdict(self,key):
+        v = self.fStatus.verdict(int(key.split('/')[-1]))
+        if ((v == None) or (v['log'] == None)): return None
+
+        entries = self.fManifest.segment_entries(key)
+        if ((v['status'] == segment_status.kSegmentOk) and
+            (not segment_status.same_outputs(v,{name:size for name, size, mtime in entries}))): return None
+
+        for name, size, mtime in entries:
+            if (name == os.path.basename(v['log'])):
+                if ((size == v['size']) and (mtime == v['mtime'])): return v
+                break
+        return None
+
+#------------------------------------------------------------------------------
+# check_completed_job.Tool initialized for this grid job, it shares the manifest and the verdict cache
+#------------------------------------------------------------------------------
+    def checker(self):
+        if (self.fChecker == None):
+            import check_completed_job
+
+            c                = check_completed_job.Tool()
+            c.fProject       = self.fProject
+            c.fUseRunningDir = self.fUseRunningDir
+            c.init(self.fGridID)
+            c.fSegmentStatus = self.fStatus
+            c.fManifest      = self.fManifest
+            self.fChecker    = c
+        return self.fChecker;
+
+#------------------------------------------------------------------------------
+# verdict of the segment with the outstage directory 'key' ('00/00012')
+#------------------------------------------------------------------------------
+    def verdict(self,key):
+        v = self.cached_verdict(key)
+        if (v):
+            with self.fLock:
+                self.fNCached += 1
+            return v
+
+        with self.fLock:
+            c = self.checker()
+            self.fNComputed += 1
+
+        i = int(key.split('/')[-1])
+        return c.check_segment(i,self.fManifest.segment_dir(key),c.fJob);
+
+#------------------------------------------------------------------------------
+# returns 0 if the segment completed successfully, 1 otherwise
+#------------------------------------------------------------------------------
+    def check(self,key):
+        v = self.verdict(key)
+        if (v['status'] == segment_status.kSegmentOk): return 0
+        return 1;
+
+#------------------------------------------------------------------------------
+# same for a list of segments, the cache misses are checked in parallel
+# returns a dictionary key -> 0/1
+#------------------------------------------------------------------------------
+    def check_segments(self,keys,nthreads=8):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,nthreads)) as pool:
+            return dict(zip(keys,pool.map(self.check,keys)));
+
+#------------------------------------------------------------------------------
+# save the verdicts computed on the cache misses
+#------------------------------------------------------------------------------
+    def write(self):
+        if (self.fNComputed > 0): self.fStatus.write()
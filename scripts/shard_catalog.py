@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# split a local catalog into filesets
+#
+# call: grim/scripts/shard_catalog.py --project=su2020 --family=bpip0b0 --defname=sim.mu2e.bpip0b0s11r0000.su2020.art
+#                                     [--nfiles=1000 | --size=2TB | --events=1000000] [--first-fileset=0] [--doit=0]
+#
+# the target is the max number of files, total size or total number of events per fileset.
+# The files are distributed between the filesets with a greedy bin packing, so the filesets come out
+# balanced. The number of filesets starts from total/target and is increased until none of the filesets
+# exceeds the target - unless a single file does.
+# Size and number of events come from the catalog metadata, see dataset_catalog.py
+#
+# writes $project/datasets/$family/catalog/$defname.files.$fileset (and .meta) for each fileset
+# and prints the lines to be added to init_project.py
+# --doit=0 : only print what would be done
+#------------------------------------------------------------------------------
+
+import sys, getopt, os, time, math
+
+import dataset_catalog
+
+#------------------------------------------------------------------------------
+# bin packing doesn't guarantee that total/target filesets are enough, add filesets
+# until the heaviest one fits. A file heavier than the target gets a fileset of its own.
+# There are never more filesets than files, so none of them is empty
+#------------------------------------------------------------------------------
+def plan_shards(entries,weight,target):
+    total   = sum([weight(e) for e in entries])
+    nshards = max(1,min(len(entries),int(math.ceil(total/float(target)))))
+    limit   = max([target]+[weight(e) for e in entries])
+
+    while (True):
+        shards  = dataset_catalog.shard(entries,weight,nshards)
+        heavy   = max([sum([weight(e) for e in s]) for s in shards])
+        if ((heavy <= limit) or (nshards >= len(entries))): break
+        nshards = nshards+1
+
+    return shards;
+
+#------------------------------------------------------------------------------
+class ShardCatalog:
+
+    def __init__(self):
+        self.fProject      = None
+        self.fFamilyID     = None
+        self.fDefName      = None
+        self.fNFiles       = None
+        self.fSize         = None      # in bytes
+        self.fNEvents      = None
+        self.fFirstFileset = 0
+        self.fDoit         = 1
+        self.fVerbose      = 0
+
+# ---------------------------------------------------------------------
+    def Print(self,Name,level,Message):
+        if(level>self.fVerbose): return 0;
+        now     = time.strftime('%Y/%m/%d %H:%M:%S',time.localtime(time.time()))
+        message = now+' [ ShardCatalog::'+Name+' ] '+Message
+        print(message)
+
+#------------------------------------------------------------------------------
+    def ParseParameters(self):
+        name = 'ParseParameters'
+
+        self.Print(name,2,'Starting')
+        self.Print(name,2, '%s' % sys.argv)
+
+        try:
+            optlist, args = getopt.getopt(sys.argv[1:], '',
+                                          ['project=', 'family=', 'defname=', 'nfiles=', 'size=', 'events=',
+                                           'first-fileset=', 'doit=', 'verbose='] )
+
+        except getopt.GetoptError:
+            self.Print(name,0,'%s' % sys.argv)
+            self.Print(name,0,'Errors arguments did not parse')
+            return 110
+
+        for key, val in optlist:
+
+            if key == '--project':
+                self.fProject = val
+            elif key == '--family':
+                self.fFamilyID = val
+            elif key == '--defname':
+                self.fDefName = val
+            elif key == '--nfiles':
+                self.fNFiles = int(val)
+            elif key == '--size':
+                self.fSize = dataset_catalog.size_bytes(val)
+            elif key == '--events':
+                self.fNEvents = int(val)
+            elif key == '--first-fileset':
+                self.fFirstFileset = int(val)
+            elif key == '--doit':
+                self.fDoit = int(val)
+            elif key == '--verbose':
+                self.fVerbose = int(val)
+
+        if ((self.fProject == None) or (self.fFamilyID == None) or (self.fDefName == None)):
+            self.Print(name,0,'ERROR: --project, --family and --defname need to be defined')
+            return 111
+
+        if (('--size' in [key for key, val in optlist]) and (self.fSize == None)):
+            self.Print(name,0,'ERROR: can\'t parse --size, examples: --size=2TB, --size=500GB')
+            return 113
+
+        if ([self.fNFiles,self.fSize,self.fNEvents].count(None) != 2):
+            self.Print(name,0,'ERROR: exactly one of --nfiles, --size and --events needs to be defined')
+            return 112
+
+        if (len([x for x in [self.fNFiles,self.fSize,self.fNEvents] if ((x != None) and (x <= 0))]) > 0):
+            self.Print(name,0,'ERROR: --nfiles, --size and --events should be positive')
+            return 114
+
+        self.Print(name,1,'Done')
+        return 0
+
+#------------------------------------------------------------------------------
+    def shard_catalog(self):
+        name = 'shard_catalog'
+
+        catalog_dir = self.fProject+'/datasets/'+self.fFamilyID+'/catalog'
+        catalog_fn  = catalog_dir+'/'+self.fDefName+'.files'
+
+        if (not os.path.exists(catalog_fn) and not os.path.exists(dataset_catalog.meta_name(catalog_fn))):
+            self.Print(name,0,'ERROR: catalog %s doesn\'t exist'%catalog_fn)
+            return 1
+
+        entries = dataset_catalog.load(catalog_fn)
+        #------------------------------------------------------------------------------
+        # weight of a file and the target weight of a fileset
+        #------------------------------------------------------------------------------
+        if   (self.fNFiles != None): weight, target, what = (lambda e: 1        ), self.fNFiles , 'nfiles'
+        elif (self.fSize   != None): weight, target, what = (lambda e: e.size   ), self.fSize   , 'size'
+        else                       : weight, target, what = (lambda e: e.nevents), self.fNEvents, 'nevents'
+
+        if (self.fNFiles == None):
+            unknown = [e for e in entries if weight(e) == None]
+            if (len(unknown) > 0):
+                self.Print(name,0,'ERROR: %s unknown for %i files, recreate the catalog with list_pnfs_files.py'%
+                           (what,len(unknown)))
+                return 2
+
+        shards  = plan_shards(entries,weight,target)
+        nshards = len(shards)
+
+        if (max([target]+[weight(e) for e in entries]) > target):
+            self.Print(name,0,'WARNING: %i files have %s above the target, their filesets exceed it'%
+                       (len([e for e in entries if weight(e) > target]),what))
+        #------------------------------------------------------------------------------
+        # write filesets and print a summary
+        #------------------------------------------------------------------------------
+        print('catalog: %s N(files): %i size: %.3f GB N(events): %i N(filesets): %i'%
+              (catalog_fn,len(entries),dataset_catalog.total_size(entries)/1.e9,
+               dataset_catalog.total_events(entries),nshards))
+        print('-------------------------------------------------------------------------')
+        print('fileset  N(files)   size(GB)   N(events)  first subrun  last subrun')
+        print('-------------------------------------------------------------------------')
+
+        filesets = []
+        for i, s in enumerate(shards):
+            fileset = '%03i'%(self.fFirstFileset+i)
+            filesets.append(fileset)
+
+            subruns = [e.first_subrun for e in s if e.first_subrun != None]
+            first   = '%i'%min(subruns) if subruns else '-'
+            last    = '%i'%max(subruns) if subruns else '-'
+            print('%-7s %9i %10.3f %11i %13s %12s'%(fileset,len(s),dataset_catalog.total_size(s)/1.e9,
+                                                    dataset_catalog.total_events(s),first,last))
+
+            if (self.fDoit): dataset_catalog.write(catalog_fn+'.'+fileset,s)
+        #------------------------------------------------------------------------------
+        # the dataset ID is the third field of the dataset name, as in local_classes.Dataset
+        #------------------------------------------------------------------------------
+        dsid = self.fDefName.split('.')[2]
+        print('-------------------------------------------------------------------------')
+        print('# add to %s/datasets/%s/init_project.py , after the dataset %s is defined:'%
+              (self.fProject,self.fFamilyID,dsid))
+        print('        ds = self.fDataset[\'%s\']'%dsid)
+        for fileset in filesets:
+            print('        ds.add_fileset(\'%s\',\'%s.files.%s\')'%(fileset,self.fDefName,fileset))
+        print('# each fileset is processed by \'gen_fcl.py ... --fileset=NNN\'')
+
+        return 0
+
+#------------------------------------------------------------------------------
+# main program
+#------------------------------------------------------------------------------
+if (__name__ == '__main__'):
+
+    x = ShardCatalog()
+    rc = x.ParseParameters()
+    if (rc == 0): rc = x.shard_catalog()
+
+    sys.exit(rc);
@@ -22,6 +22,8 @@ import subprocess, shutil, datetime
 import sys, string, getopt, glob, os, time, re, array
 import json
 
+import fcl_tarball
+
 #------------------------------------------------------------------------------
 class Tool:
 
@@ -186,15 +188,22 @@ class Tool:
 
         fcl_tb_bn   += '.fcl.tbz';
 
-        fcl_tarball  = self.fFclTarballDir+'/'+self.fProject+'/'+fcl_tb_bn;
+        fcl_tarball_fn = self.fFclTarballDir+'/'+self.fProject+'/'+fcl_tb_bn;
 
-        # 
-        cmd          = 'tar -tjf '+fcl_tarball+' | wc -l'
+        #------------------------------------------------------------------------------
+        # the number of segments comes from the tarball manifest written by gen_fcl.py,
+        # the tarball is listed only if there is no manifest
+        #------------------------------------------------------------------------------
+        manifest     = fcl_tarball.read_manifest(fcl_tarball_fn)
+        if (manifest):
+            nsegments = manifest['nsegments']
+        else:
+            cmd          = 'tar -tjf '+fcl_tarball_fn+' | wc -l'
 
-        self.Print(name,1,'executing :'+cmd)
+            self.Print(name,1,'no manifest, executing :'+cmd)
 
-        p            = subprocess.run(cmd,shell=True,capture_output=True,universal_newlines=True)
-        nsegments    = int(p.stdout.strip())
+            p            = subprocess.run(cmd,shell=True,capture_output=True,universal_newlines=True)
+            nsegments    = int(p.stdout.strip())
 
         self.Print(name,1,'nsegments: %i'%nsegments)
 
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# recommend fMaxMemory, fRequestedTime and fNEventsPerSegment of a job based on the resource usage
+# of its past grid jobs (see harvest_logs.py and 'check_completed_job.py --harvest=1')
+#
+# call: grim/scripts/tune_job.py --project=su2020 --family=cele0s31 --stage=s3 --job=sim [--dsid=cele0s31b0]
+#                                [--percentile=95] [--margin=0.2] [--target-walltime=8h]
+#
+# --percentile     : percentile of the per-segment distributions the recommendation is based upon
+# --margin         : safety margin added on top of the percentile, 0.2 = 20%
+# --target-walltime: the number of events per segment is recommended such that a slow segment
+#                    (running at the (100-percentile) percentile of the event rate) takes that long.
+#                    By default, the configured wall time of the latest grid job, less the margin
+#------------------------------------------------------------------------------
+
+import sys, getopt, os, time, math, json
+
+import segment_status, resource_stats
+
+#------------------------------------------------------------------------------
+class TuneJob:
+
+    def __init__(self):
+        self.fProject        = None
+        self.fFamilyID       = None
+        self.fDsid           = None
+        self.fStageName      = None
+        self.fJType          = None
+        self.fPercentile     = 95
+        self.fMargin         = 0.2
+        self.fTargetWalltime = None      # in seconds
+        self.fVerbose        = 0
+
+# ---------------------------------------------------------------------
+    def Print(self,Name,level,Message):
+        if(level>self.fVerbose): return 0;
+        now     = time.strftime('%Y/%m/%d %H:%M:%S',time.localtime(time.time()))
+        message = now+' [ TuneJob::'+Name+' ] '+Message
+        print(message)
+
+#------------------------------------------------------------------------------
+    def ParseParameters(self):
+        name = 'ParseParameters'
+
+        self.Print(name,2,'Starting')
+        self.Print(name,2, '%s' % sys.argv)
+
+        try:
+            optlist, args = getopt.getopt(sys.argv[1:], '',
+                                          ['project=', 'family=', 'dsid=', 'stage=', 'job=', 'percentile=',
+                                           'margin=', 'target-walltime=', 'verbose='] )
+
+        except getopt.GetoptError:
+            self.Print(name,0,'%s' % sys.argv)
+            self.Print(name,0,'Errors arguments did not parse')
+            return 110
+
+        for key, val in optlist:
+
+            if key == '--project':
+                self.fProject = val
+            elif key == '--family':
+                self.fFamilyID = val
+            elif key == '--dsid':
+                self.fDsid = val
+            elif key == '--stage':
+                self.fStageName = val
+            elif key == '--job':
+                self.fJType = val
+            elif key == '--percentile':
+                self.fPercentile = float(val)
+            elif key == '--margin':
+                self.fMargin = float(val)
+            elif key == '--target-walltime':
+                self.fTargetWalltime = resource_stats.time_sec(val)
+            elif key == '--verbose':
+                self.fVerbose = int(val)
+
+        self.Print(name,1,'Done')
+        return 0
+
+#------------------------------------------------------------------------------
+# status file of the grid job, either still in grid_job_status or already in completed_jobs
+#------------------------------------------------------------------------------
+    def max_held(self,grid_id):
+        for d in ['grid_job_status','completed_jobs']:
+            fn = 'tmp/'+self.fProject+'/'+d+'/'+grid_id
+            if (os.path.exists(fn)):
+                return json.loads(open(fn).read()).get('max_held',0)
+        return 0;
+
+#------------------------------------------------------------------------------
+# what the settings of a grid job cost:
+# - segments which used more memory or time than requested (HTCondor holds such segments)
+# - segments killed for exceeding memory or wall time, according to the failure classifier
+# - slot-hours spent by the failed segments
+#------------------------------------------------------------------------------
+    def print_cost(self,tables):
+        print('------------------------------------------------------------------------------------------')
+        print('%-10s %-8s %-6s %6s %6s %8s %8s %8s %8s %10s'%('grid_id','mem','time','N(seg)','N(ok)',
+                                                              'N(>mem)','N(>time)','N(kill)','N(held)','wasted[h]'))
+        print('------------------------------------------------------------------------------------------')
+        total = 0
+        for header, columns in tables:
+            grid_id  = header['grid_id']
+            max_mem  = resource_stats.memory_mb(header.get('max_memory'))
+            max_time = resource_stats.time_sec(header.get('requested_time'))
+
+            nok     = 0
+            nmem    = 0
+            ntime   = 0
+            wasted  = 0
+            for i in range(0,header['nrows']):
+                rss  = columns['rss' ][i]
+                wall = columns['wall'][i]
+                if (columns['ok'][i] == 1)                                  : nok   += 1
+                elif (not math.isnan(wall))                                 : wasted += wall
+                if (max_mem  and (not math.isnan(rss )) and (rss  > max_mem )): nmem  += 1
+                if (max_time and (not math.isnan(wall)) and (wall > max_time)): ntime += 1
+
+            #------------------------------------------------------------------------------
+            # killed segments don't always report their time, assume they ran for the requested time
+            #------------------------------------------------------------------------------
+            nkill     = 0
+            harvested = set(columns['segment'])
+            ss        = segment_status.SegmentStatus('tmp/'+self.fProject+'/segment_status/'+grid_id)
+            for key, v in ss.fSegment.items():
+                if (v.get('cause') not in ['memory_exceeded','walltime']): continue
+                nkill += 1
+                if (max_time and (int(key) not in harvested)): wasted += max_time
+
+            total += wasted
+            print('%-10s %-8s %-6s %6i %6i %8i %8i %8i %8i %10.1f'%(grid_id,header.get('max_memory'),
+                                                                  header.get('requested_time'),header['nrows'],
+                                                                  nok,nmem,ntime,nkill,self.max_held(grid_id),
+                                                                  wasted/3600.))
+        print('------------------------------------------------------------------------------------------')
+        print('wasted slot-hours, total: %.1f'%(total/3600.))
+
+    def print_distribution(self,title,v,scale,unit):
+        p = self.fPercentile
+        print('%-22s N=%6i p50=%10.2f p%02i=%10.2f max=%10.2f %s'%(title,len(v),
+                                                                    resource_stats.percentile(v,50)/scale,p,
+                                                                    resource_stats.percentile(v,p)/scale,
+                                                                    max(v)/scale,unit))
+
+#------------------------------------------------------------------------------
+    def tune(self):
+        name = 'tune'
+
+        tables = resource_stats.load_tables(self.fProject,self.fFamilyID,self.fStageName,self.fJType,self.fDsid)
+        if (len(tables) == 0):
+            self.Print(name,0,'ERROR: no harvested grid jobs of %s:%s:%s, run harvest_logs.py first'%
+                       (self.fFamilyID,self.fStageName,self.fJType))
+            return -1
+
+        self.print_cost(tables)
+
+        rss   = resource_stats.values(tables,'rss')
+        wall  = resource_stats.values(tables,'wall')
+        rates = resource_stats.event_rates(tables)
+
+        if (len(wall) == 0):
+            self.Print(name,0,'ERROR: no successful segments with the resource usage reported')
+            return -1
+
+        p      = self.fPercentile
+        margin = 1+self.fMargin
+
+        print('')
+        if (len(rss  ) > 0): self.print_distribution('peak RSS'       ,rss  ,1   ,'MB')
+        self.print_distribution('wall time'                           ,wall ,3600,'h')
+        if (len(rates) > 0): self.print_distribution('rate'           ,rates,1   ,'events/sec')
+        print('')
+        #------------------------------------------------------------------------------
+        # settings of the latest grid job are the current ones
+        #------------------------------------------------------------------------------
+        current = tables[-1][0]
+
+        if (len(rss) > 0):
+            mem = resource_stats.round_up(resource_stats.percentile(rss,p)*margin,100)
+            print('fMaxMemory         : %-10s -> %s'%(current.get('max_memory'),resource_stats.format_memory(mem)))
+
+        nevents     = current.get('nevents_per_segment')
+        wall_target = resource_stats.percentile(wall,p)
+        #------------------------------------------------------------------------------
+        # for a given wall time, the number of events is defined by slow segments.
+        # Without --target-walltime, the segments should fit into the configured wall time
+        #------------------------------------------------------------------------------
+        target = self.fTargetWalltime
+        if (target == None):
+            max_time = resource_stats.time_sec(current.get('requested_time'))
+            if (max_time): target = max_time/margin
+
+        if (target and (len(rates) > 0)):
+            n = resource_stats.plan_nevents(tables,target,p)
+            print('fNEventsPerSegment : %-10s -> %-10i (a slow segment takes %s)'%(current.get('nevents_per_segment'),n,
+                                                                                   resource_stats.format_time(target)))
+            if (self.fTargetWalltime):
+                nevents     = n
+                wall_target = self.fTargetWalltime
+
+        print('fRequestedTime     : %-10s -> %-10s (with %s events per segment)'%(current.get('requested_time'),
+                                                                                  resource_stats.format_time(wall_target*margin),
+                                                                                  nevents))
+        return 0
+
+#------------------------------------------------------------------------------
+# main program
+#------------------------------------------------------------------------------
+if (__name__ == '__main__'):
+
+    x = TuneJob()
+    x.ParseParameters()
+
+    rc = x.tune()
+
+    sys.exit(rc);
@@ -7,6 +7,8 @@
 import configparser, subprocess, shutil, json
 import sys, string, getopt, glob, os, time, re, array
 
+import outstage_manifest
+
 #------------------------------------------------------------------------------
 class UploadGridOutput:
 
@@ -178,6 +180,10 @@ class UploadGridOutput:
         ns = len(job.fOutputStream)
 
         self.Print(name,1,'ns=%i'%ns)
+        #------------------------------------------------------------------------------
+        # the output directory is listed once for all streams
+        # subdirectories like 00148.915da673 are not in the manifest
+        manifest = outstage_manifest.OutstageManifest(self.fProject,self.fGridJobID,topdir)
 
         for i in range(0,ns):
             odsid       = job.fOutputDsID[i];
@@ -195,26 +201,12 @@ class UploadGridOutput:
                 os.remove(catalog_fn);
 
             list_of_files = []
-            list_of_dirs = glob.glob(topdir+'/*')
-
-            self.Print(name,1,'list_of_dirs:%s'%format(list_of_dirs));
-
-            for sd1 in list_of_dirs:
-
-                list_d1 = glob.glob(sd1+'/*')
-
-                for sd2 in list_d1 :
-                    self.Print(name,1,'sd2=%s'%sd2);
-                    #------------------------------------------------------------------------------
-                    # skip subdirectories like 00148.915da673
-                    dbn = os.path.basename(sd2);
-                    if (len(dbn.split('.')) == 1) :
-                        for fn in glob.glob(sd2+'/*.art') : 
-                            base = os.path.basename(fn);
-                            od   = base.split('.')[2]
-                            self.Print(name,1,'base, od, odsid: %s %s %s'%(base,od,odsid))
-                            if (od == odsid) : 
-                                list_of_files.append(fn)
+            for fn, size, mtime, segment in manifest.all_files('*.art'):
+                base = os.path.basename(fn);
+                od   = base.split('.')[2]
+                self.Print(name,1,'base, od, odsid: %s %s %s'%(base,od,odsid))
+                if (od == odsid) : 
+                    list_of_files.append(fn)
             #------------------------------------------------------------------------------
             # catalog file for a given stream
 
@@ -0,0 +1,61 @@
+#------------------------------------------------------------------------------
+# catalog_index.CatalogIndex: binary search over the (run, subrun) records, compared with
+# a linear scan of the same entries
+#
+# call: python -m pytest tests
+#------------------------------------------------------------------------------
+
+import os, sys, bisect, random
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+
+import pytest
+
+import catalog_index, dataset_catalog
+
+def entry(run,subrun):
+    path = '/pnfs/mu2e/sim.grim.fam0s11b0.test.%06i_%08i.art'%(run,subrun) if (subrun != None) else '/pnfs/mu2e/x.art'
+    return dataset_catalog.Entry(path,100,10,run,subrun,run,subrun,None)
+
+@pytest.fixture
+def catalog(tmp_path):
+    random.seed(1)
+    entries = [entry(run,subrun) for run in [1000,1001,1005] for subrun in random.sample(range(0,500),60)]
+    entries.append(entry(None,None))                      # unknown subrun, not indexed
+    random.shuffle(entries)
+
+    fn = str(tmp_path/'sim.grim.fam0s11b0.test.art.files')
+    catalog_index.write_index(fn,entries)
+    index = catalog_index.CatalogIndex(fn)
+    yield index, [e for e in entries if e.first_subrun != None]
+    index.close()
+
+def test_lower_bound(catalog):
+    index, entries = catalog
+    keys = sorted([(e.first_run,e.first_subrun) for e in entries])
+
+    assert len(index) == len(keys)
+    assert [index.key(i) for i in range(0,len(index))] == keys
+    for run in [0,999,1000,1001,1002,1005,1006]:
+        for subrun in [0,1,100,250,499,500,1000]:
+            assert index.lower_bound(run,subrun) == bisect.bisect_left(keys,(run,subrun))
+
+def test_paths_and_subrun_range(catalog):
+    index, entries = catalog
+
+    for first, last in [(0,499),(100,199),(250,250),(600,700),(10,5)]:
+        ref = sorted([e.path for e in entries if first <= e.first_subrun <= last])
+        assert index.subrun_range(first,last) == ref
+
+        ref = sorted([e.path for e in entries if (e.first_run == 1001) and (first <= e.first_subrun <= last)])
+        assert index.paths(1001,first,last) == ref
+
+    e = entries[0]
+    assert index.paths(e.first_run,e.first_subrun) == [e.path]
+    assert index.paths(1003,0,499) == []
+
+def test_not_an_index(tmp_path):
+    fn = str(tmp_path/'x.files')
+    open(catalog_index.index_name(fn),'wb').write(b'NOTANIDX'+bytes(8))
+    with pytest.raises(ValueError):
+        catalog_index.CatalogIndex(fn)
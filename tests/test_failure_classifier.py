@@ -0,0 +1,84 @@
+#------------------------------------------------------------------------------
+# failure_classifier.FailureClassifier with the default signatures
+# a mu2egrid log always contains the expanded FCL and the environment, those should not be
+# mistaken for the error output
+#
+# call: python -m pytest tests
+#------------------------------------------------------------------------------
+
+import os, sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+
+import pytest
+
+import failure_classifier
+
+FclDump = '''
+services: {
+   GeometryService: {
+      inputFile: "Mu2eG4/geom/geom_common.txt"
+      simulatedDetector: { tool_type: "Mu2e" }
+   }
+   scheduler: { defaultExceptions: false }
+}
+physics.producers.g4run.debug.diagLevel: 0
+services.GeometryService.bFieldFile: "Offline/Mu2eG4/geom/bfgeom_no_tsu_ps_v01.txt"
+'''
+
+Environment = '''
+IFDH_CP_MAXRETRIES=2
+ifdh: IFDH_DEBUG=0, error handling: retry
+ifdh cp retrying after a transfer error
+'''
+
+G4Warning = '''
+-------- WWWW ------- G4Exception-START -------- WWWW -------
+*** G4Exception : GeomVol1002
+      issued by : G4PVPlacement::CheckOverlaps()
+Overlap with volume already placed !
+*** This is just a warning message. ***
+-------- WWWW -------- G4Exception-END --------- WWWW -------
+'''
+
+G4Error = '''
+-------- EEEE ------- G4Exception-START -------- EEEE -------
+*** G4Exception : GeomNav0003
+      issued by : G4Navigator::ComputeStep()
+Stuck Track: potential geometry or navigation problem.
+*** Fatal Exception *** core dump ***
+-------- EEEE -------- G4Exception-END --------- EEEE -------
+'''
+
+@pytest.fixture
+def classifier():
+    return failure_classifier.FailureClassifier();
+
+#------------------------------------------------------------------------------
+# an evicted job: no art return code, only the FCL dump, the environment and G4 warnings
+#------------------------------------------------------------------------------
+def test_fcl_dump_and_warnings_are_unknown(classifier):
+    cause = classifier.classify(Environment+FclDump+G4Warning+'Begin processing the 1st record.\n')
+
+    assert cause == failure_classifier.kUnknown
+    assert classifier.failure_class(cause) == failure_classifier.kUnknown
+
+@pytest.mark.parametrize('error, cause', [
+    ('---- GeometryService BEGIN\n  cannot open file geom.txt\n---- GeometryService END\n', 'geometry_error'),
+    (G4Error                                                                               , 'geometry_error'),
+    ('ifdh cp -D /pnfs/mu2e/x.art . failed, exit status 1\n'                               , 'ifdh_error'    ),
+    ('Error in ifdh cp\n'                                                                  , 'ifdh_error'    ),
+    ('---- FileOpenError BEGIN\n  open of x.art: No such file or directory\n'              , 'missing_input' ),
+    ('cp: cannot stat x.fcl: No such file or directory\n'                                  , 'file_not_found'),
+    ('std::bad_alloc\n'+G4Error                                                            , 'memory_exceeded'),
+])
+def test_error_output(classifier,error,cause):
+    assert classifier.classify(Environment+FclDump+G4Warning+error) == cause
+
+def test_user_signature_takes_precedence(classifier,tmp_path):
+    fn = str(tmp_path/'failure_signatures')
+    open(fn,'w').write('# name class regex\ngeometry_error  transient  Stuck Track\n')
+
+    c = failure_classifier.FailureClassifier(fn)
+    assert c.classify(FclDump+G4Error) == 'geometry_error'
+    assert c.failure_class('geometry_error') == failure_classifier.kTransient
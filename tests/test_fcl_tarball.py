@@ -0,0 +1,76 @@
+#------------------------------------------------------------------------------
+# fcl_tarball: in-memory FCL tarballs and their manifests
+#
+# call: python -m pytest tests
+#------------------------------------------------------------------------------
+
+import os, sys, io, bz2, hashlib, tarfile, concurrent.futures
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+
+import pytest
+
+import fcl_tarball
+
+def fcl(i):
+    return ('#include "Production/JobConfig/primary/CeEndpoint.fcl"\n'+
+            'source.firstSubRun : %i\n'%i+
+            'outputs.PrimaryOutput.fileName : "dts.owner.cele0s11b0.version.001000_%08i.art"\n'%i).encode()
+
+def members(n):
+    return [('cnf.owner.cele0s11b0.version.%05i_001000_%08i.fcl'%(i,i),fcl(i)) for i in range(n)]
+
+#------------------------------------------------------------------------------
+# the tarball is written to all locations, each with its manifest, and reads back unchanged
+#------------------------------------------------------------------------------
+def test_write_read_round_trip(tmp_path):
+    tarballs = [str(tmp_path/'a.fcl.tbz'), str(tmp_path/'b.fcl.tbz')]
+    m        = fcl_tarball.write_tarball(tarballs,members(5))
+
+    assert m['nsegments'] == 5
+    assert m['fcl'] == [name for name, data in members(5)]
+    assert m['outputs'][m['fcl'][3]] == ['dts.owner.cele0s11b0.version.001000_00000003.art']
+
+    for fn in tarballs:
+        assert fcl_tarball.read_tarball(fn) == members(5)
+        assert fcl_tarball.read_manifest(fn) == m
+        assert os.path.getsize(fn) == m['size']
+
+#------------------------------------------------------------------------------
+# a manifest which doesn't describe the tarball next to it is ignored
+#------------------------------------------------------------------------------
+def test_stale_manifest(tmp_path):
+    tarball = str(tmp_path/'a.fcl.tbz')
+    fcl_tarball.write_tarball([tarball],members(3))
+    fcl_tarball.write_file(tarball,fcl_tarball.make_tarball_bytes(members(4)))
+
+    assert fcl_tarball.read_manifest(tarball) == None
+    assert len(fcl_tarball.read_tarball(tarball)) == 4
+
+    fcl_tarball.remove_tarball(tarball)
+    assert os.listdir(str(tmp_path)) == []
+
+#------------------------------------------------------------------------------
+# parallel compression: the tar stream cut into small pieces gives several bzip2 streams,
+# their concatenation reads back as one tarball with the same members, in order
+#------------------------------------------------------------------------------
+@pytest.mark.parametrize('nworkers', [1,2])
+def test_concatenated_bz2_streams(nworkers):
+    buf  = io.BytesIO()
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=nworkers) if (nworkers > 1) else None
+    try:
+        out = fcl_tarball.Bz2StreamWriter(buf,pool,nworkers,stream_size=4096)
+        tar = tarfile.open(fileobj=out,mode='w')
+        for name, data in members(40): fcl_tarball.add_member(tar,name,data,0)
+        tar.close()
+        out.close()
+    finally:
+        if (pool): pool.shutdown()
+
+    data = buf.getvalue()
+    assert data.count(b'BZh91AY&SY') > 5
+    assert (out.fSize, out.fSha256.hexdigest()) == (len(data),hashlib.sha256(data).hexdigest())
+    assert len(bz2.decompress(data)) == out.tell()
+
+    with tarfile.open(fileobj=io.BytesIO(data),mode='r:bz2') as tar:
+        assert [(ti.name,tar.extractfile(ti).read()) for ti in tar.getmembers()] == members(40)
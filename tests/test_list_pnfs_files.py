@@ -0,0 +1,46 @@
+#------------------------------------------------------------------------------
+# list_pnfs_files.bucket_files: the single pass over the outstage manifest puts each file
+# into the same catalog as the walk per output stream and format (list_pnfs_files.scan_files)
+#
+# call: python -m pytest tests
+#------------------------------------------------------------------------------
+
+import os, sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+
+import list_pnfs_files, outstage_manifest
+
+Streams = [('fam0s11b0','art'),('fam0s11b0','root'),('fam0s21b0','art'),('fam0s31b0','root')]
+
+def test_same_buckets_as_walk_per_stream(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('USER','grim')
+
+    topdir = str(tmp_path)+'/outstage/1001'
+    names  = ['grim.%05i.log',
+              'sim.grim.fam0s11b0.test.001000_%08i.art',
+              'sim.grim.fam0s11b0.test.001000_%08i.art.json',        # metadata, not a catalog entry
+              'nts.grim.fam0s11b0.test.001000_%08i.root',
+              'sim.grim.fam0s21b0.test.001000_%08i.art',
+              'sim.grim.fam0s21b0.test.001000_%08i.root',            # format not written for this stream
+              'sim.grim.fam0s99b0.test.001000_%08i.art',             # unknown dataset
+              'sim.grim.test.fam0s31b0_%08i.root',                   # odsid not the third field
+              'nts.grim.fam0s31b0.test.001000_%08i.root']
+    for i in range(0,5):
+        d = topdir+'/00/%05i'%i
+        os.makedirs(d)
+        for name in names: open(d+'/'+name%i,'w').write('x'*(i+1))
+    #------------------------------------------------------------------------------
+    # a leftover of a resubmission, skipped by both
+    #------------------------------------------------------------------------------
+    os.makedirs(topdir+'/00/00003.915da673')
+    open(topdir+'/00/00003.915da673/sim.grim.fam0s11b0.test.001000_00000003.art','w').write('x')
+
+    manifest = outstage_manifest.OutstageManifest('test','1001',topdir)
+    buckets  = list_pnfs_files.bucket_files(manifest.all_files(),Streams)
+    ref      = list_pnfs_files.scan_files(topdir,Streams)
+
+    assert [sorted(b) for b in buckets] == [sorted(b) for b in ref]
+    assert [len(b) for b in buckets] == [5,5,5,5]
+    assert (topdir+'/00/00002/nts.grim.fam0s11b0.test.001000_00000002.root',3) in buckets[1]
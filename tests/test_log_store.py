@@ -0,0 +1,82 @@
+#------------------------------------------------------------------------------
+# log_store: content-defined chunking of the logs and the deduplicated store round trip
+#
+# call: python -m pytest tests
+#------------------------------------------------------------------------------
+
+import os, sys, random
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+
+import log_store
+
+def fcl_dump():
+    random.seed(1)
+    return ''.join(['physics.producers.mod%04i.par%i : %i\n'%(i,i%7,random.randint(0,10**6)) for i in range(0,3000)])
+
+def log_text(iseg):
+    return ('segment %i started\n'%iseg+fcl_dump()+
+            ''.join(['Begin processing the %ith record. run: 1000 subRun: %i event: %i\n'%(i,iseg,i) for i in range(0,50)])+
+            'Art has completed and will exit with status 0.\n')
+
+def test_chunk_boundaries():
+    data = log_text(0).encode()+b'x'*(3*log_store.kMaxSize)+b'\nlast line without a newline'
+    cc   = log_store.chunks(data)
+
+    assert b''.join(cc) == data
+    assert max([len(c) for c in cc]) <= log_store.kMaxSize
+    assert min([len(c) for c in cc[:-1]]) >= log_store.kMinSize
+    #------------------------------------------------------------------------------
+    # a chunk ends at the end of a line, unless the line is too long
+    #------------------------------------------------------------------------------
+    for c in cc[:-1]:
+        assert c.endswith(b'\n') or (len(c) == log_store.kMaxSize)
+
+    assert log_store.chunks(b'') == []
+
+def test_modified_line_changes_few_chunks():
+    old = log_text(0).encode()
+    new = old.replace(b'mod1500.par2',b'mod1500.par2.modified')
+
+    a = log_store.chunks(old)
+    b = log_store.chunks(new)
+    assert len(set(b)-set(a)) <= 2
+    assert len(set(a)&set(b)) >= len(a)-2
+
+def test_store_round_trip_and_dedup(tmp_path):
+    store  = log_store.ChunkStore(str(tmp_path/'chunks'))
+    recipe = str(tmp_path/'1001.logs.dedup')
+    files  = []
+    for i in range(0,4):
+        fn = str(tmp_path/('grim.%05i.log'%i))
+        open(fn,'w').write(log_text(i))
+        st = os.stat(fn)
+        files.append(('00/%05i'%i,fn,st.st_size,st.st_mtime))
+
+    n, nbytes, nnew = log_store.add_files(store,recipe,files,nthreads=2)
+    assert (n, nbytes) == (4,sum([f[2] for f in files]))
+    #------------------------------------------------------------------------------
+    # the FCL dump is stored once
+    #------------------------------------------------------------------------------
+    assert nnew < 0.5*nbytes
+    assert log_store.add_files(store,recipe,files) == (0,0,0)
+    #------------------------------------------------------------------------------
+    # a new reader of the same store, including a partial index record left by an interrupted writer
+    #------------------------------------------------------------------------------
+    store.close()
+    open(store.fIdx,'ab').write(b'\0'*7)
+
+    store = log_store.ChunkStore(str(tmp_path/'chunks'))
+    for segment, fn, size, mtime in files:
+        assert log_store.read_member(store,recipe,segment) == open(fn,'rb').read()
+    assert log_store.read_member(store,recipe,'00/00099') == None
+    #------------------------------------------------------------------------------
+    # a changed log is stored again, the next writer removes the partial record
+    #------------------------------------------------------------------------------
+    open(files[1][1],'a').write('one more line\n')
+    st       = os.stat(files[1][1])
+    files[1] = (files[1][0],files[1][1],st.st_size,st.st_mtime+1)
+    assert log_store.add_files(store,recipe,files)[0] == 1
+    assert os.path.getsize(store.fIdx)%log_store.Record.size == 0
+    assert log_store.read_member(store,recipe,'00/00001') == open(files[1][1],'rb').read()
+    store.close()
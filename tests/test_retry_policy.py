@@ -0,0 +1,44 @@
+#------------------------------------------------------------------------------
+# retry_policy.RetryPolicy: what happens to a failed segment
+#
+# call: python -m pytest tests
+#------------------------------------------------------------------------------
+
+import os, sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+
+import retry_policy
+
+from retry_policy import kRetry, kQuarantine
+
+def test_default_policy():
+    p = retry_policy.RetryPolicy()
+
+    assert p.max_attempts() == 3
+    assert p.action('xrootd_error'   ,'transient'    ,1) == kRetry
+    assert p.action('memory_exceeded','deterministic',1) == kQuarantine
+    assert p.action('unknown'        ,'unknown'      ,2) == kRetry
+
+def test_max_attempts_counts_the_initial_job():
+    p = retry_policy.RetryPolicy()
+
+    assert p.action('xrootd_error','transient',2) == kRetry
+    assert p.action('xrootd_error','transient',3) == kQuarantine
+
+#------------------------------------------------------------------------------
+# keys defined by the job override the defaults, a cause name takes precedence over its class
+#------------------------------------------------------------------------------
+def test_job_policy():
+    p = retry_policy.RetryPolicy({'memory_exceeded':kRetry, 'unknown':kQuarantine, 'max_attempts':5})
+
+    assert p.max_attempts() == 5
+    assert p.action('memory_exceeded','deterministic',4) == kRetry
+    assert p.action('segfault'       ,'deterministic',1) == kQuarantine
+    assert p.action('xrootd_error'   ,'transient'    ,4) == kRetry
+    assert p.action('unknown'        ,'unknown'      ,1) == kQuarantine
+    assert p.action('memory_exceeded','deterministic',5) == kQuarantine
+
+def test_class_not_in_the_policy_is_retried():
+    p = retry_policy.RetryPolicy()
+    assert p.action('something_new','no_such_class',1) == kRetry
@@ -0,0 +1,105 @@
+#------------------------------------------------------------------------------
+# segment_verdict.SegmentVerdicts over a fake work area with a three-segment outstage tree:
+# segment 0 has a cached OK verdict, segment 1 completed but has no verdict yet, segment 2 failed
+#
+# call: python -m pytest tests
+#------------------------------------------------------------------------------
+
+import os, sys, json
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+
+import pytest
+
+import outstage_manifest, segment_status, segment_verdict
+
+InitProject = '''
+from local_classes import *
+class Project:
+    def __init__(self):
+        self.fProjectName = 'test'
+        self.fStage       = {}
+        self.fDataset     = {}
+        ds = Dataset('generator','fam0s00b0','local')
+        self.fDataset[ds.id()] = ds
+        s  = Stage('s1',self)
+        self.fStage['s1'] = s
+        job = s.new_job('sim',ds.id())
+        job.fDescription       = 'test.fam0s00b0.s1_sim'
+        job.fNEventsPerSegment = 100
+        job.fOutputStream      = ['out']
+        job.fOutputDsID        = ['fam0s11b0']
+        job.fOutputFnPattern   = ['sim.grim.fam0s11b0.test']
+        job.fOutputFormat      = ['art']
+    def dataset(self,id): return self.fDataset[id]
+'''
+
+def log_text(rc):
+    return ('Art has completed and will exit with status %i.\n'%rc)+('mu2egrid exit status %i\n'%rc)
+
+#------------------------------------------------------------------------------
+# returns the outstage directory of grid job 1001
+#------------------------------------------------------------------------------
+@pytest.fixture
+def area(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('USER','grim')
+
+    top = str(tmp_path)
+    open('.grid_config','w').write('test.grid_output_dir %s/pnfs\ntest.log_dir %s/logs\n'%(top,top))
+    os.makedirs('test/datasets/fam0s00')
+    open('test/datasets/fam0s00/init_project.py','w').write(InitProject)
+
+    os.makedirs('tmp/test/grid_job_status')
+    json.dump({'id':1001, 'project':'test', 'family_id':'fam0s00', 'idsid':'fam0s00b0', 'stage':'s1',
+               'job_name':'sim', 'fileset':None, 'recover':None, 'subm_time':'2026-01-01 10:00:00 CDT',
+               'segments':3, 'status':1},open('tmp/test/grid_job_status/1001','w'))
+
+    outstage = top+'/pnfs/grim/workflow/test.fam0s00b0.s1_sim/outstage/1001'
+    for i, rc in enumerate([0,0,1]):
+        dd = outstage+'/00/%05i'%i
+        os.makedirs(dd)
+        open(dd+'/grim.%05i.log'%i,'w').write(log_text(rc))
+        if (rc == 0): open(dd+'/sim.grim.fam0s11b0.test.001000_%08i.art'%i,'w').write('x'*100)
+    #------------------------------------------------------------------------------
+    # cached verdict of segment 0, as written by check_completed_job.py
+    #------------------------------------------------------------------------------
+    ss = segment_status.SegmentStatus('tmp/test/segment_status/1001')
+    v  = ss.set_verdict(0,segment_status.kSegmentOk,outstage+'/00/00000/grim.00000.log')
+    v['output_check'] = 1
+    v['files'       ] = {'sim.grim.fam0s11b0.test.001000_00000000.art':100}
+    ss.write()
+
+    return outstage
+
+def verdicts(outstage):
+    manifest = outstage_manifest.OutstageManifest('test','1001',outstage)
+    return segment_verdict.SegmentVerdicts('test','1001',manifest);
+
+def test_cache_hit_miss_and_failed_segment(area):
+    sv  = verdicts(area)
+    res = sv.check_segments(['00/00000','00/00001','00/00002'],nthreads=2)
+
+    assert res == {'00/00000':0, '00/00001':0, '00/00002':1}
+    assert (sv.fNCached, sv.fNComputed) == (1,2)
+
+    v = sv.fStatus.verdict(2)
+    assert v['status'] == segment_status.kSegmentFailed
+    assert 'art ERROR rc = 1' in v['error']
+    #------------------------------------------------------------------------------
+    # the computed verdicts are saved, next time all come from the cache: the failed segment
+    # keeps its verdict as long as its log doesn't change
+    #------------------------------------------------------------------------------
+    sv.write()
+    sv  = verdicts(area)
+    assert sv.check_segments(['00/00000','00/00001','00/00002']) == res
+    assert (sv.fNCached, sv.fNComputed) == (3,0)
+
+def test_changed_log_is_checked_again(area):
+    fn = area+'/00/00000/grim.00000.log'
+    open(fn,'a').write('one more line\n')
+
+    sv = verdicts(area)
+    assert sv.cached_verdict('00/00000') == None
+    assert sv.check('00/00000') == 0
+    assert (sv.fNCached, sv.fNComputed) == (0,1)
@@ -0,0 +1,48 @@
+#------------------------------------------------------------------------------
+# shard_catalog.plan_shards and dataset_catalog.shard: greedy bin packing of catalog entries
+# into filesets, with filesets added until the heaviest one fits the target
+#
+# call: python -m pytest tests
+#------------------------------------------------------------------------------
+
+import os, sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+
+import dataset_catalog, shard_catalog
+
+def entries(sizes):
+    return [dataset_catalog.Entry('sim.grim.fam0s11b0.test.001000_%08i.art'%i,size,100,1000,i,1000,i,None)
+            for i, size in enumerate(sizes)]
+
+def weight(e): return e.size
+
+def loads(shards): return sorted([sum([e.size for e in s]) for s in shards])
+
+def test_greedy_shards_are_balanced_and_sorted():
+    ee     = entries([7,1,5,3,4,2,6,8])
+    shards = dataset_catalog.shard(ee,weight,3)
+    #------------------------------------------------------------------------------
+    # heaviest first into the lightest shard: 8 | 7 | 6 ; 5->6 ; 4->7 ; 3->8 ; 2->11 ; 1->11
+    #------------------------------------------------------------------------------
+    assert loads(shards) == [11,12,13]
+    assert sorted([e.path for s in shards for e in s]) == sorted([e.path for e in ee])
+    for s in shards:
+        assert [e.first_subrun for e in s] == sorted([e.first_subrun for e in s])
+
+def test_filesets_added_until_the_heaviest_fits():
+    #------------------------------------------------------------------------------
+    # total/target = 18/10 -> 2 filesets, but three files of 6 can't make two filesets of <= 10
+    #------------------------------------------------------------------------------
+    shards = shard_catalog.plan_shards(entries([6,6,6]),weight,10)
+    assert loads(shards) == [6,6,6]
+
+    shards = shard_catalog.plan_shards(entries([5,5,4,3,2,1]),weight,10)
+    assert loads(shards) == [10,10]
+
+def test_file_above_target():
+    #------------------------------------------------------------------------------
+    # the heavy file makes a fileset of its own, no empty filesets even though total/target = 4 > N(files)
+    #------------------------------------------------------------------------------
+    shards = shard_catalog.plan_shards(entries([25,5,5]),weight,10)
+    assert loads(shards) == [5,5,25]